@@ -0,0 +1,51 @@
+#%%
+import sys
+import statistics
+import subprocess
+
+# each snippet runs in a fresh interpreter and prints its seconds, so nothing is cached between runs
+IMPORT_RAPTOR = """
+import sys, time
+tic = time.perf_counter()
+import sayori.raptor
+print(time.perf_counter() - tic, *[name for name in ("pandas", "pandera", "polars", "geopandas") if name in sys.modules])
+"""
+
+LOAD_PARQUET = """
+import time
+tic = time.perf_counter()
+from sayori.raptor import search_isochrones
+from sayori.registry import get_feed_path
+from sayori.models import Feed
+feed = Feed.from_feed_path(get_feed_path("{path_sayori_models}"))
+print(time.perf_counter() - tic)
+"""
+
+LOAD_NPZ = """
+import time
+tic = time.perf_counter()
+from sayori.raptor import search_isochrones
+from sayori.models import Feed
+feed = Feed.from_npz("{path_sayori_models}sayori_feed.npz")
+print(time.perf_counter() - tic)
+"""
+
+def run(snippet: str, repeat: int):
+    outputs = [subprocess.run([sys.executable, "-c", snippet], capture_output=True, text=True, check=True).stdout.split() for _ in range(repeat)]
+    return statistics.median(float(output[0]) for output in outputs), outputs[0][1:]
+
+if __name__ == "__main__":
+    path_sayori_models = "./demo/sayori_models/"
+    repeat = 5
+
+    # the compiled feed is saved once, e.g. when deploying
+    from sayori.registry import get_feed_path
+    from sayori.models import Feed
+    Feed.from_feed_path(get_feed_path(path_sayori_models)).to_npz(f"{path_sayori_models}sayori_feed.npz")
+
+    secs, modules = run(IMPORT_RAPTOR, repeat)
+    print(f"import sayori.raptor: {secs:.3f} secs, heavy modules imported: {modules or 'none'}")
+    secs, _ = run(LOAD_PARQUET.format(path_sayori_models=path_sayori_models), repeat)
+    print(f"import and Feed.from_feed_path: {secs:.3f} secs")
+    secs, _ = run(LOAD_NPZ.format(path_sayori_models=path_sayori_models), repeat)
+    print(f"import and Feed.from_npz: {secs:.3f} secs")
@@ -15,7 +15,8 @@ if __name__ == "__main__":
         "stop_times": f"{path_sayori_models}sayori_stop_times.parquet",
         "stops": f"{path_sayori_models}sayori_stops.parquet",
         "transfers": f"{path_sayori_models}sayori_transfers.parquet",
-        "calendar": f"{path_sayori_models}sayori_calendar.parquet"
+        "calendar": f"{path_sayori_models}sayori_calendar.parquet",
+        "frequencies": f"{path_sayori_models}sayori_frequencies.parquet"
     }
     feed_path = FeedPath.parse_obj(feed_path)
     feed = Feed.from_feed_path(feed_path)
@@ -0,0 +1,121 @@
+import os
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .models import Feed, FeedPath, RequestParameterAccessibility
+from .raptor import run_raptor
+
+ACCESSIBILITY_COLUMNS = ["origin", "threshold", "mean_opportunities", "min_opportunities", "max_opportunities"]
+
+# feed loaded once per worker process
+worker_feed: Optional[Feed] = None
+
+def init_worker(feed: Union[Feed, FeedPath]) -> None:
+    global worker_feed
+    worker_feed = Feed.from_feed_path(feed) if isinstance(feed, FeedPath) else feed
+
+def compute_accessibility_chunk(
+    origins: List[Tuple[str, List[str]]],
+    request_parameters: RequestParameterAccessibility
+) -> pd.DataFrame:
+    """Aggregate cumulative opportunities of origins over all departures of the window"""
+    feed = worker_feed
+    pool = feed.get_workspace_pool()
+    # opportunity weights and thresholds aligned to stop indices
+    weights = np.zeros(len(feed.stops), dtype="float64")
+    for stop_id, weight in request_parameters.opportunities.items():
+        if stop_id in pool.stop_indices:
+            weights[pool.stop_indices[stop_id]] += weight
+    thresholds = np.array(request_parameters.thresholds, dtype="int64")
+    departures = range(request_parameters.departure_start_secs, request_parameters.departure_end_secs, request_parameters.departure_interval_secs)
+
+    records = []
+    for origin, origin_stop_ids in origins:
+        # rows are departures and columns are thresholds
+        scores = np.zeros((len(departures), len(thresholds)), dtype="float64")
+        for i, departure_secs in enumerate(departures):
+            with pool.workspace() as workspace:
+                run_raptor(
+                    feed,
+                    origin_stop_ids,
+                    request_parameters.specified_date,
+                    departure_secs,
+                    request_parameters.transfers_limit,
+                    False,
+                    request_parameters.available_trip_ids,
+                    trip_filters=request_parameters.trip_filters,
+                    workspace=workspace,
+                    track_paths=False,
+                    # stops beyond the largest threshold never count
+                    max_travel_secs=int(thresholds.max()) if len(thresholds) > 0 else None
+                )
+                reached_stops = np.array(workspace.reached_stops, dtype="int64")
+                times_to_reach = workspace.time_to_reach[reached_stops]
+            scores[i] = weights[reached_stops] @ (times_to_reach[:, None] <= thresholds[None, :])
+
+        for j, threshold in enumerate(request_parameters.thresholds):
+            records.append({
+                "origin": origin,
+                "threshold": threshold,
+                "mean_opportunities": float(scores[:, j].mean()) if len(departures) > 0 else 0.0,
+                "min_opportunities": float(scores[:, j].min()) if len(departures) > 0 else 0.0,
+                "max_opportunities": float(scores[:, j].max()) if len(departures) > 0 else 0.0,
+            })
+
+    return pd.DataFrame.from_records(records, columns=ACCESSIBILITY_COLUMNS)
+
+def compute_accessibility(
+    feed: Union[Feed, FeedPath],
+    req: Dict,
+    output_path: str,
+    max_workers: Optional[int] = None,
+    chunk_size: int = 16
+) -> pd.DataFrame:
+    """Compute cumulative-opportunity accessibility of every origin over a departure window.
+
+    Origins are split into chunks of chunk_size and computed in a process pool. Every chunk
+    is checkpointed to output_path as a parquet file, and chunks already written are skipped,
+    so an interrupted job resumes by running it again with the same request.
+    """
+    request_parameters = RequestParameterAccessibility.parse_obj(req)
+    os.makedirs(output_path, exist_ok=True)
+
+    # checkpoints are valid only for the same request and chunking
+    job = {
+        "request_hash": hashlib.sha256(request_parameters.json(sort_keys=True).encode()).hexdigest(),
+        "chunk_size": chunk_size,
+    }
+    job_path = os.path.join(output_path, "job.json")
+    if os.path.exists(job_path):
+        with open(job_path) as f:
+            if json.load(f) != job:
+                raise ValueError(f"Checkpoints in {output_path} belong to another accessibility job")
+    else:
+        with open(job_path, "w") as f:
+            json.dump(job, f)
+
+    origins = sorted(request_parameters.origins.items())
+    chunks = [origins[i:i + chunk_size] for i in range(0, len(origins), chunk_size)]
+    chunk_paths = [os.path.join(output_path, f"part-{i:05d}.parquet") for i in range(len(chunks))]
+    pending_chunks = [i for i, chunk_path in enumerate(chunk_paths) if not os.path.exists(chunk_path)]
+
+    if len(pending_chunks) > 0:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker, initargs=(feed,)) as executor:
+            futures = {
+                executor.submit(compute_accessibility_chunk, chunks[i], request_parameters): i
+                for i in pending_chunks
+            }
+            for future in as_completed(futures):
+                chunk_path = chunk_paths[futures[future]]
+                # write to a temporary file first, so a partial file never passes as a checkpoint
+                future.result().to_parquet(f"{chunk_path}.tmp", index=False)
+                os.replace(f"{chunk_path}.tmp", chunk_path)
+
+    if len(chunk_paths) == 0:
+        return pd.DataFrame(columns=ACCESSIBILITY_COLUMNS)
+    return pd.concat([pd.read_parquet(chunk_path) for chunk_path in chunk_paths], ignore_index=True)
@@ -0,0 +1,98 @@
+import copy
+import asyncio
+import threading
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+from .models import Feed, RequestParameter, RequestParameterIsochrones
+from .handle import FeedHandle
+from .raptor import search_p2p_geojson, search_p2p_path, search_isochrones
+
+SEARCHES: Dict[str, Tuple[Callable, type]] = {
+    "search_p2p_geojson": (search_p2p_geojson, RequestParameter),
+    "search_p2p_path": (search_p2p_path, RequestParameter),
+    "search_isochrones": (search_isochrones, RequestParameterIsochrones),
+}
+
+class InFlightSearch:
+    """A search running in the executor and the number of callers awaiting it"""
+    def __init__(self, future: asyncio.Future, cancel_event: threading.Event) -> None:
+        self.future: asyncio.Future = future
+        self.cancel_event: threading.Event = cancel_event
+        self.waiters: int = 0
+
+
+class AsyncSearcher:
+    """Asyncio front of the searches, running them in an executor.
+
+    Concurrent calls with the same parameters after validation share one search, and each
+    caller gets its own copy of the result. A caller can be cancelled or time out without
+    affecting the others, and the search itself is cancelled between rounds once no caller
+    awaits it any more. The executor should run in threads of this process, e.g. a
+    ThreadPoolExecutor; the default executor of the event loop is used when it is None.
+    """
+    def __init__(
+        self,
+        feed: Union[Feed, FeedHandle],
+        executor: Optional[Executor] = None,
+        timeout: Optional[float] = None
+    ) -> None:
+        # a feed is shared by threads of the executor
+        self.feed: Union[Feed, FeedHandle] = feed.compile() if isinstance(feed, Feed) else feed
+        self.executor: Optional[Executor] = executor
+        self.timeout: Optional[float] = timeout
+        self.in_flight_searches: Dict[Tuple[str, str], InFlightSearch] = {}
+
+    async def search_p2p_geojson(self, req: Dict, timeout: Optional[float] = None) -> Any:
+        return await self.search("search_p2p_geojson", req, timeout)
+
+    async def search_p2p_path(self, req: Dict, timeout: Optional[float] = None) -> Any:
+        return await self.search("search_p2p_path", req, timeout)
+
+    async def search_isochrones(self, req: Dict, timeout: Optional[float] = None) -> Any:
+        return await self.search("search_isochrones", req, timeout)
+
+    def get_in_flight_count(self) -> int:
+        return len(self.in_flight_searches)
+
+    def run_search(self, search_name: str, req: Dict, cancel_event: threading.Event) -> Any:
+        search, _ = SEARCHES[search_name]
+        if isinstance(self.feed, FeedHandle):
+            with self.feed.feed() as feed:
+                return search(feed, req, cancel_event)
+        return search(self.feed, req, cancel_event)
+
+    async def search(self, search_name: str, req: Dict, timeout: Optional[float] = None) -> Any:
+        """Run the search or join the same search in flight. timeout in seconds overrides the default one"""
+        _, request_model = SEARCHES[search_name]
+        # identical once defaults are filled by validation
+        key = (search_name, request_model.parse_obj(req).json(sort_keys=True))
+
+        in_flight_search = self.in_flight_searches.get(key)
+        if in_flight_search is None:
+            cancel_event = threading.Event()
+            future = asyncio.get_running_loop().run_in_executor(self.executor, self.run_search, search_name, req, cancel_event)
+            in_flight_search = InFlightSearch(future, cancel_event)
+            self.in_flight_searches[key] = in_flight_search
+            future.add_done_callback(lambda _: self.forget(key, in_flight_search))
+
+        in_flight_search.waiters += 1
+        try:
+            # shielded, so that a cancelled caller does not cancel the search shared with others
+            result = await asyncio.wait_for(
+                asyncio.shield(in_flight_search.future),
+                timeout if timeout is not None else self.timeout
+            )
+        finally:
+            in_flight_search.waiters -= 1
+            if in_flight_search.waiters == 0 and not in_flight_search.future.done():
+                # nobody awaits the result any more
+                in_flight_search.cancel_event.set()
+                in_flight_search.future.cancel()
+                self.forget(key, in_flight_search)
+        return copy.deepcopy(result)
+
+    def forget(self, key: Tuple[str, str], in_flight_search: InFlightSearch) -> None:
+        # a later search of the same key may have taken the place already
+        if self.in_flight_searches.get(key) is in_flight_search:
+            self.in_flight_searches.pop(key)
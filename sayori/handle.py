@@ -0,0 +1,162 @@
+import os
+import signal
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from .models import Feed, FeedPath
+from .registry import get_feed_path
+
+class FeedVersion:
+    """A loaded feed and the number of queries running on it"""
+    def __init__(self, version: int, feed: Feed, fingerprint: Tuple) -> None:
+        self.version: int = version
+        self.feed: Optional[Feed] = feed
+        self.fingerprint: Tuple = fingerprint
+        self.refcount: int = 0
+        self.is_current: bool = True
+
+
+class FeedHandle:
+    """Serves the latest version of a converted feed and reloads it without stopping queries.
+
+    A new version is built in the background and swapped in atomically. Queries acquired
+    before the swap finish on the version they started with, and a previous version is
+    freed once its last query ends. Reloads are triggered by reload(), by a signal
+    (see install_signal_handler) or by watching the files every poll_interval seconds.
+    """
+    def __init__(
+        self,
+        feed_path: Union[FeedPath, str],
+        compiler: Optional[Callable[[Feed], None]] = None,
+        poll_interval: Optional[float] = None
+    ) -> None:
+        # a presayori output directory is resolved on every reload, as files may be added
+        self.feed_path: Union[FeedPath, str] = feed_path
+        self.compiler: Optional[Callable[[Feed], None]] = compiler
+        self.versions: Dict[int, FeedVersion] = {}
+        self.current: Optional[FeedVersion] = None
+        self.fingerprint: Optional[Tuple] = None
+        self.last_error: Optional[Exception] = None
+        self.lock = threading.Lock()
+        self.reload_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.watcher: Optional[threading.Thread] = None
+
+        self.reload()
+        if poll_interval is not None:
+            self.watch(poll_interval)
+
+    def get_feed_path(self) -> FeedPath:
+        return get_feed_path(self.feed_path) if isinstance(self.feed_path, str) else self.feed_path
+
+    def get_fingerprint(self) -> Tuple:
+        """Modification time and size of every feed file"""
+        fingerprint = []
+        for path in self.get_feed_path().dict().values():
+            if path is None:
+                continue
+            try:
+                stat = os.stat(path)
+                fingerprint.append((path, stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                fingerprint.append((path, None, None))
+        return tuple(fingerprint)
+
+    def get_version(self) -> int:
+        return self.current.version
+
+    def get_live_versions(self) -> List[int]:
+        """Versions not freed yet, i.e. the current one and those still used by queries"""
+        with self.lock:
+            return sorted(self.versions.keys())
+
+    def reload(self) -> bool:
+        """Build the feed from its files and swap it in.
+        Returns False when the build failed, in which case the current version is kept and the error is in last_error."""
+        with self.reload_lock:
+            fingerprint = self.get_fingerprint()
+            self.fingerprint = fingerprint
+            try:
+                feed = Feed.from_feed_path(self.get_feed_path())
+                if self.compiler is not None:
+                    self.compiler(feed)
+                # lazily built structures are built before the first query of the version
+                feed.compile()
+            except Exception as e:
+                self.last_error = e
+                if self.current is None:
+                    raise
+                return False
+            self.last_error = None
+
+            with self.lock:
+                previous = self.current
+                version = previous.version + 1 if previous is not None else 1
+                self.current = FeedVersion(version, feed, fingerprint)
+                self.versions[version] = self.current
+                if previous is not None:
+                    previous.is_current = False
+                    self.free_if_unused(previous)
+            return True
+
+    def request_reload(self) -> threading.Thread:
+        """Reload in a background thread"""
+        thread = threading.Thread(target=self.reload, daemon=True)
+        thread.start()
+        return thread
+
+    def install_signal_handler(self, signalnum: Optional[int] = None) -> None:
+        """Reload in the background on a signal, SIGHUP by default. Should be called from the main thread"""
+        signal.signal(signalnum if signalnum is not None else signal.SIGHUP, lambda signum, frame: self.request_reload())
+
+    def watch(self, poll_interval: float) -> None:
+        """Reload when the files have changed. A change is picked up once the files stay the same
+        for one more poll_interval, so that files being written are not loaded"""
+        def poll() -> None:
+            pending_fingerprint = None
+            while not self.stop_event.wait(poll_interval):
+                fingerprint = self.get_fingerprint()
+                if fingerprint == self.fingerprint:
+                    pending_fingerprint = None
+                elif fingerprint == pending_fingerprint:
+                    self.reload()
+                    pending_fingerprint = None
+                else:
+                    pending_fingerprint = fingerprint
+
+        self.stop_event.clear()
+        self.watcher = threading.Thread(target=poll, daemon=True)
+        self.watcher.start()
+
+    def close(self) -> None:
+        """Stop watching the files"""
+        self.stop_event.set()
+        if self.watcher is not None:
+            self.watcher.join()
+            self.watcher = None
+
+    def acquire(self) -> FeedVersion:
+        with self.lock:
+            self.current.refcount += 1
+            return self.current
+
+    def release(self, feed_version: FeedVersion) -> None:
+        with self.lock:
+            feed_version.refcount -= 1
+            self.free_if_unused(feed_version)
+
+    def free_if_unused(self, feed_version: FeedVersion) -> None:
+        # called with the lock held
+        if not feed_version.is_current and feed_version.refcount == 0:
+            self.versions.pop(feed_version.version, None)
+            feed_version.feed = None
+
+    @contextmanager
+    def feed(self) -> Iterator[Feed]:
+        """Pin the current version for the duration of a query"""
+        feed_version = self.acquire()
+        try:
+            yield feed_version.feed
+        finally:
+            self.release(feed_version)
@@ -1,58 +1,103 @@
+import sys
+import heapq
 import datetime
-from typing import List, Optional
+import threading
+import json
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 import pydantic
 import numpy as np
-import pandas as pd
 
-import pandera as pa
-from pandera.typing import Series, DataFrame
+from .spatial import StopGridIndex
+from .workspace import WorkspacePool
 
-class Stops(pa.SchemaModel):   
-    stop_id: Series[str] = pa.Field(unique = True, nullable=False)
-    stop_name: Series[str] = pa.Field(nullable=True)
-    parent_station: Series[str] = pa.Field(nullable=True)
-    platform_code: Series[str] = pa.Field(nullable=True)
-    stop_lat: Series[pa.Float64] = pa.Field(nullable=True)
-    stop_lon: Series[pa.Float64] = pa.Field(nullable=True)
+if TYPE_CHECKING:
+    import pandas as pd
+    from pandera.typing import DataFrame
+    from .schemas import Stops, Trips, StopTimes, Calendar, Transfers, Frequencies
 
-    class Config:
-        strict = True
+NAMESPACE_SEPARATOR = ":"
+SCHEMA_NAMES = ["Stops", "Trips", "StopTimes", "Calendar", "Transfers", "Frequencies"]
 
-class Trips(pa.SchemaModel):
-    trip_id: Series[str] = pa.Field(unique = True, nullable=True)
-    route_id: Series[str] = pa.Field(nullable=False)
-    service_id: Series[str] = pa.Field(nullable=False)
-    trip_headsign: Series[str] = pa.Field(nullable=True)
-    trip_short_name: Series[str] = pa.Field(nullable=True)
-    block_id: Series[str] = pa.Field(nullable=True)
+# walking secs up to which transfers are chained into a footpath by default, i.e. a 10 minutes walk
+MAX_FOOTPATH_SECS = 600
 
-    class Config:
-        strict = True
+# bump when the layout of files written by Feed.to_npz changes
+COMPILED_FEED_VERSION = 3
+# tables and structures built by Feed.compile, saved by Feed.to_npz
+COMPILED_FIELDS = [
+    "stops", "stop_times", "trips", "transfers", "calendar", "frequencies",
+    "stop_time_trip_indices", "stop_time_stop_order", "trip_stop_time_order", "trip_frequency_order",
+    "calendar_start_date", "calendar_days", "trip_service_indices",
+    "trip_filters", "platform_stops", "stop_time_platform_ids", "stop_change_secs", "platform_lookup",
+    "platform_station_indices", "station_platform_order",
+    "max_footpath_secs", "footpaths",
+]
 
-class StopTimes(pa.SchemaModel):
-    trip_id: Series[str] = pa.Field(nullable=False)
-    stop_sequence: Series[pa.Int64] = pa.Field(nullable=False)
-    stop_id: Series[str] = pa.Field(nullable=False)
-    arrival_time: Series[pa.Int32] = pa.Field(nullable=False)
-    departure_time: Series[pa.Int32] = pa.Field(nullable=False)
-    pickup_type: Series[pa.Int32] = pa.Field(nullable = True, isin = [0, 1, 2, 3])
-    drop_off_type: Series[pa.Int32] = pa.Field(nullable = True, isin = [0, 1, 2, 3])
+# guards lazily built structures shared by concurrent searches
+compile_lock = threading.Lock()
 
-    class Config:
-        strict = True
+def get_station_ids(stops: np.ndarray) -> np.ndarray:
+    """parent_station of each stop, or the stop itself when it has none"""
+    return np.array([
+        parent_station if isinstance(parent_station, str) and parent_station != "" else stop_id
+        for stop_id, parent_station in zip(stops["stop_id"], stops["parent_station"])
+    ], dtype=object)
 
-class Calendar(pa.SchemaModel):
-    calendar_date: Series[pa.Date] = pa.Field(unique = True, nullable=False) 
-    service_ids: Series[pa.Object] = pa.Field(nullable=False) 
+def add_namespace(namespace: str, ids) -> np.ndarray:
+    """Prefix ids with a namespace, e.g. toei:0606-01. Missing ids are kept as they are"""
+    return np.array([f"{namespace}{NAMESPACE_SEPARATOR}{v}" if isinstance(v, str) else v for v in ids], dtype=object)
 
-    class Config:
-        strict = True
+def __getattr__(name: str):
+    # pandera schemas live in .schemas and are imported on first use
+    if name in SCHEMA_NAMES:
+        from . import schemas
+        return getattr(schemas, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def encode_array(key: str, array: np.ndarray, arrays: Dict[str, np.ndarray]):
+    """Put arrays np.load reads back without pickle into arrays under key, and return how to decode them"""
+    if array.dtype.names is not None:
+        return [[name, encode_array(f"{key}.{name}", array[name], arrays)] for name in array.dtype.names]
+    if array.dtype != object:
+        arrays[key] = array
+        return "array"
 
-class Transfers(pa.SchemaModel):
-    from_stop_id: Series[str] = pa.Field(nullable = False)
-    to_stop_id: Series[str] = pa.Field(nullable = False)
-    transfer_type: Series[pa.Int32] = pa.Field(nullable = False, isin = [0, 1, 2, 3])
-    min_transfer_time: Series[pa.Int32] = pa.Field(nullable = False, gt = 0)
+    is_null = np.array([v is None for v in array.tolist()], dtype=bool)
+    kinds = {type(v) for v in array.tolist()} - {type(None)}
+    if kinds <= {str}:
+        arrays[key] = np.where(is_null, "", array).astype(str)
+        arrays[f"{key}.null"] = is_null
+        return "str"
+    if kinds == {bytes} and not is_null.any():
+        arrays[key] = np.frombuffer(b"".join(array.tolist()), dtype=np.uint8)
+        arrays[f"{key}.offsets"] = np.cumsum([0] + [len(v) for v in array.tolist()])
+        return "bytes"
+    if kinds == {datetime.date}:
+        arrays[key] = array.astype("datetime64[D]")
+        return "date"
+    raise ValueError(f"{key} of {', '.join(kind.__name__ for kind in kinds)} cannot be saved without pickle")
+
+def decode_array(key: str, encoding, arrays: Dict[str, np.ndarray]) -> np.ndarray:
+    if isinstance(encoding, list):
+        columns = [(name, decode_array(f"{key}.{name}", column_encoding, arrays)) for name, column_encoding in encoding]
+        array = np.empty(len(columns[0][1]), dtype=[(name, values.dtype) for name, values in columns])
+        for name, values in columns:
+            array[name] = values
+        return array
+    if encoding == "array":
+        return arrays[key]
+    if encoding == "str":
+        values = arrays[key].astype(object)
+        values[arrays[f"{key}.null"]] = None
+        return values
+    if encoding == "bytes":
+        data, offsets = arrays[key].tobytes(), arrays[f"{key}.offsets"]
+        values = np.empty(len(offsets) - 1, dtype=object)
+        values[:] = [data[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+        return values
+    if encoding == "date":
+        return arrays[key].astype(object)
+    raise ValueError(f"Unknown encoding of {key}: {encoding}")
 
 class TimeToStop(pydantic.BaseModel):
     time_to_reach: int = 0
@@ -69,24 +114,81 @@ class FeedPath(pydantic.BaseModel):
     trips: str
     transfers: str
     calendar: str
+    frequencies: Optional[str] = None
+
+class Coordinate(pydantic.BaseModel):
+    lat: float
+    lon: float
 
 class RequestParameter(pydantic.BaseModel):
-    origin_stop_ids: List[str]
-    destination_stop_ids: List[str]
+    origin_stop_ids: List[str] = pydantic.Field(default_factory=list)
+    destination_stop_ids: List[str] = pydantic.Field(default_factory=list)
+    origin_coordinate: Optional[Coordinate] = None
+    destination_coordinate: Optional[Coordinate] = None
     specified_date: str
     specified_secs: int
     transfers_limit: int
     is_reverse_search: bool = False
     available_trip_ids: Optional[List[str]] = None
+    # names of trip filters compiled beforehand with Feed.compile_trip_filter
+    trip_filters: Optional[List[str]] = None
+    # walking access and egress for coordinate origins and destinations
+    max_walking_distance: float = pydantic.Field(500, gt=0)
+    walking_speed: float = pydantic.Field(4.8 / 3.6, gt=0)
+    # stops not reachable within max_travel_secs are left out
+    max_travel_secs: Optional[int] = pydantic.Field(None, gt=0)
+
+    @pydantic.root_validator(skip_on_failure=True)
+    def check_origin_and_destination(cls, values):
+        if len(values["origin_stop_ids"]) == 0 and values["origin_coordinate"] is None:
+            raise ValueError("Either origin_stop_ids or origin_coordinate should be specified")
+        if len(values["destination_stop_ids"]) == 0 and values["destination_coordinate"] is None:
+            raise ValueError("Either destination_stop_ids or destination_coordinate should be specified")
+        return values
+
+class RequestParameterAccessibility(pydantic.BaseModel):
+    # origin name and its stop_ids
+    origins: Dict[str, List[str]]
+    # opportunities (e.g. jobs) reachable at each stop_id
+    opportunities: Dict[str, float]
+    # time thresholds in seconds
+    thresholds: List[int]
+    specified_date: str
+    # departures from departure_start_secs (inclusive) to departure_end_secs (exclusive)
+    departure_start_secs: int
+    departure_end_secs: int
+    departure_interval_secs: int = pydantic.Field(300, gt=0)
+    transfers_limit: int
+    available_trip_ids: Optional[List[str]] = None
+    trip_filters: Optional[List[str]] = None
 
 class RequestParameterIsochrones(pydantic.BaseModel):
-    origin_stop_ids: List[str]
+    origin_stop_ids: List[str] = pydantic.Field(default_factory=list)
     # destination_stop_ids: List[str]
+    origin_coordinate: Optional[Coordinate] = None
     specified_date: str
     specified_secs: int
     transfers_limit: int
     is_reverse_search: bool = False
     available_trip_ids: Optional[List[str]] = None
+    # names of trip filters compiled beforehand with Feed.compile_trip_filter
+    trip_filters: Optional[List[str]] = None
+    max_walking_distance: float = pydantic.Field(500, gt=0)
+    walking_speed: float = pydantic.Field(4.8 / 3.6, gt=0)
+    # stops not reachable within max_travel_secs are left out
+    max_travel_secs: Optional[int] = pydantic.Field(None, gt=0)
+
+    @pydantic.root_validator(skip_on_failure=True)
+    def check_origin(cls, values):
+        if len(values["origin_stop_ids"]) == 0 and values["origin_coordinate"] is None:
+            raise ValueError("Either origin_stop_ids or origin_coordinate should be specified")
+        return values
+
+class RequestParameterSurface(RequestParameterIsochrones):
+    # side of a grid cell in meters. cells are reached by walking up to max_walking_distance from reached stops
+    grid_resolution: float = pydantic.Field(100, gt=0)
+    # upper bounds in seconds of isochrone bands to polygonize, e.g. [900, 1800, 2700, 3600]
+    band_secs: Optional[List[int]] = None
 
 
 class Feed(pydantic.BaseModel):
@@ -95,25 +197,72 @@ class Feed(pydantic.BaseModel):
     trips: np.ndarray
     transfers: np.ndarray
     calendar: np.ndarray
+    frequencies: np.ndarray
+    # built lazily on the first coordinate lookup
+    stop_grid_index: Optional[StopGridIndex] = None
+    # trip index of each stop_times row, built lazily
+    stop_time_trip_indices: Optional[np.ndarray] = None
+    # stop_id of stop_times sorted and the rows in that order, built lazily
+    stop_time_stop_order: Optional[Tuple[np.ndarray, np.ndarray]] = None
+    # row offsets by trip index and the rows of stop_times sorted by trip index and stop_sequence, built lazily
+    trip_stop_time_order: Optional[Tuple[np.ndarray, np.ndarray]] = None
+    # row offsets by trip index and the rows of frequencies sorted by trip index and start_time, built lazily
+    trip_frequency_order: Optional[Tuple[np.ndarray, np.ndarray]] = None
+    # day × service bit matrix packed along services and service index of each trip, built lazily
+    calendar_start_date: Optional[np.datetime64] = None
+    calendar_days: Optional[np.ndarray] = None
+    trip_service_indices: Optional[np.ndarray] = None
+    # named trip filters packed as bitsets over trip indices
+    trip_filters: Dict[str, np.ndarray] = pydantic.Field(default_factory=dict)
+    # per-query scratch buffers, built lazily
+    workspace_pool: Optional[WorkspacePool] = None
+    # platform-level stops and platform of each stop_times row of a feed made by contract_stations
+    platform_stops: Optional[np.ndarray] = None
+    stop_time_platform_ids: Optional[np.ndarray] = None
+    # seconds to change platforms before boarding at a contracted station
+    stop_change_secs: Optional[np.ndarray] = None
+    # trip_id, stop_sequence and platform of stop_times sorted by trip and stop_sequence, built lazily
+    platform_lookup: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+    # station index of each platform, and row offsets by station index and the platform indices in that order, built lazily
+    platform_station_indices: Optional[np.ndarray] = None
+    station_platform_order: Optional[Tuple[np.ndarray, np.ndarray]] = None
+    # station_id of each platform_id, built lazily
+    platform_station_ids: Optional[Dict[str, str]] = None
+    # transfers closed transitively within max_footpath_secs of walking (see build_footpaths).
+    # row offsets by stop index, stop index walked to, walking secs and stop index walked from just before, built lazily
+    max_footpath_secs: int = pydantic.Field(MAX_FOOTPATH_SECS, ge=0)
+    footpaths: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = None
     
     class Config:
         arbitrary_types_allowed = True
 
+    def __getstate__(self):
+        state = super().__getstate__()
+        # workspaces hold locks and are local to a process
+        state["__dict__"] = state["__dict__"] | {"workspace_pool": None}
+        return state
+
     @classmethod
     def from_pandas(
         cls, 
-        stops: DataFrame[Stops], 
-        stop_times: DataFrame[StopTimes], 
-        trips: DataFrame[Trips], 
-        transfers: DataFrame[Transfers], 
-        calendar: DataFrame[Calendar]
+        stops: "DataFrame[Stops]", 
+        stop_times: "DataFrame[StopTimes]", 
+        trips: "DataFrame[Trips]", 
+        transfers: "DataFrame[Transfers]", 
+        calendar: "DataFrame[Calendar]",
+        frequencies: Optional["DataFrame[Frequencies]"] = None
     ) -> "Feed":
+        from .schemas import Stops, Trips, StopTimes, Calendar, Transfers, Frequencies
+
+        if frequencies is None:
+            frequencies = cls.empty_frequencies()
 
         stops = Stops.validate(stops)
         stop_times = StopTimes.validate(stop_times)
         trips = Trips.validate(trips)
         transfers = Transfers.validate(transfers)
-        calendar = Calendar.validate(calendar)
+        calendar = Calendar.validate(cls.convert_legacy_calendar(calendar))
+        frequencies = Frequencies.validate(frequencies)
 
         return cls.parse_obj({
             "stops": cls.convert_pandas2ndarray(stops),
@@ -121,21 +270,30 @@ class Feed(pydantic.BaseModel):
             "trips": cls.convert_pandas2ndarray(trips),
             "transfers": cls.convert_pandas2ndarray(transfers),
             "calendar": cls.convert_pandas2ndarray(calendar),
+            "frequencies": cls.convert_pandas2ndarray(frequencies),
         })
 
     @classmethod
     def from_feed_path(cls, feed_path: FeedPath) -> "Feed":
+        import pandas as pd
+        from .schemas import Stops, Trips, StopTimes, Calendar, Transfers, Frequencies
+
         stops = pd.read_parquet(feed_path.stops)
         stop_times = pd.read_parquet(feed_path.stop_times)
         trips = pd.read_parquet(feed_path.trips)
         transfers = pd.read_parquet(feed_path.transfers)
         calendar = pd.read_parquet(feed_path.calendar)
+        if feed_path.frequencies is not None:
+            frequencies = pd.read_parquet(feed_path.frequencies)
+        else:
+            frequencies = cls.empty_frequencies()
 
         stops = Stops.validate(stops)
         stop_times = StopTimes.validate(stop_times)
         trips = Trips.validate(trips)
         transfers = Transfers.validate(transfers)
-        calendar = Calendar.validate(calendar)
+        calendar = Calendar.validate(cls.convert_legacy_calendar(calendar))
+        frequencies = Frequencies.validate(frequencies)
 
         return cls.parse_obj({
             "stops": cls.convert_pandas2ndarray(stops),
@@ -143,25 +301,513 @@ class Feed(pydantic.BaseModel):
             "trips": cls.convert_pandas2ndarray(trips),
             "transfers": cls.convert_pandas2ndarray(transfers),
             "calendar": cls.convert_pandas2ndarray(calendar),
+            "frequencies": cls.convert_pandas2ndarray(frequencies),
+        })
+
+    @classmethod
+    def from_npz(cls, path: str) -> "Feed":
+        """Load a feed saved by to_npz. Only numpy is needed, neither pandas nor pandera"""
+        with np.load(path) as npz:
+            arrays = dict(npz)
+        meta = json.loads(str(arrays["__meta__"][()]))
+        if meta["version"] != COMPILED_FEED_VERSION:
+            raise ValueError(f"{path} was saved by another version of sayori. Save it again with Feed.to_npz")
+
+        fields = {}
+        for name, (kind, parts) in meta["fields"].items():
+            values = {part: decode_array(f"{name}/{part}", encoding, arrays) for part, encoding in parts}
+            if kind == "dict":
+                fields[name] = values
+            elif kind == "tuple":
+                fields[name] = tuple(values.values())
+            elif kind == "scalar":
+                fields[name] = values[""][()]
+            else:
+                fields[name] = values[""]
+        return cls.parse_obj(fields)
+
+    def to_npz(self, path: str) -> None:
+        """Save the tables with the structures built by compile, for workers to load them with from_npz"""
+        self.compile()
+        arrays, fields = {}, {}
+        for name in COMPILED_FIELDS:
+            value = getattr(self, name)
+            if value is None:
+                continue
+            if isinstance(value, dict):
+                kind, parts = "dict", list(value.items())
+            elif isinstance(value, tuple):
+                kind, parts = "tuple", [(str(i), part) for i, part in enumerate(value)]
+            else:
+                kind, parts = "scalar" if np.ndim(value) == 0 else "array", [("", value)]
+            fields[name] = [kind, [[part, encode_array(f"{name}/{part}", np.asarray(array), arrays)] for part, array in parts]]
+        arrays["__meta__"] = np.array(json.dumps({"version": COMPILED_FEED_VERSION, "fields": fields}))
+        np.savez(path, **arrays)
+
+    @staticmethod
+    def empty_frequencies() -> "pd.DataFrame":
+        import pandas as pd
+
+        return pd.DataFrame({
+            "trip_id": pd.Series(dtype="str"),
+            "start_time": pd.Series(dtype="int32"),
+            "end_time": pd.Series(dtype="int32"),
+            "headway_secs": pd.Series(dtype="int32"),
+            "exact_times": pd.Series(dtype="int32"),
+        })
+
+    @staticmethod
+    def convert_legacy_calendar(calendar: "pd.DataFrame") -> "pd.DataFrame":
+        """Convert a calendar of service_ids per calendar_date, written by older presayori, into active_days bits"""
+        import pandas as pd
+
+        if "calendar_date" not in calendar.columns:
+            return calendar
+        calendar_dates = calendar.explode("service_ids").dropna(subset=["service_ids"])
+        days = pd.to_datetime(calendar_dates["calendar_date"]).to_numpy().astype("datetime64[D]")
+        start_date = days.min() if len(days) > 0 else np.datetime64("1970-01-01")
+        service_ids, rows = np.unique(calendar_dates["service_ids"].to_numpy().astype(str), return_inverse=True)
+        active_days = np.zeros((len(service_ids), (days.max() - start_date).astype(int) + 1 if len(days) > 0 else 0), dtype=bool)
+        active_days[rows, (days - start_date).astype(int)] = True
+        return pd.DataFrame({
+            "service_id": pd.Series(service_ids, dtype="str"),
+            "start_date": [start_date.astype(datetime.date)] * len(service_ids),
+            "active_days": [bits.tobytes() for bits in np.packbits(active_days, axis=1)],
         })
 
-    
     @staticmethod
-    def convert_pandas2ndarray(df: pd.DataFrame) -> np.ndarray:
+    def convert_pandas2ndarray(df: "pd.DataFrame") -> np.ndarray:
         ndarray = np.empty(len(df), dtype=[(k, v) for k, v in df.dtypes.to_dict().items()])
         for col in df.columns:
             ndarray[col] = df[col].to_list()
         return ndarray
 
+    def get_calendar_days(self) -> np.ndarray:
+        """Return the day × service bit matrix whose row i is calendar_start_date + i days"""
+        if self.calendar_days is None:
+            start_dates = self.calendar["start_date"].astype("datetime64[D]")
+            calendar_start_date = start_dates.min() if len(start_dates) > 0 else np.datetime64("1970-01-01")
+            offsets = (start_dates - calendar_start_date).astype("int64")
+            n_days = max([offset + 8 * len(active_days) for offset, active_days in zip(offsets, self.calendar["active_days"])], default=0)
+            calendar_days = np.zeros((n_days, len(self.calendar)), dtype=bool)
+            for i, (offset, active_days) in enumerate(zip(offsets, self.calendar["active_days"])):
+                bits = np.unpackbits(np.frombuffer(active_days, dtype=np.uint8)).astype(bool)
+                calendar_days[offset:offset + len(bits), i] = bits
+            self.calendar_start_date = calendar_start_date
+            self.calendar_days = np.packbits(calendar_days, axis=1)
+        return self.calendar_days
+
+    def get_trip_service_indices(self) -> np.ndarray:
+        """Return the calendar index of the service of each trip, -1 for services missing in calendar"""
+        if self.trip_service_indices is None:
+            trip_service_indices = np.full(len(self.trips), -1, dtype="int64")
+            if len(self.calendar) > 0:
+                service_order = np.argsort(self.calendar["service_id"])
+                positions = np.searchsorted(self.calendar["service_id"][service_order], self.trips["service_id"])
+                service_indices = service_order[np.minimum(positions, len(service_order) - 1)]
+                is_found = self.calendar["service_id"][service_indices] == self.trips["service_id"]
+                trip_service_indices[is_found] = service_indices[is_found]
+            self.trip_service_indices = trip_service_indices
+        return self.trip_service_indices
+
+    def get_active_service_mask(self, date: datetime.date) -> np.ndarray:
+        """Return a boolean mask over calendar services running on the date"""
+        calendar_days = self.get_calendar_days()
+        day = int((np.datetime64(date, "D") - self.calendar_start_date).astype("int64"))
+        if day < 0 or day >= len(calendar_days):
+            return np.zeros(len(self.calendar), dtype=bool)
+        return np.unpackbits(calendar_days[day], count=len(self.calendar)).astype(bool)
+
+    def get_active_trip_mask(self, date: datetime.date) -> np.ndarray:
+        """Return a boolean mask over trips running on the date"""
+        # index -1 of trips without service picks the appended False
+        return np.append(self.get_active_service_mask(date), False)[self.get_trip_service_indices()]
+
     def get_available_trips(self, date: datetime.date) -> list:        
-        return (
-            self.trips[
-                np.isin(
-                    self.trips["service_id"], 
-                    self.calendar[self.calendar["calendar_date"] == date]["service_ids"][0]
-                )
-            ]["trip_id"].tolist()
+        return self.trips["trip_id"][self.get_active_trip_mask(date)].tolist()
+
+    def get_stop_time_trip_indices(self) -> np.ndarray:
+        if self.stop_time_trip_indices is None:
+            # trips are interned by their position in self.trips
+            trip_order = np.argsort(self.trips["trip_id"])
+            positions = np.searchsorted(self.trips["trip_id"][trip_order], self.stop_times["trip_id"])
+            self.stop_time_trip_indices = trip_order[np.minimum(positions, len(trip_order) - 1)]
+        return self.stop_time_trip_indices
+
+    def get_stop_time_stop_order(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self.stop_time_stop_order is None:
+            order = np.argsort(self.stop_times["stop_id"], kind="stable")
+            self.stop_time_stop_order = (self.stop_times["stop_id"][order], order)
+        return self.stop_time_stop_order
+
+    def get_stop_time_rows(self, stop_id: str) -> np.ndarray:
+        """Return stop_times rows at a stop"""
+        stop_ids, order = self.get_stop_time_stop_order()
+        return order[np.searchsorted(stop_ids, stop_id, side="left"):np.searchsorted(stop_ids, stop_id, side="right")]
+
+    def get_trip_stop_time_order(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self.trip_stop_time_order is None:
+            trip_indices = self.get_stop_time_trip_indices()
+            order = np.lexsort((self.stop_times["stop_sequence"], trip_indices))
+            self.trip_stop_time_order = (np.searchsorted(trip_indices[order], np.arange(len(self.trips) + 1)).astype("int64"), order)
+        return self.trip_stop_time_order
+
+    def get_trip_stop_time_rows(self, trip_index: int) -> np.ndarray:
+        """Return stop_times rows of a trip in order of stop_sequence"""
+        offsets, order = self.get_trip_stop_time_order()
+        return order[offsets[trip_index]:offsets[trip_index + 1]]
+
+    def get_trip_frequency_order(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self.trip_frequency_order is None:
+            trip_order = np.argsort(self.trips["trip_id"])
+            positions = np.searchsorted(self.trips["trip_id"][trip_order], self.frequencies["trip_id"])
+            # headway windows of trips missing in trips are left out
+            is_found = positions < len(trip_order)
+            is_found[is_found] = self.trips["trip_id"][trip_order[positions[is_found]]] == self.frequencies["trip_id"][is_found]
+            rows, trip_indices = np.flatnonzero(is_found), trip_order[positions[is_found]]
+            order = np.lexsort((self.frequencies["start_time"][rows], trip_indices))
+            self.trip_frequency_order = (np.searchsorted(trip_indices[order], np.arange(len(self.trips) + 1)).astype("int64"), rows[order])
+        return self.trip_frequency_order
+
+    def get_frequency_trip_mask(self) -> np.ndarray:
+        """Return a boolean mask over trips which are frequency-based"""
+        offsets, _ = self.get_trip_frequency_order()
+        return offsets[1:] > offsets[:-1]
+
+    def build_footpaths(self, max_footpath_secs: Optional[int] = None) -> "Feed":
+        """Close transfers transitively by Dijkstra from every stop, keeping the shortest walks within max_footpath_secs
+        (MAX_FOOTPATH_SECS by default), so that a search walks once from a stop to every stop reached by chaining transfers.
+        A single transfer is kept whatever its walking time, but is not chained further when longer than max_footpath_secs"""
+        if max_footpath_secs is None:
+            max_footpath_secs = self.max_footpath_secs
+        stop_indices = {stop_id: i for i, stop_id in enumerate(self.stops["stop_id"].tolist())}
+        transfers = self.transfers[[
+            from_stop_id in stop_indices and to_stop_id in stop_indices
+            for from_stop_id, to_stop_id in zip(self.transfers["from_stop_id"].tolist(), self.transfers["to_stop_id"].tolist())
+        ]]
+        from_indices = np.array([stop_indices[stop_id] for stop_id in transfers["from_stop_id"].tolist()], dtype="int64")
+        order = np.argsort(from_indices, kind="stable")
+        edge_offsets = np.searchsorted(from_indices[order], np.arange(len(self.stops) + 1)).tolist()
+        edge_stop_indices = [stop_indices[stop_id] for stop_id in transfers["to_stop_id"][order].tolist()]
+        edge_secs = transfers["min_transfer_time"][order].astype("int64").tolist()
+
+        counts, footpath_stop_indices, footpath_secs, previous_stop_indices = [], [], [], []
+        for source in range(len(self.stops)):
+            best_secs, previous = {source: 0}, {}
+            heap = [(0, source)]
+            while len(heap) > 0:
+                secs, stop_index = heapq.heappop(heap)
+                if secs > best_secs[stop_index]:
+                    continue
+                for i in range(edge_offsets[stop_index], edge_offsets[stop_index + 1]):
+                    next_secs = secs + edge_secs[i]
+                    if (next_secs <= max_footpath_secs or stop_index == source) and next_secs < best_secs.get(edge_stop_indices[i], next_secs + 1):
+                        best_secs[edge_stop_indices[i]] = next_secs
+                        previous[edge_stop_indices[i]] = stop_index
+                        heapq.heappush(heap, (next_secs, edge_stop_indices[i]))
+            # stop indices are kept sorted in each row for lookups
+            targets = sorted(stop_index for stop_index in best_secs if stop_index != source)
+            counts.append(len(targets))
+            footpath_stop_indices += targets
+            footpath_secs += [best_secs[stop_index] for stop_index in targets]
+            previous_stop_indices += [previous[stop_index] for stop_index in targets]
+
+        self.max_footpath_secs = max_footpath_secs
+        self.footpaths = (
+            np.concatenate([[0], np.cumsum(counts, dtype="int64")]).astype("int64"),
+            np.array(footpath_stop_indices, dtype="int64"),
+            np.array(footpath_secs, dtype="int64"),
+            np.array(previous_stop_indices, dtype="int64"),
         )
+        return self
+
+    def get_footpaths(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        if self.footpaths is None:
+            self.build_footpaths()
+        return self.footpaths
+
+    def get_footpath_position(self, from_stop_index: int, to_stop_index: int) -> Optional[int]:
+        """Return the position of the footpath between stop indices in footpaths, or None when there is none"""
+        offsets, footpath_stop_indices, _, _ = self.get_footpaths()
+        start, end = offsets[from_stop_index], offsets[from_stop_index + 1]
+        position = start + int(np.searchsorted(footpath_stop_indices[start:end], to_stop_index))
+        return position if position < end and footpath_stop_indices[position] == to_stop_index else None
+
+    def get_footpath_secs(self, from_stop_id: str, to_stop_id: str) -> Optional[int]:
+        """Return walking secs of the shortest chain of transfers between stops, or None when there is none"""
+        stop_indices = self.get_workspace_pool().stop_indices
+        if from_stop_id not in stop_indices or to_stop_id not in stop_indices:
+            return None
+        position = self.get_footpath_position(stop_indices[from_stop_id], stop_indices[to_stop_id])
+        return int(self.get_footpaths()[2][position]) if position is not None else None
+
+    def get_footpath_stop_ids(self, from_stop_index: int, position: int) -> List[str]:
+        """Return stop_ids walked through along the footpath at position in footpaths, from both ends"""
+        _, footpath_stop_indices, _, previous_stop_indices = self.get_footpaths()
+        stop_indices = [footpath_stop_indices[position]]
+        while previous_stop_indices[position] != from_stop_index:
+            stop_indices.append(previous_stop_indices[position])
+            position = self.get_footpath_position(from_stop_index, previous_stop_indices[position])
+        stop_indices.append(from_stop_index)
+        return self.stops["stop_id"][stop_indices[::-1]].tolist()
+
+    def compile_trip_filter(self, name: str, trip_ids: Optional[List[str]] = None, **trip_attributes: List[str]) -> np.ndarray:
+        """Compile a named trip filter from trip_ids and/or trips attributes (e.g. route_id=[...]).
+        All given conditions should be satisfied. The filter is referred by name in trip_filters of requests."""
+        mask = np.ones(len(self.trips), dtype=bool)
+        if trip_ids is not None:
+            mask &= np.isin(self.trips["trip_id"], trip_ids)
+        for attribute, values in trip_attributes.items():
+            if attribute not in self.trips.dtype.names:
+                raise AttributeError(f"trips has no attribute: {attribute}")
+            mask &= np.isin(self.trips[attribute], values)
+        self.trip_filters[name] = np.packbits(mask)
+        return self.trip_filters[name]
+
+    def get_available_trip_mask(
+        self, 
+        date: datetime.date, 
+        available_trip_ids: Optional[List[str]] = None, 
+        trip_filters: Optional[List[str]] = None
+    ) -> np.ndarray:
+        """Return a boolean mask over trips which are usable on the date"""
+        # available_trip_ids takes the place of trips running on the date
+        if isinstance(available_trip_ids, list):
+            bitsets = [np.packbits(np.isin(self.trips["trip_id"], available_trip_ids))]
+        else:
+            bitsets = [np.packbits(self.get_active_trip_mask(date))]
+        for name in trip_filters or []:
+            if name not in self.trip_filters:
+                raise KeyError(f"Trip filter is not compiled: {name}")
+            bitsets.append(self.trip_filters[name])
+
+        return np.unpackbits(np.bitwise_and.reduce(bitsets), count=len(self.trips)).astype(bool)
+
+    def get_frequency_departure(self, trip_index: int, stop_secs: int, bound_secs: int, is_reverse_search: bool) -> Optional[int]:
+        """Return the first departure of the instance of a trip passing a stop `stop_secs` after its first departure
+        no earlier than bound_secs (no later in reverse search), or None when no instance qualifies"""
+        offsets, order = self.get_trip_frequency_order()
+        frequencies = self.frequencies[order[offsets[trip_index]:offsets[trip_index + 1]]]
+        start_times = frequencies["start_time"].astype("int64")
+        end_times = frequencies["end_time"].astype("int64")
+        headways = frequencies["headway_secs"].astype("int64")
+        # instances depart at start_time + k * headway_secs before end_time
+        required_secs = bound_secs - stop_secs
+        if is_reverse_search:
+            last_departures = start_times + (end_times - 1 - start_times) // headways * headways
+            departures = np.minimum(start_times + (required_secs - start_times) // headways * headways, last_departures)
+            departures = departures[(required_secs >= start_times) * (end_times > start_times)]
+            return int(departures.max()) if len(departures) > 0 else None
+        else:
+            departures = start_times + np.maximum(0, -((start_times - required_secs) // headways)) * headways
+            departures = departures[departures < end_times]
+            return int(departures.min()) if len(departures) > 0 else None
 
     def get_stop_ids_from_parent_station(self, parent_station: str) -> list:
-        return self.stops[self.stops["parent_station"] == parent_station]["stop_id"].tolist()
\ No newline at end of file
+        return self.stops[self.stops["parent_station"] == parent_station]["stop_id"].tolist()
+
+    def with_namespace(self, namespace: str) -> "Feed":
+        """Return a copy of the feed whose ids are prefixed with a namespace"""
+        namespaced_fields = {
+            "stops": ["stop_id", "parent_station"],
+            "stop_times": ["trip_id", "stop_id"],
+            "trips": ["trip_id", "route_id", "service_id", "block_id"],
+            "transfers": ["from_stop_id", "to_stop_id"],
+            "frequencies": ["trip_id"],
+        }
+        tables = {}
+        for table_name, fields in namespaced_fields.items():
+            table = getattr(self, table_name).copy()
+            for field in fields:
+                table[field] = add_namespace(namespace, table[field])
+            tables[table_name] = table
+        calendar = self.calendar.copy()
+        calendar["service_id"] = add_namespace(namespace, calendar["service_id"])
+
+        return Feed.parse_obj(tables | {"calendar": calendar})
+
+    @classmethod
+    def concat(cls, feeds: List["Feed"], transfers: Optional[np.ndarray] = None) -> "Feed":
+        """Merge feeds whose ids do not collide (see with_namespace). Extra transfers between them can be added.
+        Trip filters of the same name are merged, selecting the trips each feed selects, and none of feeds without it"""
+        tables = {
+            table_name: np.concatenate([getattr(feed, table_name) for feed in feeds])
+            for table_name in ["stops", "stop_times", "trips", "transfers", "calendar", "frequencies"]
+        }
+        if transfers is not None:
+            tables["transfers"] = np.concatenate([tables["transfers"], transfers.astype(tables["transfers"].dtype)])
+        trip_filters = {
+            name: np.packbits(np.concatenate([
+                np.unpackbits(feed.trip_filters[name], count=len(feed.trips)).astype(bool) if name in feed.trip_filters else np.zeros(len(feed.trips), dtype=bool)
+                for feed in feeds
+            ]))
+            for name in dict.fromkeys(name for feed in feeds for name in feed.trip_filters)
+        }
+
+        return cls.parse_obj(tables | {"trip_filters": trip_filters, "max_footpath_secs": max(feed.max_footpath_secs for feed in feeds)})
+
+    def contract_stations(self) -> "Feed":
+        """Return a feed whose platforms sharing a parent_station are merged into one stop named by the parent_station.
+        Transfers within a station are folded into the change time of the station, the least of them, which is
+        taken before boarding there after a trip. Searches on the feed map stop_ids from and to platforms"""
+        station_ids, stop_station_indices = np.unique(get_station_ids(self.stops), return_inverse=True)
+        n_stations = len(station_ids)
+        stop_indices = {stop_id: i for i, stop_id in enumerate(self.stops["stop_id"].tolist())}
+
+        stops = np.empty(n_stations, dtype=self.stops.dtype)
+        stops["stop_id"] = station_ids
+        stops["stop_name"] = self.stops["stop_name"][np.unique(stop_station_indices, return_index=True)[1]]
+        stops["parent_station"] = None
+        stops["platform_code"] = None
+        # stations are placed at the mean of their platforms
+        for field in ["stop_lat", "stop_lon"]:
+            has_coordinate = ~np.isnan(self.stops[field])
+            sums = np.bincount(stop_station_indices[has_coordinate], self.stops[field][has_coordinate], minlength=n_stations)
+            counts = np.bincount(stop_station_indices[has_coordinate], minlength=n_stations)
+            stops[field] = np.divide(sums, counts, out=np.full(n_stations, np.nan), where=counts > 0)
+
+        stop_times = self.stop_times.copy()
+        stop_times["stop_id"] = station_ids[stop_station_indices[[stop_indices[stop_id] for stop_id in self.stop_times["stop_id"].tolist()]]]
+
+        from_stations = stop_station_indices[[stop_indices[stop_id] for stop_id in self.transfers["from_stop_id"].tolist()]]
+        to_stations = stop_station_indices[[stop_indices[stop_id] for stop_id in self.transfers["to_stop_id"].tolist()]]
+        transfer_secs = self.transfers["min_transfer_time"].astype("int64")
+        # transfers within a station become its change time
+        is_within_station = from_stations == to_stations
+        stop_change_secs = np.full(n_stations, np.iinfo(np.int64).max, dtype="int64")
+        np.minimum.at(stop_change_secs, from_stations[is_within_station], transfer_secs[is_within_station])
+        stop_change_secs[stop_change_secs == np.iinfo(np.int64).max] = 0
+        # transfers between stations keep the least of their platform pairs
+        station_pairs, first_rows, pair_indices = np.unique(
+            from_stations[~is_within_station] * n_stations + to_stations[~is_within_station], return_index=True, return_inverse=True
+        )
+        pair_secs = np.full(len(station_pairs), np.iinfo(np.int64).max, dtype="int64")
+        np.minimum.at(pair_secs, pair_indices, transfer_secs[~is_within_station])
+        transfers = np.empty(len(station_pairs), dtype=self.transfers.dtype)
+        transfers["from_stop_id"] = station_ids[station_pairs // n_stations]
+        transfers["to_stop_id"] = station_ids[station_pairs % n_stations]
+        transfers["transfer_type"] = self.transfers["transfer_type"][~is_within_station][first_rows]
+        transfers["min_transfer_time"] = pair_secs
+
+        return Feed.parse_obj({
+            "stops": stops,
+            "stop_times": stop_times,
+            "trips": self.trips,
+            "transfers": transfers,
+            "calendar": self.calendar,
+            "frequencies": self.frequencies,
+            "trip_filters": dict(self.trip_filters),
+            "platform_stops": self.stops,
+            "stop_time_platform_ids": self.stop_times["stop_id"],
+            "stop_change_secs": stop_change_secs,
+            "platform_station_indices": stop_station_indices.astype("int64"),
+        })
+
+    def is_contracted(self) -> bool:
+        return self.platform_stops is not None
+
+    def get_platform_station_indices(self) -> np.ndarray:
+        if self.platform_station_indices is None:
+            stop_indices = self.get_workspace_pool().stop_indices
+            self.platform_station_indices = np.array([stop_indices[station_id] for station_id in get_station_ids(self.platform_stops).tolist()], dtype="int64")
+        return self.platform_station_indices
+
+    def get_station_platform_order(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self.station_platform_order is None:
+            platform_station_indices = self.get_platform_station_indices()
+            order = np.argsort(platform_station_indices, kind="stable")
+            self.station_platform_order = (np.searchsorted(platform_station_indices[order], np.arange(len(self.stops) + 1)).astype("int64"), order)
+        return self.station_platform_order
+
+    def get_platform_station_ids(self) -> Dict[str, str]:
+        if self.platform_station_ids is None:
+            self.platform_station_ids = dict(zip(self.platform_stops["stop_id"].tolist(), self.stops["stop_id"][self.get_platform_station_indices()].tolist()))
+        return self.platform_station_ids
+
+    def contract_stop_access(self, stop_access_secs: Dict[str, int]) -> Dict[str, int]:
+        """Map platforms to their stations on a contracted feed, keeping the least seconds.
+        Stations and unknown stop_ids are kept as they are"""
+        station_ids = self.get_platform_station_ids()
+        station_access_secs = {}
+        for stop_id, secs in stop_access_secs.items():
+            station_id = station_ids.get(stop_id, stop_id)
+            station_access_secs[station_id] = min(station_access_secs.get(station_id, secs), secs)
+        return station_access_secs
+
+    def get_station_platform_indices(self, station_index: int) -> np.ndarray:
+        """Indices in platform_stops of the platforms of a station of a contracted feed"""
+        offsets, order = self.get_station_platform_order()
+        return order[offsets[station_index]:offsets[station_index + 1]]
+
+    def get_station_platform_ids(self, station_id: str) -> List[str]:
+        """Platforms of a station of a contracted feed"""
+        stop_indices = self.get_workspace_pool().stop_indices
+        if station_id not in stop_indices:
+            return []
+        return self.platform_stops["stop_id"][self.get_station_platform_indices(stop_indices[station_id])].tolist()
+
+    def get_platform_id(self, trip_id: str, stop_sequence: int) -> Optional[str]:
+        """Platform served by a stop_times row of a contracted feed"""
+        if self.platform_lookup is None:
+            order = np.lexsort((self.stop_times["stop_sequence"], self.stop_times["trip_id"]))
+            self.platform_lookup = (self.stop_times["trip_id"][order], self.stop_times["stop_sequence"][order], self.stop_time_platform_ids[order])
+        trip_ids, stop_sequences, platform_ids = self.platform_lookup
+        start, end = np.searchsorted(trip_ids, trip_id, side="left"), np.searchsorted(trip_ids, trip_id, side="right")
+        position = start + np.searchsorted(stop_sequences[start:end], stop_sequence)
+        if position < end and stop_sequences[position] == stop_sequence:
+            return platform_ids[position]
+        return None
+
+    def get_memory_usage(self) -> int:
+        """Approximate bytes held by the feed tables, including python objects such as ids, and by the structures
+        built from them such as indices and footpaths. Structures not built yet are not counted (see compile)"""
+        memory_usage = 0
+        for table in [self.stops, self.stop_times, self.trips, self.transfers, self.calendar, self.frequencies]:
+            for field in table.dtype.names:
+                if table.dtype[field] == object:
+                    memory_usage += sum(sys.getsizeof(v) for v in table[field])
+        # python objects of other arrays are shared with the tables
+        for name in COMPILED_FIELDS:
+            value = getattr(self, name)
+            for array in value.values() if isinstance(value, dict) else value if isinstance(value, tuple) else [value]:
+                if isinstance(array, np.ndarray):
+                    memory_usage += array.nbytes
+        if self.stop_grid_index is not None:
+            memory_usage += self.stop_grid_index.sorted_keys.nbytes + self.stop_grid_index.sorted_indices.nbytes
+        return memory_usage
+
+    def compile(self) -> "Feed":
+        """Build lazily built structures up front, e.g. before sharing the feed among threads"""
+        self.get_stop_grid_index()
+        self.get_stop_time_trip_indices()
+        self.get_stop_time_stop_order()
+        self.get_trip_stop_time_order()
+        self.get_trip_frequency_order()
+        self.get_calendar_days()
+        self.get_trip_service_indices()
+        self.get_footpaths()
+        self.get_workspace_pool()
+        if self.is_contracted():
+            self.get_station_platform_order()
+            self.get_platform_station_ids()
+        return self
+
+    def get_workspace_pool(self) -> WorkspacePool:
+        if self.workspace_pool is None:
+            with compile_lock:
+                if self.workspace_pool is None:
+                    self.workspace_pool = WorkspacePool(self.stops["stop_id"])
+        return self.workspace_pool
+
+    def get_stop_grid_index(self) -> StopGridIndex:
+        if self.stop_grid_index is None:
+            self.stop_grid_index = StopGridIndex(self.stops["stop_lat"], self.stops["stop_lon"])
+        return self.stop_grid_index
+
+    def get_nearby_stops(self, lat: float, lon: float, max_walking_distance: float, walking_speed: float) -> Dict[str, int]:
+        """Return walking seconds to every stop within max_walking_distance meters"""
+        stop_indices, distances = self.get_stop_grid_index().query_radius(lat, lon, max_walking_distance)
+        return {
+            stop_id: int(np.ceil(distance / walking_speed))
+            for stop_id, distance in zip(self.stops["stop_id"][stop_indices].tolist(), distances.tolist())
+        }
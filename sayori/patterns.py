@@ -0,0 +1,316 @@
+import json
+import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .models import Feed, RequestParameter
+from .raptor import EMPTY_ROUTING_PATH_OPTIONAL, run_raptor
+
+# a leg is ("trip", boarding stop, alighting stop) or ("walk", from stop, to stop)
+Leg = Tuple[str, str, str]
+TransferPattern = Tuple[Leg, ...]
+
+LEG_KINDS = ["trip", "walk"]
+
+def get_trip_id_set(trip_ids: Optional[List[str]]) -> Optional[frozenset]:
+    # available_trip_ids are compared regardless of their order, None being every trip running on the date
+    return frozenset(trip_ids) if trip_ids is not None else None
+
+def get_transfer_pattern(routing_path_optional: np.ndarray) -> TransferPattern:
+    """Boarding and alighting stops of a routing path"""
+    legs = []
+    for trip_id, stop_sequence, stop_id in zip(routing_path_optional["trip_id"], routing_path_optional["stop_sequence"], routing_path_optional["stop_id"]):
+        if trip_id == "walk":
+            if stop_sequence == 1:
+                legs.append(["walk", stop_id, stop_id])
+            else:
+                legs[-1][2] = stop_id
+        elif len(legs) > 0 and legs[-1][0] == "trip" and legs[-1][3] == trip_id:
+            legs[-1][2] = stop_id
+        else:
+            legs.append(["trip", stop_id, stop_id, trip_id])
+    return tuple((leg[0], leg[1], leg[2]) for leg in legs)
+
+
+class TransferPatternIndex:
+    """Transfer patterns of optimal journeys between hubs, each a group of stop_ids such as the platforms of a station.
+
+    A query from all stops of a hub to all stops of another hub is answered by evaluating only
+    the patterns against the timetable of the query date (see evaluate). Patterns are optimal only for the
+    date, departure window, transfers limit and usable trips they were collected for (see is_answerable).
+    """
+    def __init__(
+        self,
+        hubs: Dict[str, List[str]],
+        patterns: Dict[Tuple[str, str], List[TransferPattern]],
+        specified_date: str,
+        departure_start_secs: int,
+        departure_end_secs: int,
+        transfers_limit: int,
+        available_trip_ids: Optional[List[str]] = None,
+        trip_filters: Optional[List[str]] = None
+    ) -> None:
+        self.hubs: Dict[str, List[str]] = hubs
+        self.patterns: Dict[Tuple[str, str], List[TransferPattern]] = patterns
+        self.hub_names: Dict[frozenset, str] = {frozenset(stop_ids): name for name, stop_ids in hubs.items()}
+        # parameters of the searches the patterns were collected from
+        self.specified_date: str = specified_date
+        self.departure_start_secs: int = departure_start_secs
+        self.departure_end_secs: int = departure_end_secs
+        self.transfers_limit: int = transfers_limit
+        self.available_trip_ids: Optional[List[str]] = available_trip_ids
+        self.trip_filters: Optional[List[str]] = trip_filters
+
+    def is_answerable(self, request_parameters: RequestParameter) -> bool:
+        """Whether a query searches the timetable the patterns were collected from, departing within their window"""
+        return request_parameters.specified_date == self.specified_date \
+            and self.departure_start_secs <= request_parameters.specified_secs < self.departure_end_secs \
+            and request_parameters.transfers_limit == self.transfers_limit \
+            and get_trip_id_set(request_parameters.available_trip_ids) == get_trip_id_set(self.available_trip_ids) \
+            and set(request_parameters.trip_filters or []) == set(self.trip_filters or [])
+
+    def get_patterns(self, origin_stop_ids: List[str], destination_stop_ids: List[str]) -> Optional[List[TransferPattern]]:
+        """Return the patterns when both are hubs, or None"""
+        origin = self.hub_names.get(frozenset(origin_stop_ids))
+        destination = self.hub_names.get(frozenset(destination_stop_ids))
+        if origin is None or destination is None:
+            return None
+        return self.patterns.get((origin, destination))
+
+    def save(self, path: str) -> None:
+        # stops are interned to keep the file small
+        stop_ids = sorted({stop_id for patterns in self.patterns.values() for pattern in patterns for leg in pattern for stop_id in leg[1:]})
+        stop_indices = {stop_id: i for i, stop_id in enumerate(stop_ids)}
+        with open(path, "w") as f:
+            json.dump({
+                "specified_date": self.specified_date,
+                "departure_start_secs": self.departure_start_secs,
+                "departure_end_secs": self.departure_end_secs,
+                "transfers_limit": self.transfers_limit,
+                "available_trip_ids": self.available_trip_ids,
+                "trip_filters": self.trip_filters,
+                "hubs": self.hubs,
+                "stop_ids": stop_ids,
+                "patterns": [
+                    [origin, destination, [[value for leg in pattern for value in (LEG_KINDS.index(leg[0]), stop_indices[leg[1]], stop_indices[leg[2]])] for pattern in patterns]]
+                    for (origin, destination), patterns in self.patterns.items()
+                ],
+            }, f)
+
+    @classmethod
+    def load(cls, path: str) -> "TransferPatternIndex":
+        with open(path) as f:
+            index = json.load(f)
+        stop_ids = index["stop_ids"]
+        patterns = {
+            (origin, destination): [
+                tuple((LEG_KINDS[values[i]], stop_ids[values[i + 1]], stop_ids[values[i + 2]]) for i in range(0, len(values), 3))
+                for values in pattern_values
+            ]
+            for origin, destination, pattern_values in index["patterns"]
+        }
+        return cls(
+            index["hubs"],
+            patterns,
+            index["specified_date"],
+            index["departure_start_secs"],
+            index["departure_end_secs"],
+            index["transfers_limit"],
+            index["available_trip_ids"],
+            index["trip_filters"],
+        )
+
+    def evaluate(self, feed: Feed, patterns: List[TransferPattern], request_parameters: RequestParameter) -> Optional[Dict]:
+        """Return the earliest journey among the patterns in the form of StopAccessStates.time_to_reach_to_destinations,
+        or None when no pattern can be ridden"""
+        specified_date = datetime.date.fromisoformat(request_parameters.specified_date)
+        available_trip_mask = feed.get_available_trip_mask(specified_date, request_parameters.available_trip_ids, request_parameters.trip_filters)
+        stop_indices = feed.get_workspace_pool().stop_indices
+
+        fastest_way = None
+        for pattern in patterns:
+            if sum(leg[0] == "trip" for leg in pattern) > request_parameters.transfers_limit + 1:
+                continue
+            secs = request_parameters.specified_secs
+            rides = []
+            for kind, from_stop_id, to_stop_id in pattern:
+                if kind == "walk":
+                    footpath_secs = feed.get_footpath_secs(from_stop_id, to_stop_id)
+                    ride = (kind, from_stop_id, to_stop_id, None, secs + footpath_secs) if footpath_secs is not None else None
+                else:
+                    # changing platforms after a trip on a contracted station, but not after a walk
+                    if feed.stop_change_secs is not None and len(rides) > 0 and rides[-1][0] == "trip":
+                        secs += int(feed.stop_change_secs[stop_indices[from_stop_id]])
+                    ride = get_earliest_ride(feed, from_stop_id, to_stop_id, secs, available_trip_mask)
+                if ride is None:
+                    break
+                rides.append(ride)
+                secs = ride[-1]
+            else:
+                time_to_reach = secs - request_parameters.specified_secs
+                if request_parameters.max_travel_secs is not None and time_to_reach > request_parameters.max_travel_secs:
+                    continue
+                if fastest_way is None or (time_to_reach, len(rides)) < (fastest_way[0], len(fastest_way[1])):
+                    fastest_way = (time_to_reach, rides)
+
+        if fastest_way is None:
+            return None
+        time_to_reach, rides = fastest_way
+        routing_path, routing_path_optional = get_ride_routing_path(feed, rides)
+        return {
+            "time_to_reach": time_to_reach,
+            "routing_path": routing_path,
+            "routing_path_optional": routing_path_optional,
+            "preceding": [ride[3] for ride in rides if ride[3] is not None],
+            "stop_id": routing_path[-1],
+        }
+
+
+def get_earliest_ride(
+    feed: Feed,
+    from_stop_id: str,
+    to_stop_id: str,
+    bound_secs: int,
+    available_trip_mask: np.ndarray
+) -> Optional[Tuple]:
+    """Return the trip leg arriving earliest at to_stop_id after boarding at from_stop_id no earlier than bound_secs as
+    ("trip", from_stop_id, to_stop_id, trip instance, from row, to row, departure offset, arrival secs)"""
+    stop_time_trip_indices = feed.get_stop_time_trip_indices()
+    from_rows = feed.get_stop_time_rows(from_stop_id)
+    to_rows = feed.get_stop_time_rows(to_stop_id)
+    from_rows = from_rows[available_trip_mask[stop_time_trip_indices[from_rows]]]
+    to_rows = to_rows[available_trip_mask[stop_time_trip_indices[to_rows]]]
+    if len(from_rows) == 0 or len(to_rows) == 0:
+        return None
+
+    # pair rows of the same trip where to_stop_id follows from_stop_id
+    to_order = np.argsort(stop_time_trip_indices[to_rows], kind="stable")
+    to_trip_indices = stop_time_trip_indices[to_rows][to_order]
+    positions = np.minimum(np.searchsorted(to_trip_indices, stop_time_trip_indices[from_rows]), len(to_rows) - 1)
+    is_paired = to_trip_indices[positions] == stop_time_trip_indices[from_rows]
+    from_rows, to_rows = from_rows[is_paired], to_rows[to_order[positions[is_paired]]]
+    is_following = feed.stop_times["stop_sequence"][to_rows] > feed.stop_times["stop_sequence"][from_rows]
+    from_rows, to_rows = from_rows[is_following], to_rows[is_following]
+
+    # frequency-based trips are shifted onto the first instance departing in time
+    offsets = np.zeros(len(from_rows), dtype="int64")
+    is_frequency_trip = feed.get_frequency_trip_mask()[stop_time_trip_indices[from_rows]]
+    for i in np.flatnonzero(is_frequency_trip):
+        departure_secs = feed.get_frequency_departure(stop_time_trip_indices[from_rows[i]], feed.stop_times["departure_time"][from_rows[i]], bound_secs, False)
+        offsets[i] = departure_secs if departure_secs is not None else -np.iinfo(np.int32).max
+    is_boardable = feed.stop_times["departure_time"][from_rows] + offsets >= bound_secs
+    if not is_boardable.any():
+        return None
+    arrival_secs = feed.stop_times["arrival_time"][to_rows].astype("int64") + offsets
+    best = np.flatnonzero(is_boardable)[np.argmin(arrival_secs[is_boardable])]
+    trip_id = feed.stop_times["trip_id"][from_rows[best]]
+    trip_instance_id = f"{trip_id}@{offsets[best]}" if is_frequency_trip[best] else trip_id
+    return ("trip", from_stop_id, to_stop_id, trip_instance_id, from_rows[best], to_rows[best], int(offsets[best]), int(arrival_secs[best]))
+
+
+def get_ride_routing_path(feed: Feed, rides: List[Tuple]) -> Tuple[List[str], np.ndarray]:
+    """routing_path and routing_path_optional of legs, as they are built by run_raptor"""
+    routing_path = []
+    routing_path_optionals = [EMPTY_ROUTING_PATH_OPTIONAL]
+    for ride in rides:
+        if ride[0] == "walk":
+            stop_ids = [ride[1], ride[2]]
+            routing_path_optional = np.array([("walk", 1, ride[1]), ("walk", 2, ride[2])], dtype=EMPTY_ROUTING_PATH_OPTIONAL.dtype)
+        else:
+            from_row, to_row = ride[4], ride[5]
+            stop_times = feed.stop_times[feed.get_trip_stop_time_rows(feed.get_stop_time_trip_indices()[from_row])]
+            stop_times = stop_times[
+                (stop_times["stop_sequence"] >= feed.stop_times["stop_sequence"][from_row])
+                * (stop_times["stop_sequence"] <= feed.stop_times["stop_sequence"][to_row])
+            ]
+            stop_ids = stop_times["stop_id"].tolist()
+            routing_path_optional = stop_times[["trip_id", "stop_sequence", "stop_id"]].astype(EMPTY_ROUTING_PATH_OPTIONAL.dtype)
+        routing_path += stop_ids[1:] if len(routing_path) > 0 and routing_path[-1] == stop_ids[0] else stop_ids
+        routing_path_optionals.append(routing_path_optional)
+    return routing_path, np.concatenate(routing_path_optionals)
+
+
+def get_departure_events(
+    feed: Feed,
+    stop_ids: List[str],
+    departure_start_secs: int,
+    departure_end_secs: int,
+    available_trip_mask: np.ndarray
+) -> List[int]:
+    """Latest departures from stops to catch each trip at them or at stops a footpath away,
+    between which the fastest journey from the stops does not change. The first of them after departure_end_secs
+    is kept too, as journeys departing at the end of the window ride the trips it catches"""
+    access_secs = {stop_id: 0 for stop_id in stop_ids}
+    offsets, footpath_stop_indices, footpath_secs, _ = feed.get_footpaths()
+    stop_indices = feed.get_workspace_pool().stop_indices
+    for stop_id in stop_ids:
+        if stop_id not in stop_indices:
+            continue
+        positions = slice(offsets[stop_indices[stop_id]], offsets[stop_indices[stop_id] + 1])
+        for to_stop_id, secs in zip(feed.stops["stop_id"][footpath_stop_indices[positions]].tolist(), footpath_secs[positions].tolist()):
+            access_secs[to_stop_id] = min(access_secs.get(to_stop_id, secs), secs)
+
+    departure_events = set()
+    stop_time_trip_indices = feed.get_stop_time_trip_indices()
+    is_frequency_trip = feed.get_frequency_trip_mask()
+    for stop_id, secs in access_secs.items():
+        rows = feed.get_stop_time_rows(stop_id)
+        rows = rows[available_trip_mask[stop_time_trip_indices[rows]] * ~is_frequency_trip[stop_time_trip_indices[rows]]]
+        departure_events.update((feed.stop_times["departure_time"][rows].astype("int64") - secs).tolist())
+    next_departure_secs = min((secs for secs in departure_events if secs >= departure_end_secs), default=None)
+    return [secs for secs in departure_events if departure_start_secs <= secs < departure_end_secs or secs == next_departure_secs]
+
+def build_transfer_pattern_index(
+    feed: Feed,
+    hubs: Dict[str, List[str]],
+    specified_date: str,
+    departure_start_secs: int,
+    departure_end_secs: int,
+    departure_interval_secs: int = 600,
+    transfers_limit: int = 3,
+    available_trip_ids: Optional[List[str]] = None,
+    trip_filters: Optional[List[str]] = None
+) -> TransferPatternIndex:
+    """Collect transfer patterns of the fastest journeys between every pair of hubs departing from departure_start_secs
+    until departure_end_secs (exclusive). Journeys depart just in time for every trip near the origin hub, and every
+    departure_interval_secs as well for frequency-based trips"""
+    patterns: Dict[Tuple[str, str], Set[TransferPattern]] = {}
+    pool = feed.get_workspace_pool()
+    available_trip_mask = feed.get_available_trip_mask(datetime.date.fromisoformat(specified_date), available_trip_ids, trip_filters)
+    for origin, origin_stop_ids in hubs.items():
+        departure_events = set(range(departure_start_secs, departure_end_secs, departure_interval_secs))
+        departure_events.update(get_departure_events(feed, origin_stop_ids, departure_start_secs, departure_end_secs, available_trip_mask))
+        for departure_secs in sorted(departure_events):
+            with pool.workspace() as workspace:
+                stop_state = run_raptor(
+                    feed,
+                    origin_stop_ids,
+                    specified_date,
+                    departure_secs,
+                    transfers_limit,
+                    False,
+                    available_trip_ids,
+                    trip_filters=trip_filters,
+                    workspace=workspace
+                )
+                for destination, destination_stop_ids in hubs.items():
+                    if destination == origin:
+                        continue
+                    destinations = stop_state.time_to_reach_to_destinations(destination_stop_ids)
+                    if len(destinations) == 0:
+                        continue
+                    pattern = get_transfer_pattern(min(destinations, key=lambda x: x["time_to_reach"])["routing_path_optional"])
+                    if len(pattern) > 0:
+                        patterns.setdefault((origin, destination), set()).add(pattern)
+
+    return TransferPatternIndex(
+        hubs,
+        {pair: sorted(pair_patterns) for pair, pair_patterns in patterns.items()},
+        specified_date,
+        departure_start_secs,
+        departure_end_secs,
+        transfers_limit,
+        available_trip_ids,
+        trip_filters,
+    )
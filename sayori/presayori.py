@@ -1,14 +1,24 @@
 #%%
 import os
 import io
+import math
+import json
+import hashlib
+import datetime
 import argparse
-from typing import Optional, Sequence
+import inspect
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Optional, Sequence, Tuple
 
 import httpx
+import numpy as np
 import pandas as pd
 import polars as pl
 import zipfile
 
+# bump when the converted output changes, so that batch mode converts cached inputs again
+SAYORI_MODELS_VERSION = 2
+
 def read_csv(fp, has_header:bool = True, new_columns: Optional[Sequence[str]] = None, encoding: str = "utf8"):
     return (
         pl.read_csv(
@@ -99,6 +109,58 @@ def get_stop_times(timetables: pl.DataFrame) -> pl.DataFrame:
     return sayori_stop_times.select("trip_id", "stop_sequence", "stop_id", "arrival_time", "departure_time", "pickup_type", "drop_off_type")
 
 
+def get_frequencies(gtfs_frequencies: Optional[pl.DataFrame] = None) -> pl.DataFrame:
+    """frequenciesの作成"""
+    schema = {
+        "trip_id": pl.Utf8, 
+        "start_time": pl.Int32, 
+        "end_time": pl.Int32, 
+        "headway_secs": pl.Int32, 
+        "exact_times": pl.Int32
+    }
+    if not isinstance(gtfs_frequencies, pl.DataFrame):
+        return pl.DataFrame(schema=schema)
+
+    if "exact_times" not in gtfs_frequencies.columns:
+        gtfs_frequencies = gtfs_frequencies.with_columns(pl.lit(None).cast(pl.Utf8).alias("exact_times"))
+
+    sayori_frequencies = (
+        gtfs_frequencies
+        .select(
+            pl.col("trip_id"),
+            pl.col("start_time").str.split(":"),
+            pl.col("end_time").str.split(":"),
+            pl.col("headway_secs").cast(pl.Int32),
+            pl.col("exact_times").cast(pl.Int32),
+        )
+        .with_columns(
+            (pl.col("start_time").list.get(0).cast(pl.Int32) * 60 * 60 + pl.col("start_time").list.get(1).cast(pl.Int32) * 60 + pl.col("start_time").list.get(2).cast(pl.Int32)).alias("start_time"),
+            (pl.col("end_time").list.get(0).cast(pl.Int32) * 60 * 60 + pl.col("end_time").list.get(1).cast(pl.Int32) * 60 + pl.col("end_time").list.get(2).cast(pl.Int32)).alias("end_time"),
+            pl.when(pl.col("exact_times").is_null()).then(pl.lit(0)).otherwise(pl.col("exact_times")).cast(pl.Int32).alias("exact_times"),
+        )
+    )
+    return sayori_frequencies.select(list(schema.keys()))
+
+def get_frequency_templates(sayori_stop_times: pl.DataFrame, sayori_frequencies: pl.DataFrame) -> pl.DataFrame:
+    """frequency tripのstop_timesを始発からの相対時刻に変換"""
+    # only one template per frequency-based trip is kept and its instances are computed by sayori on search
+    frequency_trip_ids = sayori_frequencies.select("trip_id").unique()
+    first_departures = (
+        sayori_stop_times
+        .join(frequency_trip_ids, on="trip_id", how="semi")
+        .group_by("trip_id")
+        .agg(pl.col("departure_time").min().alias("first_departure_time"))
+    )
+    sayori_stop_times = (
+        sayori_stop_times
+        .join(first_departures, on="trip_id", how="left")
+        .with_columns(
+            (pl.col("arrival_time") - pl.col("first_departure_time").fill_null(0)).cast(pl.Int32).alias("arrival_time"),
+            (pl.col("departure_time") - pl.col("first_departure_time").fill_null(0)).cast(pl.Int32).alias("departure_time"),
+        )
+    )
+    return sayori_stop_times.select("trip_id", "stop_sequence", "stop_id", "arrival_time", "departure_time", "pickup_type", "drop_off_type")
+
 def get_stops(timetables: pl.DataFrame, stop_id_seperator: str = " ") -> pl.DataFrame:
     """stopsの作成"""
     sayori_stops = (
@@ -128,95 +190,61 @@ def get_calendar(
     int_calendar: pl.DataFrame, 
     int_calendar_dates: Optional[pl.DataFrame] = None 
 ) -> pl.DataFrame:
+    """calendarの作成 (サービス×日付のビット行列)"""
 
-    dayofweek = {
-        'monday': 1, 
-        'tuesday': 2, 
-        'wednesday': 3, 
-        'thursday': 4, 
-        'friday': 5, 
-        'saturday': 6, 
-        'sunday': 7
-    }
-
-    sayori_calendar = []
-    for dow_name, dow_num  in dayofweek.items():
-        sayori_calendar.append(
-            int_calendar
-            .filter(pl.col(dow_name) == "1")
-            .with_columns(pl.lit(dow_num).alias("dayofweek"))
-            .select(
-                "service_id",
-                "calendar_date",
-                "dayofweek"
-            )
-        )
-
-    sayori_calendar = pl.concat(sayori_calendar)
-    sayori_calendar = (
-        sayori_calendar
-        .explode("calendar_date")
-        .with_columns(pl.col("calendar_date").dt.weekday().alias("weekday"))
-        .filter(pl.col("dayofweek") == pl.col("weekday"))
-        .select(
-            "service_id",
-            "calendar_date"
-        )
-    )
+    dayofweek = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
 
+    # services having trips
+    service_ids = timetables.select("service_id").unique().sort("service_id")
+    int_calendar = int_calendar.join(service_ids, on = "service_id", how = "semi")
     if isinstance(int_calendar_dates, pl.DataFrame):
-        # Add exception_type 1 dates
-        sayori_calendar = pl.concat([
-            sayori_calendar,
-            (
-                int_calendar_dates
-                .filter(pl.col("exception_type") == "1")
-                .select(
-                    "service_id",
-                    "calendar_date",
-                )
-            )
-        ])
-
-        # Exclude exception_type 2 dates
-        sayori_calendar = (
-            sayori_calendar
-            .join(
-                int_calendar_dates
-                .filter(pl.col("exception_type") == "2")
-                .select(
-                    "service_id",
-                    "calendar_date",
-                ),
-                on = ["service_id", "calendar_date"],
-                how = "anti" 
-            )
-        )
-
-    sayori_calendar = (
-        timetables
-        .select("service_id", "agency_id")
-        .unique()
-        .join(
-            sayori_calendar,
-            on = "service_id"
-        )
+        int_calendar_dates = int_calendar_dates.join(service_ids, on = "service_id", how = "semi")
+    else:
+        int_calendar_dates = pl.DataFrame(schema = {"service_id": pl.Utf8, "calendar_date": pl.Date, "exception_type": pl.Utf8})
+    service_ids = service_ids["service_id"].to_numpy().astype(object)
+
+    # dates as days since 1970-01-01
+    start_days = int_calendar["start_date"].cast(pl.Int32).to_numpy()
+    end_days = int_calendar["end_date"].cast(pl.Int32).to_numpy()
+    exception_days = int_calendar_dates["calendar_date"].cast(pl.Int32).to_numpy()
+    all_days = np.concatenate([start_days, end_days, exception_days])
+    first_day = int(all_days.min()) if len(all_days) > 0 else 0
+    days = np.arange(first_day, int(all_days.max()) + 1 if len(all_days) > 0 else 0)
+
+    # 1970-01-01 is thursday
+    weekdays = (days + 3) % 7
+    runs_on_weekday = int_calendar.select(dayofweek).to_numpy() == "1"
+    active_days = np.zeros((len(service_ids), len(days)), dtype=bool)
+    active_days[np.searchsorted(service_ids, int_calendar["service_id"].to_numpy())] = (
+        runs_on_weekday[:, weekdays]
+        & (days[None, :] >= start_days[:, None])
+        & (days[None, :] <= end_days[:, None])
     )
 
-    sayori_calendar = (
-        sayori_calendar
-        .group_by(["calendar_date", "agency_id"])
-        .agg(pl.col("service_id").alias("service_ids"))
+    # exception_type 1 adds and 2 removes the service on the date
+    rows = np.searchsorted(service_ids, int_calendar_dates["service_id"].to_numpy())
+    columns = exception_days - first_day
+    is_added = int_calendar_dates["exception_type"].to_numpy() == "1"
+    active_days[rows[is_added], columns[is_added]] = True
+    active_days[rows[~is_added], columns[~is_added]] = False
+
+    return pl.DataFrame(
+        {
+            "service_id": service_ids.tolist(),
+            "start_date": [datetime.date(1970, 1, 1) + datetime.timedelta(days=first_day)] * len(service_ids),
+            "active_days": [bits.tobytes() for bits in np.packbits(active_days, axis=1)],
+        },
+        schema = {"service_id": pl.Utf8, "start_date": pl.Date, "active_days": pl.Binary}
     )
 
-    return sayori_calendar.select("calendar_date", "service_ids")
-
 def get_transfers(sayori_stops, min_transfer_time: int = 1):
+    """同一parent_station内の乗換の作成"""
     stops = sayori_stops.select("stop_id", "parent_station")
     
     sayori_transfers = ( 
         stops
         .join(stops, on="parent_station", how="inner")
+        .filter(pl.col("stop_id") != pl.col("stop_id_right"))
         .select(
             pl.col("stop_id").alias("from_stop_id"),
             pl.col("stop_id_right").alias("to_stop_id"),
@@ -226,18 +254,92 @@ def get_transfers(sayori_stops, min_transfer_time: int = 1):
     )
     return sayori_transfers
 
+def get_footpaths(
+    sayori_stops: pl.DataFrame, 
+    max_walking_distance: float = 300, 
+    walking_speed: float = 4.8 / 3.6, 
+    max_footpaths_per_stop: int = 10
+) -> pl.DataFrame:
+    """近接停留所間の徒歩乗換の作成"""
+    earth_radius = 6371008.8
+    stops = sayori_stops.select("stop_id", "stop_lat", "stop_lon").drop_nulls()
+    if len(stops) == 0:
+        return get_transfers(sayori_stops).clear()
+    # longitude cells are sized at the latitude farthest from the equator, where they are the narrowest,
+    # so that no cell is narrower than the walking distance anywhere in the feed
+    ref_cos = max(math.cos(math.radians(stops["stop_lat"].abs().max())), 1e-6)
+
+    # bucket stops into grid cells at least as wide as the walking distance on an equirectangular projection
+    stops = stops.with_columns(
+        (pl.col("stop_lon") * math.pi / 180 * earth_radius * ref_cos / max_walking_distance).floor().cast(pl.Int64).alias("cell_x"),
+        (pl.col("stop_lat") * math.pi / 180 * earth_radius / max_walking_distance).floor().cast(pl.Int64).alias("cell_y"),
+    )
+    offsets = pl.DataFrame(
+        {"offset_x": [dx for dx in (-1, 0, 1) for _ in range(3)], "offset_y": [-1, 0, 1] * 3},
+        schema={"offset_x": pl.Int64, "offset_y": pl.Int64}
+    )
+
+    # only stops in the 3x3 neighbouring cells are compared
+    sayori_footpaths = (
+        stops
+        .join(offsets, how="cross")
+        .select(
+            pl.col("stop_id").alias("from_stop_id"),
+            pl.col("stop_lat").alias("from_stop_lat"),
+            pl.col("stop_lon").alias("from_stop_lon"),
+            (pl.col("cell_x") + pl.col("offset_x")).alias("cell_x"),
+            (pl.col("cell_y") + pl.col("offset_y")).alias("cell_y"),
+        )
+        .join(stops, on=["cell_x", "cell_y"], how="inner")
+        .filter(pl.col("from_stop_id") != pl.col("stop_id"))
+        .with_columns(
+            (
+                2 * earth_radius * (
+                    ((pl.col("stop_lat") - pl.col("from_stop_lat")) * math.pi / 360).sin().pow(2)
+                    + (pl.col("from_stop_lat") * math.pi / 180).cos() * (pl.col("stop_lat") * math.pi / 180).cos()
+                    * ((pl.col("stop_lon") - pl.col("from_stop_lon")) * math.pi / 360).sin().pow(2)
+                ).sqrt().arcsin()
+            ).alias("distance")
+        )
+        .filter(pl.col("distance") <= max_walking_distance)
+        .sort(["from_stop_id", "distance"])
+        .group_by("from_stop_id", maintain_order=True)
+        .head(max_footpaths_per_stop)
+        .select(
+            pl.col("from_stop_id"),
+            pl.col("stop_id").alias("to_stop_id"),
+            pl.lit(0).cast(pl.Int32).alias("transfer_type"),
+            pl.max_horizontal(pl.lit(1), (pl.col("distance") / walking_speed).ceil()).cast(pl.Int32).alias("min_transfer_time"),
+        )
+    )
+    return sayori_footpaths
+
+def merge_transfers(*sayori_transfers: pl.DataFrame, max_transfers_per_stop: Optional[int] = None) -> pl.DataFrame:
+    """乗換の統合"""
+    sayori_transfers = (
+        pl.concat(sayori_transfers)
+        .group_by(["from_stop_id", "to_stop_id"])
+        .agg(
+            pl.col("transfer_type").first(),
+            pl.col("min_transfer_time").min(),
+        )
+        .sort(["from_stop_id", "min_transfer_time", "to_stop_id"])
+    )
+    if max_transfers_per_stop is not None:
+        sayori_transfers = sayori_transfers.group_by("from_stop_id", maintain_order=True).head(max_transfers_per_stop)
+
+    return sayori_transfers.select("from_stop_id", "to_stop_id", "transfer_type", "min_transfer_time")
+
 def read_gtfs_feed(fp: str):
     def read_gtfs_zipfile(file):
         with zipfile.ZipFile(file) as z:
             filenames = [file.filename for file in z.filelist]
-            if "calendar_dates.txt" in filenames:
-                required_feeds = ["agency.txt", "routes.txt", "trips.txt", "stop_times.txt", "stops.txt", "calendar.txt", "calendar_dates.txt"]
-            else:
-                required_feeds = ["agency.txt", "routes.txt", "trips.txt", "stop_times.txt", "stops.txt", "calendar.txt"]
+            required_feeds = ["agency.txt", "routes.txt", "trips.txt", "stop_times.txt", "stops.txt", "calendar.txt"]
+            optional_feeds = ["calendar_dates.txt", "frequencies.txt"]
             
             if set(required_feeds).issubset(set(filenames)):
-                gtfs_feeds = []
-                for filename in required_feeds:
+                gtfs_feeds = {}
+                for filename in required_feeds + [filename for filename in optional_feeds if filename in filenames]:
                     file = z.open(filename, "r")
                     gtfs_feed = pd.read_csv(file, dtype = str)
 
@@ -258,40 +360,60 @@ def read_gtfs_feed(fp: str):
                         if "platform_code" not in cols:
                             gtfs_feed["platform_code"] = None
 
-                    gtfs_feeds.append(pl.from_pandas(gtfs_feed)) 
+                    gtfs_feeds[filename] = pl.from_pandas(gtfs_feed)
             else:
                 missing_feeds = set(required_feeds) - set(filenames)
                 raise FileNotFoundError(f"""Required GTFS feed is missing: {",".join(missing_feeds)}""")
         
-        if "calendar_dates.txt" in filenames:
-            return gtfs_feeds
-        else:
-            return *gtfs_feeds, None
+        # missing optional feeds are returned as None
+        return tuple(gtfs_feeds.get(filename) for filename in required_feeds + optional_feeds)
+
 
+    # zipfile content already read by read_gtfs_content is accepted as well
+    if isinstance(fp, str) and fp.startswith("http"):
+        file = io.BytesIO(read_gtfs_content(fp))
+    else:
+        file = fp
 
+    if zipfile.is_zipfile(file):
+        gtfs_feeds = read_gtfs_zipfile(file)
+    else:
+        raise AttributeError(f"""The specified data is not a zipfile: {fp}""")
+    
+    return gtfs_feeds
+
+
+def read_gtfs_content(fp: str) -> bytes:
+    """GTFSのzipfileの読み込み (ローカル, http)"""
     if fp.startswith("http"):
         req = httpx.get(fp, follow_redirects=True)
         if req.status_code == 200:
-            file = io.BytesIO(req.content)
+            return req.content
         else:
             raise FileNotFoundError(f"Status code {req.status_code} is returned")
-        
-        if zipfile.is_zipfile(file):
-            gtfs_feeds = read_gtfs_zipfile(file)
-        else:
-            raise AttributeError(f"""The specified data is not a zipfile: {fp}""")
-            
     else:
-        if zipfile.is_zipfile(fp):
-            gtfs_feeds = read_gtfs_zipfile(fp)
-        else:
-            raise AttributeError(f"""The specified data is not a zipfile: {fp}""")
-    
-    return gtfs_feeds
+        with open(fp, "rb") as f:
+            return f.read()
+
 
+def get_member_digests(content: bytes) -> Dict[str, str]:
+    """zipfile内の各ファイルのsha256"""
+    with zipfile.ZipFile(io.BytesIO(content)) as z:
+        return {
+            info.filename: hashlib.sha256(z.read(info)).hexdigest()
+            for info in z.infolist() if not info.is_dir()
+        }
 
-def gtfs(filepath, output_path, stop_id_seperator):
-    gtfs_agency, gtfs_routes, gtfs_trips, gtfs_stop_times, gtfs_stops, gtfs_calendar, gtfs_calendar_dates = read_gtfs_feed(filepath)
+
+def gtfs(
+    filepath, 
+    output_path, 
+    stop_id_seperator, 
+    max_walking_distance: float = 300, 
+    walking_speed: float = 4.8 / 3.6, 
+    max_transfers_per_stop: int = 10
+):
+    gtfs_agency, gtfs_routes, gtfs_trips, gtfs_stop_times, gtfs_stops, gtfs_calendar, gtfs_calendar_dates, gtfs_frequencies = read_gtfs_feed(filepath)
 
     intermidiate_timetables = (
         gtfs_trips
@@ -324,11 +446,8 @@ def gtfs(filepath, output_path, stop_id_seperator):
             "friday",
             "saturday",
             "sunday",
-            pl.date_ranges(
-                pl.col("start_date").str.to_date(format="%Y%m%d"),
-                pl.col("end_date").str.to_date(format="%Y%m%d"),
-                "1d"
-            ).alias("calendar_date")
+            pl.col("start_date").str.to_date(format="%Y%m%d"),
+            pl.col("end_date").str.to_date(format="%Y%m%d"),
         )    
     )
 
@@ -346,9 +465,17 @@ def gtfs(filepath, output_path, stop_id_seperator):
     sayori_models["agency"] = get_agency(intermidiate_timetables)
     sayori_models["routes"] = get_routes(intermidiate_timetables)
     sayori_models["trips"] = get_trips(intermidiate_timetables)
-    sayori_models["stop_times"] = get_stop_times(intermidiate_timetables)
+    sayori_models["frequencies"] = get_frequencies(gtfs_frequencies)
+    sayori_models["stop_times"] = get_frequency_templates(get_stop_times(intermidiate_timetables), sayori_models["frequencies"])
     sayori_models["stops"] = get_stops(intermidiate_timetables, stop_id_seperator)
-    sayori_models["transfers"] = get_transfers(sayori_models["stops"], 1)
+    if max_walking_distance > 0:
+        sayori_models["transfers"] = merge_transfers(
+            get_transfers(sayori_models["stops"], 1),
+            get_footpaths(sayori_models["stops"], max_walking_distance, walking_speed, max_transfers_per_stop),
+            max_transfers_per_stop = max_transfers_per_stop
+        )
+    else:
+        sayori_models["transfers"] = merge_transfers(get_transfers(sayori_models["stops"], 1))
 
     if isinstance(gtfs_calendar_dates, pl.DataFrame):
         sayori_models["calendar"] = get_calendar(intermidiate_timetables, intermidiate_calendar, intermidiate_calendar_dates)
@@ -361,18 +488,122 @@ def gtfs(filepath, output_path, stop_id_seperator):
         sayori_model.write_parquet(f"{output_path}sayori_models/sayori_{sayori_model_name}.parquet")
 
 
+def get_options_digest(options: Dict) -> str:
+    """変換パラメータ (省略された既定値を含む) とSAYORI_MODELS_VERSIONのsha256"""
+    arguments = inspect.signature(gtfs).bind_partial(**options)
+    # parameters left to their defaults are keyed as well, so that changing a default converts inputs again
+    arguments.apply_defaults()
+    parameters = {name: value for name, value in arguments.arguments.items() if name not in ("filepath", "output_path")}
+    return hashlib.sha256(json.dumps({"version": SAYORI_MODELS_VERSION, "options": parameters}, sort_keys=True).encode()).hexdigest()
+
+
+def gtfs_if_changed(filepath: str, output_path: str, options: Dict, cache_entry: Optional[Dict] = None) -> Tuple[Dict, bool]:
+    """GTFSが前回の変換から変更されている場合のみ変換。新しいキャッシュと変換の有無を返す"""
+    content = read_gtfs_content(filepath)
+    zip_digest = hashlib.sha256(content).hexdigest()
+    options_digest = get_options_digest(options)
+    # entries of older caches have no options_sha256 and are converted again
+    is_cached = (
+        cache_entry is not None
+        and cache_entry.get("options_sha256") == options_digest
+        and os.path.exists(f"{output_path}sayori_models/")
+    )
+    if is_cached and cache_entry["zip_sha256"] == zip_digest:
+        return cache_entry, False
+
+    # a zipfile rebuilt from the same files (e.g. new timestamps) is not converted again
+    member_digests = get_member_digests(content)
+    new_cache_entry = {
+        "version": SAYORI_MODELS_VERSION,
+        "options": options,
+        "options_sha256": options_digest,
+        "zip_sha256": zip_digest,
+        "member_sha256": member_digests,
+    }
+    if is_cached and cache_entry["member_sha256"] == member_digests:
+        return new_cache_entry, False
+
+    gtfs(io.BytesIO(content), output_path, **options)
+    return new_cache_entry, True
+
+
+def gtfs_batch(
+    filepaths: Sequence[str], 
+    output_path: str, 
+    stop_id_seperator, 
+    max_walking_distance: float = 300, 
+    walking_speed: float = 4.8 / 3.6, 
+    max_transfers_per_stop: int = 10,
+    max_workers: Optional[int] = None
+) -> Dict[str, bool]:
+    """複数のGTFSの並列変換。{output_path}{zipfile名}/sayori_models/ に出力し、変更のないGTFSはスキップ"""
+    options = {
+        "stop_id_seperator": stop_id_seperator,
+        "max_walking_distance": max_walking_distance,
+        "walking_speed": walking_speed,
+        "max_transfers_per_stop": max_transfers_per_stop,
+    }
+    output_paths = {
+        filepath: f"{output_path}{os.path.splitext(os.path.basename(filepath.split('?')[0]))[0]}/"
+        for filepath in filepaths
+    }
+    if len(set(output_paths.values())) < len(output_paths):
+        raise ValueError("GTFS zipfiles should have distinct names in batch mode")
+
+    # digests of the last conversion of each input
+    cache_path = f"{output_path}presayori_cache.json"
+    cache = {}
+    if os.path.exists(cache_path):
+        with open(cache_path) as f:
+            cache = json.load(f)
+
+    converted = {}
+    errors = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(gtfs_if_changed, filepath, output_paths[filepath], options, cache.get(filepath)): filepath
+            for filepath in output_paths
+        }
+        for future in as_completed(futures):
+            filepath = futures[future]
+            try:
+                cache[filepath], converted[filepath] = future.result()
+            except Exception as e:
+                # the previous conversion is converted again next time
+                cache.pop(filepath, None)
+                errors[filepath] = e
+            # the cache is saved on every completion not to lose the finished conversions
+            with open(f"{cache_path}.tmp", "w") as f:
+                json.dump(cache, f, indent=2)
+            os.replace(f"{cache_path}.tmp", cache_path)
+
+    if len(errors) > 0:
+        raise RuntimeError("Failed to convert: " + ", ".join(f"{filepath} ({e!r})" for filepath, e in errors.items()))
+    return converted
+
+
 #%%
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="""pre_sayori__gtfs is a file conversion script for sayori""")
-    parser.add_argument("filepath", help="""Set a GTFS zipfile path  e.g.) ./demo/input_data/ToeiBus-GTFS.zip """)
+    parser.add_argument("filepath", nargs="+", help="""Set GTFS zipfile paths. Several zipfiles are converted in batch mode  e.g.) ./demo/input_data/ToeiBus-GTFS.zip """)
     parser.add_argument("output_path", help="""Set a converted data output path  e.g.) ./demo/ """)
     parser.add_argument("--stop_id_seperator", help="""Set stop_id seperator string  e.g.) - """)
+    parser.add_argument("--max_walking_distance", type=float, default=300, help="""Set an upper limit of walking transfer distance in meters. 0 disables walking transfers between stations  e.g.) 300 """)
+    parser.add_argument("--walking_speed", type=float, default=4.8 / 3.6, help="""Set walking speed in meters per second  e.g.) 1.33 """)
+    parser.add_argument("--max_transfers_per_stop", type=int, default=10, help="""Set an upper limit of transfers from each stop  e.g.) 10 """)
+    parser.add_argument("--batch", action="store_true", help="""Convert each zipfile into {output_path}{zipfile name}/ concurrently, skipping unchanged zipfiles. Implied by several zipfiles """)
+    parser.add_argument("--max_workers", type=int, default=None, help="""Set the number of processes in batch mode  e.g.) 4 """)
     args = parser.parse_args()
 
     filepath = args.filepath
     output_path = args.output_path
     stop_id_seperator = args.stop_id_seperator
 
-    gtfs(filepath, output_path, stop_id_seperator)
+    if args.batch or len(filepath) > 1:
+        converted = gtfs_batch(filepath, output_path, stop_id_seperator, args.max_walking_distance, args.walking_speed, args.max_transfers_per_stop, args.max_workers)
+        for fp, is_converted in converted.items():
+            print(f"{'converted' if is_converted else 'unchanged'}: {fp}")
+    else:
+        gtfs(filepath[0], output_path, stop_id_seperator, args.max_walking_distance, args.walking_speed, args.max_transfers_per_stop)
 
 # %%
\ No newline at end of file
@@ -2,66 +2,157 @@
 # %%
 import datetime
 import time
+import threading
 import numpy as np
 
-from typing import List, Dict, Optional, Union
-from .models import TimeToStop, RequestParameter, Feed, RequestParameterIsochrones
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple, Union
+from .models import TimeToStop, RequestParameter, Feed, RequestParameterIsochrones, Coordinate
+from .workspace import QueryWorkspace, UNREACHED
+
+if TYPE_CHECKING:
+    from .patterns import TransferPatternIndex
+
+EMPTY_ROUTING_PATH_OPTIONAL = np.empty(0, dtype=[("trip_id", "object"), ("stop_sequence", "int64"), ("stop_id", "object")])
+
+class SearchCancelled(Exception):
+    """Raised in a search whose cancel_event is set"""
 
 class StopAccessStates:
-    def __init__(self, from_stop_ids: List[str], specified_date: str, specified_secs: int) -> None:
+    def __init__(
+        self,
+        from_stop_ids: List[str],
+        specified_date: str,
+        specified_secs: int,
+        workspace: QueryWorkspace,
+        from_stop_access_secs: Optional[Dict[str, int]] = None,
+        track_paths: bool = True,
+        max_travel_secs: Optional[int] = None
+    ) -> None:
         self.from_stop_ids: List[str] = from_stop_ids
         self.specified_date: datetime.date = datetime.date.fromisoformat(specified_date)
         self.specified_secs: int = specified_secs
-        self.time_to_stops: Dict[str, TimeToStop] = {origin_stop_id: TimeToStop() for origin_stop_id in from_stop_ids}
-        self.already_processed_xfers: List[str] = []
+        # routing paths are not built when only times to reach are needed
+        self.track_paths: bool = track_paths
+        # stops beyond max_travel_secs are left unreached
+        self.max_travel_secs: Optional[int] = max_travel_secs
+        # labels are kept in the preallocated buffers of the workspace
+        self.workspace: QueryWorkspace = workspace
+        self.stop_indices: Dict[str, int] = workspace.stop_indices
+        # origin stops are seeded with their walking time when accessed from a coordinate
+        from_stop_access_secs = from_stop_access_secs or {}
+        # unknown stop ids are ignored
+        from_stop_ids = [stop_id for stop_id in from_stop_ids if stop_id in self.stop_indices]
+        for origin_stop_id in from_stop_ids:
+            self.create_time_to_reach(origin_stop_id, from_stop_access_secs.get(origin_stop_id, 0))
+            # origins are walked from as well as stops reached by trips
+            self.workspace.trip_time_to_reach[self.stop_indices[origin_stop_id]] = from_stop_access_secs.get(origin_stop_id, 0)
         self.just_updated_stops: List[str] = from_stop_ids.copy()
+        # labels of stops reached earlier by trips in this round, walked from even when a walk reached them earlier still.
+        # the dict is held by the workspace and cleared after each round rather than allocated again
+        self.trip_arrivals: Dict[str, Tuple[int, List[str], np.ndarray, List[str]]] = workspace.trip_arrivals
+
+    @property
+    def time_to_stops(self) -> Dict[str, TimeToStop]:
+        return {stop_id: self.get_time_to_stop(stop_id) for stop_id in self.get_all_stops()}
 
     def get_all_stops(self) -> List[str]:
-        return list(self.time_to_stops.keys())
-    
+        return self.workspace.stop_ids[self.workspace.reached_stops].tolist()
+
+    def is_reached(self, stop_id: str) -> bool:
+        return self.workspace.time_to_reach[self.stop_indices[stop_id]] != UNREACHED
+
+    def is_improved(self, stop_id: str, time_to_reach: Union[int, float]) -> bool:
+        if self.max_travel_secs is not None and time_to_reach > self.max_travel_secs:
+            return False
+        return self.workspace.time_to_reach[self.stop_indices[stop_id]] > time_to_reach
+
+    def get_time_to_stop(self, stop_id: str) -> TimeToStop:
+        return TimeToStop(
+            time_to_reach=self.get_time_to_reach(stop_id),
+            routing_path=self.get_routing_path(stop_id),
+            routing_path_optional=self.get_routing_path_optional(stop_id),
+            preceding=self.get_preceding(stop_id),
+        )
+
     def get_preceding(self, stop_id: str) -> List[str]:
-        return self.time_to_stops[stop_id].preceding
+        return self.workspace.precedings[self.stop_indices[stop_id]]
 
     def get_time_to_reach(self, stop_id: str) -> int:
-        return self.time_to_stops[stop_id].time_to_reach
+        return int(self.workspace.time_to_reach[self.stop_indices[stop_id]])
 
     def get_routing_path(self, stop_id: str) -> List[str]:
-        return self.time_to_stops[stop_id].routing_path
+        return self.workspace.routing_paths[self.stop_indices[stop_id]]
     
     def get_routing_path_optional(self, stop_id: str) -> np.array:
-        return self.time_to_stops[stop_id].routing_path_optional
+        return self.workspace.routing_path_optionals[self.stop_indices[stop_id]]
     
     def get_last_trip_id(self, stop_id:str) -> Optional[str]:
         if len(self.get_preceding(stop_id)) > 0:
             return self.get_preceding(stop_id)[-1] 
         else:
             return None
-    
-    def time_to_reach_to_destinations(self, destination_stop_ids: List[str]):
+
+    def is_reached_by_trip(self, stop_id: str) -> bool:
+        return bool(self.workspace.reached_by_trip[self.stop_indices[stop_id]])
+
+    def is_trip_improved(self, stop_id: str, time_to_reach: Union[int, float]) -> bool:
+        if self.max_travel_secs is not None and time_to_reach > self.max_travel_secs:
+            return False
+        return self.workspace.trip_time_to_reach[self.stop_indices[stop_id]] > time_to_reach
+
+    def update_trip_arrival(self, stop_id: str, time_to_reach: int, routing_path: List[str], routing_path_optional: np.ndarray, preceding_path: List[str]) -> None:
+        self.workspace.trip_time_to_reach[self.stop_indices[stop_id]] = time_to_reach
+        self.trip_arrivals[stop_id] = (time_to_reach, routing_path, routing_path_optional, preceding_path)
+        return None
+
+    def clear_trip_arrivals(self) -> None:
+        self.trip_arrivals.clear()
+
+    def pop_marked_stops(self) -> List[str]:
+        # stops improved since the last call, which are scanned in the next round
+        marked_stops = np.flatnonzero(self.workspace.marked)
+        self.workspace.marked[marked_stops] = False
+        return self.workspace.stop_ids[marked_stops].tolist()
+
+    def time_to_reach_to_destinations(self, destination_stop_ids: List[str], egress_secs: Optional[Dict[str, int]] = None):
+        # walking time from a destination stop to a destination coordinate is added on top
+        egress_secs = egress_secs or {}
         return [
-            time_to_stop.dict() | ({"stop_id": stop_id}) \
-                for stop_id, time_to_stop in self.time_to_stops.items() \
-                    if stop_id in destination_stop_ids
+            {
+                "time_to_reach": self.get_time_to_reach(stop_id) + egress_secs.get(stop_id, 0),
+                "routing_path": self.get_routing_path(stop_id),
+                "routing_path_optional": self.get_routing_path_optional(stop_id),
+                "preceding": self.get_preceding(stop_id),
+                "stop_id": stop_id,
+            }
+            for stop_id in dict.fromkeys(destination_stop_ids)
+            if stop_id in self.stop_indices and self.is_reached(stop_id)
         ]
         
     def create_time_to_reach(self, stop_id: str, time_to_reach: int) -> None:
-        self.time_to_stops[stop_id] = TimeToStop(time_to_reach=time_to_reach)
+        stop_index = self.stop_indices[stop_id]
+        if self.workspace.time_to_reach[stop_index] == UNREACHED:
+            self.workspace.reached_stops.append(stop_index)
+        self.workspace.time_to_reach[stop_index] = time_to_reach
+        self.workspace.routing_paths[stop_index] = []
+        self.workspace.routing_path_optionals[stop_index] = EMPTY_ROUTING_PATH_OPTIONAL
+        self.workspace.precedings[stop_index] = []
         return None
 
     def update_time_to_reach(self, stop_id: str, time_to_reach: int) -> None:
-        self.time_to_stops[stop_id].time_to_reach = time_to_reach
+        self.workspace.time_to_reach[self.stop_indices[stop_id]] = time_to_reach
         return None
 
     def update_preceding_path(self, stop_id: str, preceding_path: List[str]) -> None:
-        self.time_to_stops[stop_id].preceding = preceding_path
+        self.workspace.precedings[self.stop_indices[stop_id]] = preceding_path
         return None
 
     def update_path(self, stop_id: str, routing_path: List[str]) -> None:
-        self.time_to_stops[stop_id].routing_path = routing_path
+        self.workspace.routing_paths[self.stop_indices[stop_id]] = routing_path
         return None
 
     def update_path_optional(self, stop_id: str, routing_path_optional: np.array) -> None:
-        self.time_to_stops[stop_id].routing_path_optional = routing_path_optional
+        self.workspace.routing_path_optionals[self.stop_indices[stop_id]] = routing_path_optional
         return None
     
     def update_stop_access_state(
@@ -75,7 +166,9 @@ class StopAccessStates:
     ) -> bool:
         # initialize return object
         did_update = False
-        if stop_id in self.get_all_stops():
+        if self.max_travel_secs is not None and time_to_reach > self.max_travel_secs:
+            pass
+        elif self.is_reached(stop_id):
             if self.get_time_to_reach(stop_id) > time_to_reach:
                 # update the stop access attributes
                 self.update_time_to_reach(stop_id, time_to_reach)
@@ -85,167 +178,258 @@ class StopAccessStates:
             did_update = True
 
         if did_update:
+            self.workspace.marked[self.stop_indices[stop_id]] = True
+            self.workspace.reached_by_trip[self.stop_indices[stop_id]] = trip_id is not None
             self.update_path(stop_id, routing_path)
             self.update_path_optional(stop_id, routing_path_optional)
-            # override if a preceding path is provided
-            if preceding_path:
-                self.update_preceding_path(stop_id, preceding_path)
+            # override if a preceding path is provided, even an empty one of an origin, copying it not to share the list between stops
+            if preceding_path is not None:
+                self.update_preceding_path(stop_id, list(preceding_path))
             # add current trip id to the path of trips taken, avoiding dupes
             if trip_id is not None \
                 and (len(self.get_preceding(stop_id)) == 0 or trip_id != self.get_preceding(stop_id)[-1]):
-                self.time_to_stops[stop_id].preceding.append(trip_id)
+                self.update_preceding_path(stop_id, self.get_preceding(stop_id) + [trip_id])
             
         return did_update
 
 
+def get_boarding_bound_secs(stop_state: StopAccessStates, feed: Feed, stop_id: str, is_reverse_search: bool) -> int:
+    # trips at a stop can only be boarded after the stop itself is reached, changing platforms after a trip on a contracted station.
+    # a station reached by a walk is not charged again, as the walk between stations already ends at a platform
+    secs = stop_state.get_time_to_reach(stop_id)
+    if feed.stop_change_secs is not None and stop_state.is_reached_by_trip(stop_id):
+        secs += int(feed.stop_change_secs[stop_state.stop_indices[stop_id]])
+    if is_reverse_search:
+        return stop_state.specified_secs - secs
+    else:
+        return stop_state.specified_secs + secs
+
+def get_trip_instance_id(trip_id: str, departure_secs: int) -> str:
+    # instances of a frequency-based trip share its trip_id, so they are told apart by departure
+    return f"{trip_id}@{departure_secs}"
+
+def get_stop_time_window_mask(
+    feed: Feed,
+    available_trip_mask: np.ndarray,
+    specified_secs: int,
+    is_reverse_search: bool,
+    max_travel_secs: Optional[int] = None
+) -> np.ndarray:
+    """Mask stop_times rows of usable trips which can be ridden between specified_secs and max_travel_secs after
+    (before in reverse search). Rows outside the window are never boarded nor improve any stop, so results are the same"""
+    stop_times = feed.stop_times
+    if is_reverse_search:
+        earliest_secs = specified_secs - max_travel_secs if max_travel_secs is not None else -np.inf
+        latest_secs = specified_secs
+    else:
+        earliest_secs = specified_secs
+        latest_secs = specified_secs + max_travel_secs if max_travel_secs is not None else np.inf
+    in_window = (stop_times["departure_time"] >= earliest_secs) * (stop_times["arrival_time"] <= latest_secs)
+
+    # rows of frequency-based trips are relative to the first departure of each instance.
+    # trips are told apart by the trip index of each row built by compile, not by comparing trip_ids
+    stop_time_trip_indices = feed.get_stop_time_trip_indices()
+    frequency_rows = np.flatnonzero(feed.get_frequency_trip_mask()[stop_time_trip_indices])
+    if len(frequency_rows) > 0:
+        offsets, order = feed.get_trip_frequency_order()
+        frequency_trip_indices = np.repeat(np.arange(len(feed.trips)), np.diff(offsets))
+        first_departures = np.full(len(feed.trips), np.iinfo(np.int64).max, dtype="int64")
+        np.minimum.at(first_departures, frequency_trip_indices, feed.frequencies["start_time"][order])
+        last_departures = np.full(len(feed.trips), np.iinfo(np.int64).min, dtype="int64")
+        np.maximum.at(last_departures, frequency_trip_indices, feed.frequencies["end_time"][order] - 1)
+        trip_indices = stop_time_trip_indices[frequency_rows]
+        in_window[frequency_rows] = (
+            (stop_times["departure_time"][frequency_rows] + last_departures[trip_indices] >= earliest_secs)
+            * (stop_times["arrival_time"][frequency_rows] + first_departures[trip_indices] <= latest_secs)
+        )
+
+    # only trips running on the date and passing trip filters are considered
+    return available_trip_mask[stop_time_trip_indices] * in_window
+
 def stop_times_for_kth_trip(
     stop_state: StopAccessStates,
     feed: Feed,
     is_reverse_search: bool,
-    available_trip_ids: Optional[List[str]]
+    in_window: np.ndarray
 ) -> None:
-    # get service_id 
-    available_trips = feed.get_available_trips(stop_state.specified_date)
-    trip_stop_pairings = {}
+    # in_window masks the rows of the timetable usable in this search (see get_stop_time_window_mask).
+    # rows are looked up in the indices of stop_times by stop and by trip, instead of scanning stop_times
+    # frequency-based trips are stored as a single template relative to its first departure
+    is_frequency_trip = feed.get_frequency_trip_mask()
+    stop_times = feed.stop_times
+    stop_time_trip_indices = feed.get_stop_time_trip_indices()
+    trip_stop_pairings: Dict[int, List[str]] = {}
     for ref_stop_id in stop_state.just_updated_stops:
         # find all trips already related to this stop
         associated_trips: List[str] = stop_state.get_preceding(ref_stop_id)
+        bound_secs = get_boarding_bound_secs(stop_state, feed, ref_stop_id, is_reverse_search)
+        rows = feed.get_stop_time_rows(ref_stop_id)
+        rows = rows[in_window[rows]]
         # find all qualifying trips assocaited with this stop
-        if is_reverse_search:
-            related_trips = feed.stop_times[(feed.stop_times["stop_id"] == ref_stop_id) * (feed.stop_times["arrival_time"] <= stop_state.specified_secs)]["trip_id"]
-        else:
-            related_trips = feed.stop_times[(feed.stop_times["stop_id"] == ref_stop_id) * (feed.stop_times["departure_time"] >= stop_state.specified_secs)]["trip_id"]
-        # find potential trips intersecting available or usable trip_ids
-        if isinstance(available_trip_ids, list):
-            potential_trips = set(related_trips) & set(available_trip_ids)
-        else:
-            potential_trips = set(related_trips) & set(available_trips)
-        
-        for potential_trip in potential_trips:
+        for trip_index, trip_id, arrival_time, departure_time in zip(stop_time_trip_indices[rows].tolist(), stop_times["trip_id"][rows].tolist(), stop_times["arrival_time"][rows].tolist(), stop_times["departure_time"][rows].tolist()):
+            if is_frequency_trip[trip_index]:
+                # frequency-based trips qualify when any of its instances serves this stop in time
+                departure_secs = feed.get_frequency_departure(trip_index, arrival_time if is_reverse_search else departure_time, bound_secs, is_reverse_search)
+                if departure_secs is None or get_trip_instance_id(trip_id, departure_secs) in associated_trips:
+                    continue
+            elif (arrival_time > bound_secs if is_reverse_search else departure_time < bound_secs):
+                continue
             # pass on trips that are already addressed
-            if potential_trip in associated_trips:
+            elif trip_id in associated_trips:
                 continue
-                
-            if potential_trip in trip_stop_pairings.keys():
-                trip_stop_pairings[potential_trip].append(ref_stop_id)
-            else:
-                trip_stop_pairings[potential_trip] = [ref_stop_id]
-
-    # iterate through trips with grouped stops in them
-    for trip_id in trip_stop_pairings:
-        stop_ids = trip_stop_pairings[trip_id]
 
-        # get all the stop time arrivals for that trip
-        stop_times_sub = feed.stop_times[(feed.stop_times["trip_id"] == trip_id)]
-        stop_times_sub = stop_times_sub[stop_times_sub["stop_sequence"].argsort()]
+            stop_ids = trip_stop_pairings.setdefault(trip_index, [])
+            if ref_stop_id not in stop_ids[-1:]:
+                stop_ids.append(ref_stop_id)
 
-        # find all stop ids that are in this stop ordering and pick last on route path
-        target_stops = stop_times_sub[np.isin(stop_times_sub["stop_id"], stop_ids)]
-        if is_reverse_search:
-            target_stops = target_stops[target_stops["stop_sequence"].argsort()[::-1]]    
-        else:
-            target_stops = target_stops[target_stops["stop_sequence"].argsort()]
-
-        # get the "hop on" point
-        from_here = target_stops[-1]       
-        ref_stop_id = from_here["stop_id"]
-        # are we continuing from some previous path of trips?
-        preceding_path = stop_state.get_preceding(ref_stop_id)
-        # how long it took to get to the stop so far (0 for start node)
-        baseline_cost = stop_state.get_time_to_reach(ref_stop_id)
-        # get all following stops
-        if is_reverse_search:
-            stop_times_after = stop_times_sub[stop_times_sub["stop_sequence"] <= from_here["stop_sequence"]]
-        else:
-            stop_times_after = stop_times_sub[stop_times_sub["stop_sequence"] >= from_here["stop_sequence"]]
-
-        # for all following stops, calculate time to reach
-        for departure_time, arrive_time, arrive_stop_id, arrive_stop_sequence in zip(stop_times_after["departure_time"], stop_times_after["arrival_time"], stop_times_after["stop_id"], stop_times_after["stop_sequence"]):
-            # time to reach is diff from start time to arrival (plus any baseline cost)
-            if is_reverse_search:
-                arrive_time_adjusted = stop_state.specified_secs - departure_time + baseline_cost
-                # get current routing path and combine preceding path
-                current_routing_path = stop_times_after[(stop_times_after["stop_sequence"] >= arrive_stop_sequence)]["stop_id"].tolist()    
-                current_routing_path_optional = stop_times_after[(stop_times_after["stop_sequence"] >= arrive_stop_sequence)][["trip_id", "stop_sequence", "stop_id"]]
-            else:
-                arrive_time_adjusted = arrive_time - stop_state.specified_secs + baseline_cost
-                # get current routing path and combine preceding path
-                current_routing_path = stop_times_after[(stop_times_after["stop_sequence"] <= arrive_stop_sequence)]["stop_id"].tolist()
-                current_routing_path_optional = stop_times_after[(stop_times_after["stop_sequence"] <= arrive_stop_sequence)][["trip_id", "stop_sequence", "stop_id"]]
-            
-            # append current routing path to stopstate
-            if len(stop_state.get_routing_path(ref_stop_id)) == 0:
-                routing_path = stop_state.get_routing_path(ref_stop_id) + current_routing_path
-                routing_path_optional = np.concatenate([stop_state.get_routing_path_optional(ref_stop_id), current_routing_path_optional]) 
-            else:
+    # iterate through trips with grouped stops in them
+    for trip_index, stop_ids in trip_stop_pairings.items():
+        # get all the stop time arrivals for that trip, in order of stop_sequence
+        rows = feed.get_trip_stop_time_rows(trip_index)
+        rows = rows[in_window[rows]]
+        trip_id = stop_times["trip_id"][rows[0]]
+        route_stop_ids = stop_times["stop_id"][rows].tolist()
+        arrival_times = stop_times["arrival_time"][rows].tolist()
+        departure_times = stop_times["departure_time"][rows].tolist()
+
+        # find all positions of stop ids that are in this stop ordering, in the order of travel
+        travel_positions = range(len(rows) - 1, -1, -1) if is_reverse_search else range(len(rows))
+        target_positions = [position for position in travel_positions if route_stop_ids[position] in stop_ids]
+
+        # the trip is boarded at the first stop on route path, as it reaches every following stop at the same time.
+        # instances of a frequency-based trip differ by stop, so each stop boards its own instance
+        for from_here in (target_positions if is_frequency_trip[trip_index] else target_positions[:1]):
+            # get the "hop on" point
+            ref_stop_id = route_stop_ids[from_here]
+            # are we continuing from some previous path of trips?
+            preceding_path = stop_state.get_preceding(ref_stop_id)
+            # shift the template of a frequency-based trip onto the instance boarded at the "hop on" point
+            trip_instance_id, instance_secs = trip_id, 0
+            if is_frequency_trip[trip_index]:
+                bound_secs = get_boarding_bound_secs(stop_state, feed, ref_stop_id, is_reverse_search)
+                template_secs = arrival_times[from_here] if is_reverse_search else departure_times[from_here]
+                instance_secs = feed.get_frequency_departure(trip_index, template_secs, bound_secs, is_reverse_search)
+                if instance_secs is None:
+                    continue
+                trip_instance_id = get_trip_instance_id(trip_id, instance_secs)
+            # the "hop on" point itself is not relaxed, as a trip dwelling there arrives before the rider
+            boarding_time_to_reach = stop_state.get_time_to_reach(ref_stop_id)
+
+            # for all following stops, calculate time to reach
+            for position in (range(from_here - 1, -1, -1) if is_reverse_search else range(from_here + 1, len(rows))):
+                arrive_stop_id = route_stop_ids[position]
+                # time to reach is diff from start time to arrival, which already covers the cost to the boarding stop
                 if is_reverse_search:
-                    routing_path = current_routing_path[:-1] + stop_state.get_routing_path(ref_stop_id)
-                    routing_path_optional = np.concatenate([current_routing_path_optional, stop_state.get_routing_path_optional(ref_stop_id)])
+                    arrive_time_adjusted = stop_state.specified_secs - (departure_times[position] + instance_secs)
                 else:
-                    routing_path = stop_state.get_routing_path(ref_stop_id) + current_routing_path[1:]
-                    routing_path_optional = np.concatenate([stop_state.get_routing_path_optional(ref_stop_id), current_routing_path_optional])
-
-            stop_state.update_stop_access_state(
-                arrive_stop_id, 
-                arrive_time_adjusted,
-                routing_path,
-                routing_path_optional,
-                trip_id,
-                preceding_path
-            )
+                    arrive_time_adjusted = arrival_times[position] + instance_secs - stop_state.specified_secs
+                # a trip never reaches a stop before its "hop on" point is reached
+                if arrive_time_adjusted < boarding_time_to_reach:
+                    continue
+                # paths are built only for improved stops, or stops reached earlier by trips to walk from them
+                is_improved = stop_state.is_improved(arrive_stop_id, arrive_time_adjusted)
+                if not is_improved and not stop_state.is_trip_improved(arrive_stop_id, arrive_time_adjusted):
+                    continue
+                if not stop_state.track_paths:
+                    routing_path, routing_path_optional = [], EMPTY_ROUTING_PATH_OPTIONAL
+                else:
+                    # get current routing path and combine preceding path, with the "hop on" point
+                    path_positions = slice(position, from_here + 1) if is_reverse_search else slice(from_here, position + 1)
+                    current_routing_path = route_stop_ids[path_positions]
+                    current_routing_path_optional = stop_times[rows[path_positions]][["trip_id", "stop_sequence", "stop_id"]]
+
+                # append current routing path to stopstate
+                if not stop_state.track_paths:
+                    pass
+                elif len(stop_state.get_routing_path(ref_stop_id)) == 0:
+                    routing_path = stop_state.get_routing_path(ref_stop_id) + current_routing_path
+                    routing_path_optional = np.concatenate([stop_state.get_routing_path_optional(ref_stop_id), current_routing_path_optional]) 
+                else:
+                    if is_reverse_search:
+                        routing_path = current_routing_path[:-1] + stop_state.get_routing_path(ref_stop_id)
+                        routing_path_optional = np.concatenate([current_routing_path_optional, stop_state.get_routing_path_optional(ref_stop_id)])
+                    else:
+                        routing_path = stop_state.get_routing_path(ref_stop_id) + current_routing_path[1:]
+                        routing_path_optional = np.concatenate([stop_state.get_routing_path_optional(ref_stop_id), current_routing_path_optional])
+
+                if is_improved:
+                    stop_state.update_stop_access_state(
+                        arrive_stop_id, 
+                        arrive_time_adjusted,
+                        routing_path,
+                        routing_path_optional,
+                        trip_instance_id,
+                        preceding_path
+                    )
+                stop_state.update_trip_arrival(
+                    arrive_stop_id,
+                    arrive_time_adjusted,
+                    routing_path,
+                    routing_path_optional,
+                    preceding_path if preceding_path[-1:] == [trip_instance_id] else preceding_path + [trip_instance_id]
+                )
 
     return None
 
 def add_footpath_transfers(
     stop_state: StopAccessStates,
     feed: Feed,
-    is_reverse_search: bool
+    is_reverse_search: bool,
+    stop_ids: List[str]
 ) -> List[str]:
     # initialize a return object
     updated_stop_ids = []
-    # add in transfers to nearby stops
-    stop_ids = stop_state.get_all_stops()
-    for stop_id in stop_ids:
-        # no need to re-intersect already done stops
-        if stop_id in stop_state.already_processed_xfers:
-            continue
-        
-        last_trip_id = stop_state.get_last_trip_id(stop_id)
+    # footpaths are closed transitively (see Feed.build_footpaths), so walking once from the stops covers chained transfers.
+    # labels are read before walking, so that no walk continues from a stop reached by another walk of this pass.
+    # a stop reached by a trip is walked from its arrival by the trip, which may be later than its label
+    offsets, footpath_stop_indices, footpath_secs, _ = feed.get_footpaths()
+    walking_sources = [
+        (stop_id, *stop_state.trip_arrivals[stop_id]) if stop_id in stop_state.trip_arrivals else
+        (stop_id, stop_state.get_time_to_reach(stop_id), stop_state.get_routing_path(stop_id), stop_state.get_routing_path_optional(stop_id), stop_state.get_preceding(stop_id))
+        for stop_id in stop_ids
+    ]
+    for stop_id, time_to_reach, source_routing_path, source_routing_path_optional, preceding_path in walking_sources:
+        stop_index = stop_state.stop_indices[stop_id]
         # only update if currently inaccessible or faster than currrent option
-        for arrive_stop_id, transfers_cost in zip(feed.transfers[feed.transfers["from_stop_id"] == stop_id]["to_stop_id"], feed.transfers[feed.transfers["from_stop_id"] == stop_id]["min_transfer_time"]):
-            # time to reach new nearby stops is the transfer cost plus arrival at last stop
-            arrive_time_adjusted = stop_state.get_time_to_reach(stop_id)  + transfers_cost
-            routing_path = [stop_id, arrive_stop_id]
+        for position in range(offsets[stop_index], offsets[stop_index + 1]):
+            arrive_stop_id = stop_state.workspace.stop_ids[footpath_stop_indices[position]]
+            # time to reach new nearby stops is the walking cost plus arrival at last stop
+            arrive_time_adjusted = time_to_reach + int(footpath_secs[position])
+            # paths are built only for improved stops
+            if not stop_state.is_improved(arrive_stop_id, arrive_time_adjusted):
+                continue
 
-            if is_reverse_search:
-                routing_path_optional = np.array(
-                    [("walk", 1, arrive_stop_id), ("walk", 2, stop_id)],
-                    dtype=[("trip_id", "object"), ("stop_sequence", "int64"), ("stop_id", "object")]
-                )
+            if not stop_state.track_paths:
+                routing_path, routing_path_optional = [], EMPTY_ROUTING_PATH_OPTIONAL
             else:
+                # stops walked through, in the order of the path
+                routing_path = feed.get_footpath_stop_ids(stop_index, position)
+                if is_reverse_search:
+                    routing_path = routing_path[::-1]
                 routing_path_optional = np.array(
-                    [("walk", 1, stop_id), ("walk", 2, arrive_stop_id)],
+                    [("walk", i + 1, walk_stop_id) for i, walk_stop_id in enumerate(routing_path)],
                     dtype=[("trip_id", "object"), ("stop_sequence", "int64"), ("stop_id", "object")]
                 )
 
-            if len(stop_state.get_routing_path(stop_id)) == 0:
-                routing_path = stop_state.get_routing_path(stop_id) + routing_path
-                routing_path_optional = np.concatenate([stop_state.get_routing_path_optional(stop_id),routing_path_optional]) 
+            if not stop_state.track_paths:
+                pass
+            elif len(source_routing_path) == 0:
+                routing_path = source_routing_path + routing_path
+                routing_path_optional = np.concatenate([source_routing_path_optional,routing_path_optional]) 
             else:
                 if is_reverse_search:
-
-                    routing_path = routing_path[:-1] + stop_state.get_routing_path(stop_id)
-                    routing_path_optional = np.concatenate([routing_path_optional, stop_state.get_routing_path_optional(stop_id)]) 
+                    routing_path = routing_path[:-1] + source_routing_path
+                    routing_path_optional = np.concatenate([routing_path_optional, source_routing_path_optional]) 
                 else:
-                    routing_path = stop_state.get_routing_path(stop_id) + routing_path[1:]
-                    routing_path_optional = np.concatenate([stop_state.get_routing_path_optional(stop_id), routing_path_optional]) 
+                    routing_path = source_routing_path + routing_path[1:]
+                    routing_path_optional = np.concatenate([source_routing_path_optional, routing_path_optional]) 
                                                                                    
             did_update = stop_state.update_stop_access_state(
                 arrive_stop_id,
                 arrive_time_adjusted,
                 routing_path,
                 routing_path_optional,
-                last_trip_id,
+                preceding_path=preceding_path,
             )
             if did_update:
                 updated_stop_ids.append(arrive_stop_id)
@@ -259,38 +443,136 @@ def run_raptor(
     specified_secs: int, 
     transfer_limit: int,
     is_reverse_search: bool,
-    available_trip_ids: Optional[List[str]]
+    available_trip_ids: Optional[List[str]],
+    from_stop_access_secs: Optional[Dict[str, int]] = None,
+    trip_filters: Optional[List[str]] = None,
+    workspace: Optional[QueryWorkspace] = None,
+    track_paths: bool = True,
+    max_travel_secs: Optional[int] = None,
+    cancel_event: Optional[threading.Event] = None
 ) -> StopAccessStates:
-    # initialize lookup with start node taking 0 seconds to reach
-    stop_state = StopAccessStates(from_stop_ids, specified_date, specified_secs)
+    # a workspace taken from feed.get_workspace_pool() should be released after reading the result
+    if workspace is None:
+        workspace = feed.get_workspace_pool().create_workspace()
+    # initialize lookup with start node taking 0 seconds (or its walking time) to reach
+    stop_state = StopAccessStates(from_stop_ids, specified_date, specified_secs, workspace, from_stop_access_secs, track_paths, max_travel_secs)
+    # resolve usable trips and slice the timetable once per search
+    available_trip_mask = feed.get_available_trip_mask(stop_state.specified_date, available_trip_ids, trip_filters)
+    in_window = get_stop_time_window_mask(feed, available_trip_mask, specified_secs, is_reverse_search, max_travel_secs)
 
     # setting transfer limit at 1
     for k in range (transfer_limit + 1):
+        # a cancelled search stops between rounds
+        if cancel_event is not None and cancel_event.is_set():
+            raise SearchCancelled()
         tic = time.perf_counter()
-        stop_times_for_kth_trip(stop_state, feed, is_reverse_search, available_trip_ids)
+        stop_times_for_kth_trip(stop_state, feed, is_reverse_search, in_window)
         toc = time.perf_counter()
 
-        # now add footpath transfers and update
+        # now add footpath transfers and update, once from the stops improved by trips, and from origins in the first round
         tic = time.perf_counter()
-        just_updated_stops = add_footpath_transfers(stop_state, feed, is_reverse_search)
+        improved_stops = stop_state.pop_marked_stops()
+        # origins are walked from, but not scanned again in the next round
+        walking_stops = list(dict.fromkeys((stop_state.just_updated_stops if k == 0 else []) + list(stop_state.trip_arrivals)))
+        add_footpath_transfers(stop_state, feed, is_reverse_search, walking_stops)
+        stop_state.clear_trip_arrivals()
         toc = time.perf_counter()
 
-        stop_state.already_processed_xfers += stop_state.just_updated_stops
-        stop_state.just_updated_stops = just_updated_stops
+        # stops improved either by trips or by footpaths are scanned in the next round
+        stop_state.just_updated_stops = list(dict.fromkeys(improved_stops + stop_state.pop_marked_stops()))
     
     return stop_state
 
 
-def search_p2p_geojson(feed: Feed, req: Dict[str, Optional[Union[str, int]]]) -> Optional[str]:
+def expand_routing_path(feed: Feed, routing_path: List[str], routing_path_optional: np.ndarray):
+    """Map stations on a path of a contracted feed back to the platforms served"""
+    routing_path_optional = routing_path_optional.copy()
+    platform_ids = [
+        feed.get_platform_id(trip_id, stop_sequence) if trip_id != "walk" else None
+        for trip_id, stop_sequence in zip(routing_path_optional["trip_id"], routing_path_optional["stop_sequence"])
+    ]
+    # walking ends take the platform of the trip adjoining them at the same station
+    for i, (platform_id, stop_id) in enumerate(zip(platform_ids, routing_path_optional["stop_id"])):
+        if platform_id is None:
+            adjoining_platform_ids = [
+                platform_ids[j] for j in (i - 1, i + 1)
+                if 0 <= j < len(platform_ids) and platform_ids[j] is not None and routing_path_optional["stop_id"][j] == stop_id
+            ]
+            platform_ids[i] = adjoining_platform_ids[0] if len(adjoining_platform_ids) > 0 else feed.get_station_platform_ids(stop_id)[0]
+
+    # stops of routing_path appear in routing_path_optional in the same order
+    expanded_routing_path = []
+    j = 0
+    for stop_id in routing_path:
+        matches = np.flatnonzero(routing_path_optional["stop_id"][j:] == stop_id)
+        if len(matches) > 0:
+            j += matches[0]
+            expanded_routing_path.append(platform_ids[j])
+            # a visit to a station spans the rows of the trips arriving and departing there, on platforms which may differ
+            while j + 1 < len(platform_ids) and routing_path_optional["stop_id"][j + 1] == stop_id:
+                j += 1
+                if platform_ids[j] != expanded_routing_path[-1]:
+                    expanded_routing_path.append(platform_ids[j])
+        else:
+            expanded_routing_path.append(feed.get_station_platform_ids(stop_id)[0])
+    routing_path_optional["stop_id"] = platform_ids
+    return expanded_routing_path, routing_path_optional
+
+def expand_destination(feed: Feed, destination: Dict, is_reverse_search: bool) -> Dict:
+    """Map a result of time_to_reach_to_destinations on a contracted feed back to platforms"""
+    routing_path, routing_path_optional = expand_routing_path(feed, destination["routing_path"], destination["routing_path_optional"])
+    if len(routing_path) > 0:
+        stop_id = routing_path[0] if is_reverse_search else routing_path[-1]
+    else:
+        stop_id = feed.get_station_platform_ids(destination["stop_id"])[0]
+    return destination | {"routing_path": routing_path, "routing_path_optional": routing_path_optional, "stop_id": stop_id}
+
+def resolve_stop_access(
+    feed: Feed,
+    stop_ids: List[str],
+    coordinate: Optional[Coordinate],
+    max_walking_distance: float,
+    walking_speed: float
+) -> Dict[str, int]:
+    # explicitly specified stops take no walking time
+    stop_access_secs = {stop_id: 0 for stop_id in stop_ids}
+    if coordinate is not None:
+        nearby_stops = feed.get_nearby_stops(coordinate.lat, coordinate.lon, max_walking_distance, walking_speed)
+        for stop_id, walking_secs in nearby_stops.items():
+            stop_access_secs[stop_id] = min(stop_access_secs.get(stop_id, walking_secs), walking_secs)
+    # platforms are searched as their stations on a contracted feed
+    if feed.is_contracted():
+        stop_access_secs = feed.contract_stop_access(stop_access_secs)
+    return stop_access_secs
+
+
+def search_p2p_geojson(feed: Feed, req: Dict[str, Optional[Union[str, int]]], cancel_event: Optional[threading.Event] = None) -> Optional[str]:
     # check input values
     request_paremeters = RequestParameter.parse_obj(req)
+    # resolve stops around coordinates with their walking time
+    origin_access_secs = resolve_stop_access(
+        feed,
+        request_paremeters.origin_stop_ids,
+        request_paremeters.origin_coordinate,
+        request_paremeters.max_walking_distance,
+        request_paremeters.walking_speed
+    )
+    destination_access_secs = resolve_stop_access(
+        feed,
+        request_paremeters.destination_stop_ids,
+        request_paremeters.destination_coordinate,
+        request_paremeters.max_walking_distance,
+        request_paremeters.walking_speed
+    )
     # when is_reverse_search is true, reverse variables assignment of from and to stop_ids
     if request_paremeters.is_reverse_search:
-        from_stop_ids = request_paremeters.destination_stop_ids
-        to_stop_ids = request_paremeters.origin_stop_ids
+        from_stop_access_secs = destination_access_secs
+        to_stop_access_secs = origin_access_secs
     else:
-        from_stop_ids = request_paremeters.origin_stop_ids
-        to_stop_ids = request_paremeters.destination_stop_ids
+        from_stop_access_secs = origin_access_secs
+        to_stop_access_secs = destination_access_secs
+    from_stop_ids = list(from_stop_access_secs.keys())
+    to_stop_ids = list(to_stop_access_secs.keys())
     # set other variables
     specified_date = request_paremeters.specified_date
     specified_secs = request_paremeters.specified_secs
@@ -300,25 +582,35 @@ def search_p2p_geojson(feed: Feed, req: Dict[str, Optional[Union[str, int]]]) ->
 
     # run raptor argolithum
     tic = time.perf_counter()
-    stop_state = run_raptor(
-        feed,
-        from_stop_ids, 
-        specified_date, 
-        specified_secs, 
-        transfers_limit,
-        is_reverse_search,
-        available_trip_ids
-    )
+    with feed.get_workspace_pool().workspace() as workspace:
+        stop_state = run_raptor(
+            feed,
+            from_stop_ids, 
+            specified_date, 
+            specified_secs, 
+            transfers_limit,
+            is_reverse_search,
+            available_trip_ids,
+            from_stop_access_secs,
+            request_paremeters.trip_filters,
+            workspace,
+            max_travel_secs=request_paremeters.max_travel_secs,
+            cancel_event=cancel_event
+        )
+        # get duration from origin to destination 
+        time_to_reach_to_destinations = stop_state.time_to_reach_to_destinations(to_stop_ids, to_stop_access_secs)
     toc = time.perf_counter()
 
-    # get duration from origin to destination 
-    time_to_reach_to_destinations = stop_state.time_to_reach_to_destinations(to_stop_ids)
     # when route search is failed, return None 
     if len(time_to_reach_to_destinations) == 0:
         return None
     # find a shortest route seach result
     time_to_reach_to_destinations = sorted(time_to_reach_to_destinations, key=lambda x: x["time_to_reach"])
     fastest_way = time_to_reach_to_destinations[0]
+    stops = feed.stops
+    if feed.is_contracted():
+        fastest_way = expand_destination(feed, fastest_way, is_reverse_search)
+        stops = feed.platform_stops
     # form the result as a geojson format
     result = {
         "type": "FeatureCollection",
@@ -327,7 +619,7 @@ def search_p2p_geojson(feed: Feed, req: Dict[str, Optional[Union[str, int]]]) ->
                 "type": "Feature",
                 "geometry": {
                     "type": "LineString",
-                    "coordinates": [list(feed.stops[feed.stops["stop_id"] == stop_id][["stop_lon", "stop_lat"]].tolist()[0]) for stop_id in fastest_way["routing_path"]]
+                    "coordinates": [list(stops[stops["stop_id"] == stop_id][["stop_lon", "stop_lat"]].tolist()[0]) for stop_id in fastest_way["routing_path"]]
                 },
                 "properties": {k:int(v) if isinstance(v, (int, np.int64)) else v for k, v in fastest_way.items()}
             }
@@ -336,17 +628,39 @@ def search_p2p_geojson(feed: Feed, req: Dict[str, Optional[Union[str, int]]]) ->
     
     return result
 
-def search_p2p_path(feed: Feed, req: Dict[str, Optional[Union[str, int]]]) -> Optional[str]:
+def search_p2p_path(
+    feed: Feed,
+    req: Dict[str, Optional[Union[str, int]]],
+    cancel_event: Optional[threading.Event] = None,
+    transfer_patterns: Optional["TransferPatternIndex"] = None
+) -> Optional[str]:
     # check input values
     tic = time.perf_counter()
     request_paremeters = RequestParameter.parse_obj(req)
+    # resolve stops around coordinates with their walking time
+    origin_access_secs = resolve_stop_access(
+        feed,
+        request_paremeters.origin_stop_ids,
+        request_paremeters.origin_coordinate,
+        request_paremeters.max_walking_distance,
+        request_paremeters.walking_speed
+    )
+    destination_access_secs = resolve_stop_access(
+        feed,
+        request_paremeters.destination_stop_ids,
+        request_paremeters.destination_coordinate,
+        request_paremeters.max_walking_distance,
+        request_paremeters.walking_speed
+    )
     # when is_reverse_search is true, reverse variables assignment of from and to stop_ids
     if request_paremeters.is_reverse_search:
-        from_stop_ids = request_paremeters.destination_stop_ids
-        to_stop_ids = request_paremeters.origin_stop_ids
+        from_stop_access_secs = destination_access_secs
+        to_stop_access_secs = origin_access_secs
     else:
-        from_stop_ids = request_paremeters.origin_stop_ids
-        to_stop_ids = request_paremeters.destination_stop_ids
+        from_stop_access_secs = origin_access_secs
+        to_stop_access_secs = destination_access_secs
+    from_stop_ids = list(from_stop_access_secs.keys())
+    to_stop_ids = list(to_stop_access_secs.keys())
     # set other variables
     specified_date = request_paremeters.specified_date
     specified_secs = request_paremeters.specified_secs
@@ -355,37 +669,62 @@ def search_p2p_path(feed: Feed, req: Dict[str, Optional[Union[str, int]]]) -> Op
     available_trip_ids = request_paremeters.available_trip_ids
     toc = time.perf_counter()
 
-    # run raptor argolithum
-    # tic = time.perf_counter()
-    stop_state = run_raptor(
-        feed,
-        from_stop_ids, 
-        specified_date, 
-        specified_secs, 
-        transfers_limit,
-        is_reverse_search,
-        available_trip_ids
-    )
-    # toc = time.perf_counter()
+    # hub to hub queries on the timetable the patterns were collected from are answered by them, falling back to raptor
+    fastest_way = None
+    if transfer_patterns is not None and not is_reverse_search and transfer_patterns.is_answerable(request_paremeters) \
+        and request_paremeters.origin_coordinate is None and request_paremeters.destination_coordinate is None:
+        patterns = transfer_patterns.get_patterns(from_stop_ids, to_stop_ids)
+        if patterns is not None:
+            fastest_way = transfer_patterns.evaluate(feed, patterns, request_paremeters)
+
+    if fastest_way is None:
+        # run raptor argolithum
+        # tic = time.perf_counter()
+        with feed.get_workspace_pool().workspace() as workspace:
+            stop_state = run_raptor(
+                feed,
+                from_stop_ids, 
+                specified_date, 
+                specified_secs, 
+                transfers_limit,
+                is_reverse_search,
+                available_trip_ids,
+                from_stop_access_secs,
+                request_paremeters.trip_filters,
+                workspace,
+                max_travel_secs=request_paremeters.max_travel_secs,
+                cancel_event=cancel_event
+            )
+            # get duration from origin to destination 
+            time_to_reach_to_destinations = stop_state.time_to_reach_to_destinations(to_stop_ids, to_stop_access_secs)
+        # toc = time.perf_counter()
 
-    # get duration from origin to destination 
-    time_to_reach_to_destinations = stop_state.time_to_reach_to_destinations(to_stop_ids)
-    # when route search is failed, return None 
-    if len(time_to_reach_to_destinations) == 0:
-        return None
-    # find a shortest route seach result
-    time_to_reach_to_destinations = sorted(time_to_reach_to_destinations, key=lambda x: x["time_to_reach"])
-    fastest_way = time_to_reach_to_destinations[0]
+        # when route search is failed, return None 
+        if len(time_to_reach_to_destinations) == 0:
+            return None
+        # find a shortest route seach result
+        time_to_reach_to_destinations = sorted(time_to_reach_to_destinations, key=lambda x: x["time_to_reach"])
+        fastest_way = time_to_reach_to_destinations[0]
+    if feed.is_contracted():
+        fastest_way = expand_destination(feed, fastest_way, is_reverse_search)
     # form the result as a geojson format
     fastest_way["routing_path_optional"] = [{"trip_id": row[0], "stop_sequence": int(row[1]), "stop_id": row[2]} for row in fastest_way["routing_path_optional"]]
 
     return {k:int(v) if isinstance(v, np.int64) else v for k, v in fastest_way.items() if k != "preceding"}
 
-def search_isochrones(feed: Feed, req: Dict[str, Optional[Union[str, int]]]):
-    
+def search_isochrones(feed: Feed, req: Dict[str, Optional[Union[str, int]]], cancel_event: Optional[threading.Event] = None, track_paths: bool = True):
+    # routing_path of every stop is left empty without track_paths, when only times to reach are needed
     request_paremeters = RequestParameterIsochrones.parse_obj(req)
 
-    from_stop_ids = request_paremeters.origin_stop_ids
+    # resolve stops around the origin coordinate with their walking time
+    from_stop_access_secs = resolve_stop_access(
+        feed,
+        request_paremeters.origin_stop_ids,
+        request_paremeters.origin_coordinate,
+        request_paremeters.max_walking_distance,
+        request_paremeters.walking_speed
+    )
+    from_stop_ids = list(from_stop_access_secs.keys())
     # set other variables
     specified_date = request_paremeters.specified_date
     specified_secs = request_paremeters.specified_secs
@@ -395,15 +734,39 @@ def search_isochrones(feed: Feed, req: Dict[str, Optional[Union[str, int]]]):
 
     # run raptor argolithum
     # tic = time.perf_counter()
-    stop_state = run_raptor(
-        feed,
-        from_stop_ids, 
-        specified_date, 
-        specified_secs, 
-        transfers_limit,
-        is_reverse_search,
-        available_trip_ids
-    )
+    with feed.get_workspace_pool().workspace() as workspace:
+        stop_state = run_raptor(
+            feed,
+            from_stop_ids, 
+            specified_date, 
+            specified_secs, 
+            transfers_limit,
+            is_reverse_search,
+            available_trip_ids,
+            from_stop_access_secs,
+            request_paremeters.trip_filters,
+            workspace,
+            track_paths=track_paths,
+            max_travel_secs=request_paremeters.max_travel_secs,
+            cancel_event=cancel_event
+        )
+        # read labels out before the workspace is released
+        reached_stops = list(workspace.reached_stops)
+        times_to_reach = workspace.time_to_reach[reached_stops].tolist()
+        routing_paths = [workspace.routing_paths[stop_index] for stop_index in reached_stops]
+        routing_path_optionals = [workspace.routing_path_optionals[stop_index] for stop_index in reached_stops]
+
+    stops = feed.stops
+    if feed.is_contracted():
+        # every platform of a reached station is reached at the same time
+        expanded_stops, expanded_times_to_reach, expanded_routing_paths = [], [], []
+        for stop_index, time_to_reach, routing_path, routing_path_optional in zip(reached_stops, times_to_reach, routing_paths, routing_path_optionals):
+            routing_path, _ = expand_routing_path(feed, routing_path, routing_path_optional)
+            for platform_index in feed.get_station_platform_indices(stop_index).tolist():
+                expanded_stops.append(platform_index)
+                expanded_times_to_reach.append(time_to_reach)
+                expanded_routing_paths.append(routing_path)
+        stops, reached_stops, times_to_reach, routing_paths = feed.platform_stops, expanded_stops, expanded_times_to_reach, expanded_routing_paths
 
     return {
         "type": "FeatureCollection",
@@ -412,18 +775,18 @@ def search_isochrones(feed: Feed, req: Dict[str, Optional[Union[str, int]]]):
                 "type": "Feature",
                 "geometry": {
                     "type": "Point",
-                    "coordinates": [feed.stops[feed.stops["stop_id"] == k]["stop_lon"][0], feed.stops[feed.stops["stop_id"] == k]["stop_lat"][0]]
+                    "coordinates": [stops["stop_lon"][stop_index], stops["stop_lat"][stop_index]]
                 },
                 "properties": {
                     "date": specified_date,
-                    "stop_id": k,
-                    "stop_name": feed.stops[feed.stops["stop_id"] == k]["stop_name"][0],
-                    "time_to_reach": int(v.time_to_reach),
-                    "routing_path": v.routing_path,
+                    "stop_id": stops["stop_id"][stop_index],
+                    "stop_name": stops["stop_name"][stop_index],
+                    "time_to_reach": time_to_reach,
+                    "routing_path": routing_path,
                     # "routing_path_optional": v.routing_path_optional
                 }
             }
-            for k, v in stop_state.time_to_stops.items()
+            for stop_index, time_to_reach, routing_path in zip(reached_stops, times_to_reach, routing_paths)
         ]
     }
 
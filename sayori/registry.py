@@ -0,0 +1,173 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Union
+
+import numpy as np
+
+from .models import Feed, FeedPath
+from .spatial import StopGridIndex
+
+def get_feed_path(path_sayori_models: str) -> FeedPath:
+    """Build FeedPath of a directory converted by presayori e.g.) ./demo/sayori_models/"""
+    path_sayori_models = path_sayori_models.rstrip("/") + "/"
+    frequencies = f"{path_sayori_models}sayori_frequencies.parquet"
+    return FeedPath.parse_obj({
+        "stops": f"{path_sayori_models}sayori_stops.parquet",
+        "stop_times": f"{path_sayori_models}sayori_stop_times.parquet",
+        "trips": f"{path_sayori_models}sayori_trips.parquet",
+        "transfers": f"{path_sayori_models}sayori_transfers.parquet",
+        "calendar": f"{path_sayori_models}sayori_calendar.parquet",
+        # converted before frequencies.txt was supported
+        "frequencies": frequencies if os.path.exists(frequencies) else None,
+    })
+
+
+class FeedRegistry:
+    """Holds converted feeds of many operators under names.
+
+    Feeds are loaded on the first query and their ids are namespaced by the feed name
+    (e.g. toei:0606-01) so that they never collide when merged. The least recently used
+    feeds are evicted once the loaded feeds exceed memory_budget bytes.
+
+    Feeds are loaded and compiled outside the lock, so queries of loaded feeds are not blocked
+    by a feed being loaded. Queries of a feed being loaded wait for it instead of loading it again.
+    """
+    def __init__(self, memory_budget: Optional[int] = None) -> None:
+        self.memory_budget: Optional[int] = memory_budget
+        self.feed_paths: Dict[str, FeedPath] = {}
+        self.compilers: Dict[str, Optional[Callable[[Feed], None]]] = {}
+        self.feeds: "OrderedDict[str, Feed]" = OrderedDict()
+        self.memory_usages: Dict[str, int] = {}
+        # feeds being loaded, set once they are stored or failed to load
+        self.loading: Dict[str, threading.Event] = {}
+        self.lock = threading.RLock()
+
+    def register(
+        self,
+        name: str,
+        feed_path: Union[FeedPath, str],
+        compiler: Optional[Callable[[Feed], None]] = None
+    ) -> None:
+        """Register a feed by FeedPath or a presayori output directory.
+        compiler is called with the feed once loaded, e.g. to compile trip filters."""
+        if "+" in name:
+            raise ValueError(f"Feed name should not contain '+': {name}")
+        with self.lock:
+            self.feed_paths[name] = get_feed_path(feed_path) if isinstance(feed_path, str) else feed_path
+            self.compilers[name] = compiler
+            self.unload(name)
+
+    def unregister(self, name: str) -> None:
+        with self.lock:
+            self.unload(name)
+            self.feed_paths.pop(name)
+            self.compilers.pop(name)
+
+    def get_names(self) -> List[str]:
+        return list(self.feed_paths.keys())
+
+    def get_loaded_names(self) -> List[str]:
+        return list(self.feeds.keys())
+
+    def get_memory_usage(self) -> int:
+        return sum(self.memory_usages.values())
+
+    def get(self, name: str) -> Feed:
+        """Return the namespaced feed, loading it when it is not loaded yet"""
+        with self.lock:
+            if name not in self.feed_paths:
+                raise KeyError(f"Feed is not registered: {name}")
+
+        def load() -> Feed:
+            with self.lock:
+                if name not in self.feed_paths:
+                    raise KeyError(f"Feed is not registered: {name}")
+                feed_path, compiler = self.feed_paths[name], self.compilers[name]
+            feed = Feed.from_feed_path(feed_path).with_namespace(name)
+            if compiler is not None:
+                compiler(feed)
+            return feed
+
+        return self.get_or_load(name, load)
+
+    def merge(self, names: List[str], max_walking_distance: float = 0, walking_speed: float = 4.8 / 3.6) -> Feed:
+        """Return a feed merging several registered feeds for queries across operators.
+        Walking transfers within max_walking_distance meters are added between stops of different feeds.
+        Trip filters compiled on each feed keep selecting its own trips (see Feed.concat)."""
+        names = sorted(set(names))
+        if len(names) == 1:
+            return self.get(names[0])
+
+        def load() -> Feed:
+            feeds = [self.get(name) for name in names]
+            transfers = get_transfers_between_feeds(feeds, max_walking_distance, walking_speed) if max_walking_distance > 0 else None
+            return Feed.concat(feeds, transfers)
+
+        return self.get_or_load("+".join(names), load)
+
+    def get_or_load(self, name: str, load: Callable[[], Feed]) -> Feed:
+        """Return a loaded feed, or load and compile it outside the lock.
+        A feed registered again or unloaded while loading is returned but not stored"""
+        while True:
+            with self.lock:
+                if name in self.feeds:
+                    self.feeds.move_to_end(name)
+                    return self.feeds[name]
+                loading = self.loading.get(name)
+                if loading is None:
+                    loading = self.loading[name] = threading.Event()
+                    break
+            # look again once the other query has loaded it, or load it here if it failed
+            loading.wait()
+
+        try:
+            # lazily built structures are built up front, as the feed is shared among threads and counted in its memory usage
+            feed = load().compile()
+            memory_usage = feed.get_memory_usage()
+            with self.lock:
+                if self.loading.get(name) is loading:
+                    self.store(name, feed, memory_usage)
+        finally:
+            with self.lock:
+                if self.loading.get(name) is loading:
+                    self.loading.pop(name)
+            loading.set()
+        return feed
+
+    def store(self, name: str, feed: Feed, memory_usage: int) -> None:
+        # called with the lock held
+        self.feeds[name] = feed
+        self.memory_usages[name] = memory_usage
+        # evict the least recently used feeds except the one just stored.
+        # merged feeds hold their own copy of tables, so they outlive the evicted feeds they came from
+        while self.memory_budget is not None and self.get_memory_usage() > self.memory_budget and len(self.feeds) > 1:
+            evicted_name = next(iter(self.feeds))
+            self.feeds.pop(evicted_name)
+            self.memory_usages.pop(evicted_name)
+
+    def unload(self, name: str) -> None:
+        with self.lock:
+            # merged feeds built from the feed are unloaded as well, and feeds being loaded are not stored
+            for loaded_name in [loaded_name for loaded_name in self.feeds if name in loaded_name.split("+")]:
+                self.feeds.pop(loaded_name)
+                self.memory_usages.pop(loaded_name)
+            for loading_name in [loading_name for loading_name in self.loading if name in loading_name.split("+")]:
+                self.loading.pop(loading_name)
+
+
+def get_transfers_between_feeds(feeds: List[Feed], max_walking_distance: float, walking_speed: float) -> np.ndarray:
+    stops = np.concatenate([feed.stops for feed in feeds])
+    feed_indices = np.concatenate([np.full(len(feed.stops), i) for i, feed in enumerate(feeds)])
+    stop_index = StopGridIndex(stops["stop_lat"], stops["stop_lon"])
+
+    transfers = []
+    for i, (stop_id, stop_lat, stop_lon) in enumerate(zip(stops["stop_id"], stops["stop_lat"], stops["stop_lon"])):
+        if np.isnan(stop_lat) or np.isnan(stop_lon):
+            continue
+        nearby_stop_indices, distances = stop_index.query_radius(stop_lat, stop_lon, max_walking_distance)
+        for j, distance in zip(nearby_stop_indices, distances):
+            if feed_indices[i] != feed_indices[j]:
+                transfers.append((stop_id, stops["stop_id"][j], 0, max(1, int(np.ceil(distance / walking_speed)))))
+
+    return np.array(transfers, dtype=feeds[0].transfers.dtype)
@@ -0,0 +1,64 @@
+# pandera schemas validating tables before they are converted into a Feed.
+# kept apart from models, so that searches on a compiled feed do not import pandas and pandera
+import pandera as pa
+from pandera.typing import Series
+
+class Stops(pa.SchemaModel):   
+    stop_id: Series[str] = pa.Field(unique = True, nullable=False)
+    stop_name: Series[str] = pa.Field(nullable=True)
+    parent_station: Series[str] = pa.Field(nullable=True)
+    platform_code: Series[str] = pa.Field(nullable=True)
+    stop_lat: Series[pa.Float64] = pa.Field(nullable=True)
+    stop_lon: Series[pa.Float64] = pa.Field(nullable=True)
+
+    class Config:
+        strict = True
+
+class Trips(pa.SchemaModel):
+    trip_id: Series[str] = pa.Field(unique = True, nullable=True)
+    route_id: Series[str] = pa.Field(nullable=False)
+    service_id: Series[str] = pa.Field(nullable=False)
+    trip_headsign: Series[str] = pa.Field(nullable=True)
+    trip_short_name: Series[str] = pa.Field(nullable=True)
+    block_id: Series[str] = pa.Field(nullable=True)
+
+    class Config:
+        strict = True
+
+class StopTimes(pa.SchemaModel):
+    trip_id: Series[str] = pa.Field(nullable=False)
+    stop_sequence: Series[pa.Int64] = pa.Field(nullable=False)
+    stop_id: Series[str] = pa.Field(nullable=False)
+    arrival_time: Series[pa.Int32] = pa.Field(nullable=False)
+    departure_time: Series[pa.Int32] = pa.Field(nullable=False)
+    pickup_type: Series[pa.Int32] = pa.Field(nullable = True, isin = [0, 1, 2, 3])
+    drop_off_type: Series[pa.Int32] = pa.Field(nullable = True, isin = [0, 1, 2, 3])
+
+    class Config:
+        strict = True
+
+class Calendar(pa.SchemaModel):
+    # active_days packs a bit per day from start_date with np.packbits
+    service_id: Series[str] = pa.Field(unique = True, nullable=False)
+    start_date: Series[pa.Date] = pa.Field(nullable=False)
+    active_days: Series[pa.Object] = pa.Field(nullable=False)
+
+    class Config:
+        strict = True
+
+class Transfers(pa.SchemaModel):
+    from_stop_id: Series[str] = pa.Field(nullable = False)
+    to_stop_id: Series[str] = pa.Field(nullable = False)
+    transfer_type: Series[pa.Int32] = pa.Field(nullable = False, isin = [0, 1, 2, 3])
+    min_transfer_time: Series[pa.Int32] = pa.Field(nullable = False, gt = 0)
+
+class Frequencies(pa.SchemaModel):
+    # stop_times of a frequency-based trip are relative to its first departure
+    trip_id: Series[str] = pa.Field(nullable = False)
+    start_time: Series[pa.Int32] = pa.Field(nullable = False)
+    end_time: Series[pa.Int32] = pa.Field(nullable = False)
+    headway_secs: Series[pa.Int32] = pa.Field(nullable = False, gt = 0)
+    exact_times: Series[pa.Int32] = pa.Field(nullable = False, isin = [0, 1])
+
+    class Config:
+        strict = True
@@ -0,0 +1,73 @@
+import math
+from typing import Tuple
+
+import numpy as np
+
+EARTH_RADIUS = 6371008.8
+
+def haversine_distance(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Great-circle distance in meters, vectorized over numpy arrays"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+
+class StopGridIndex:
+    """Uniform grid over stop coordinates.
+
+    Stops are bucketed into square cells of `cell_size` meters on an equirectangular
+    projection and the cell keys are kept sorted, so a radius query is a handful of
+    `np.searchsorted` calls over contiguous key ranges followed by an exact distance check.
+    """
+    def __init__(self, stop_lat: np.ndarray, stop_lon: np.ndarray, cell_size: float = 500.0) -> None:
+        stop_lat = np.asarray(stop_lat, dtype="float64")
+        stop_lon = np.asarray(stop_lon, dtype="float64")
+        valid = ~(np.isnan(stop_lat) | np.isnan(stop_lon))
+
+        self.cell_size: float = cell_size
+        self.stop_lat: np.ndarray = stop_lat
+        self.stop_lon: np.ndarray = stop_lon
+        self.ref_cos: float = math.cos(math.radians(float(stop_lat[valid].mean()))) if valid.any() else 1.0
+
+        cell_x, cell_y = self.get_cells(stop_lat[valid], stop_lon[valid])
+        self.min_x: int = int(cell_x.min()) if len(cell_x) > 0 else 0
+        self.min_y: int = int(cell_y.min()) if len(cell_y) > 0 else 0
+        self.n_y: int = int(cell_y.max()) - self.min_y + 1 if len(cell_y) > 0 else 1
+
+        keys = self.get_keys(cell_x, cell_y)
+        order = np.argsort(keys, kind="stable")
+        self.sorted_keys: np.ndarray = keys[order]
+        self.sorted_indices: np.ndarray = np.flatnonzero(valid)[order]
+
+    def get_cells(self, lat, lon) -> Tuple[np.ndarray, np.ndarray]:
+        x = np.radians(lon) * EARTH_RADIUS * self.ref_cos
+        y = np.radians(lat) * EARTH_RADIUS
+        return np.floor(x / self.cell_size).astype("int64"), np.floor(y / self.cell_size).astype("int64")
+
+    def get_keys(self, cell_x: np.ndarray, cell_y: np.ndarray) -> np.ndarray:
+        return (cell_x - self.min_x) * self.n_y + (cell_y - self.min_y)
+
+    def query_radius(self, lat: float, lon: float, radius: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Return stop indices within `radius` meters and their distances"""
+        cell_x, cell_y = self.get_cells(np.array([lat]), np.array([lon]))
+        cell_x, cell_y = int(cell_x[0]), int(cell_y[0])
+        # longitude cells shrink away from the reference latitude
+        lat_cos = max(math.cos(math.radians(lat)), 1e-6)
+        reach_x = math.ceil(radius * self.ref_cos / lat_cos / self.cell_size)
+        reach_y = math.ceil(radius / self.cell_size)
+
+        y_lo = max(cell_y - reach_y, self.min_y)
+        y_hi = min(cell_y + reach_y, self.min_y + self.n_y - 1)
+        if y_lo > y_hi:
+            return np.empty(0, dtype="int64"), np.empty(0, dtype="float64")
+
+        # one contiguous key range per grid column
+        columns = np.arange(cell_x - reach_x, cell_x + reach_x + 1) - self.min_x
+        columns = columns[columns >= 0]
+        starts = np.searchsorted(self.sorted_keys, columns * self.n_y + (y_lo - self.min_y), side="left")
+        ends = np.searchsorted(self.sorted_keys, columns * self.n_y + (y_hi - self.min_y), side="right")
+        candidates = np.concatenate([self.sorted_indices[s:e] for s, e in zip(starts, ends) if e > s] or [np.empty(0, dtype="int64")])
+
+        distances = haversine_distance(lat, lon, self.stop_lat[candidates], self.stop_lon[candidates])
+        within = distances <= radius
+        return candidates[within], distances[within]
@@ -0,0 +1,123 @@
+import math
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .models import Feed, RequestParameterSurface
+from .raptor import search_isochrones
+from .spatial import EARTH_RADIUS
+
+def get_travel_time_grid(
+    stop_lat: np.ndarray,
+    stop_lon: np.ndarray,
+    times_to_reach: np.ndarray,
+    grid_resolution: float,
+    max_walking_distance: float,
+    walking_speed: float,
+    max_chunk_cells: int = 1 << 20
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Least time to reach every cell center by walking from the stops.
+    Returns travel times in seconds (NaN where unreached) with rows from north to south, and latitudes and longitudes of the cell centers.
+    Stops are scattered in chunks of at most max_chunk_cells cells, which bounds the size of the temporary arrays"""
+    # cells are squares on the same equirectangular projection as StopGridIndex
+    ref_cos = math.cos(math.radians(float(stop_lat.mean())))
+    x = np.radians(stop_lon) * EARTH_RADIUS * ref_cos
+    y = np.radians(stop_lat) * EARTH_RADIUS
+    x0 = math.floor((x.min() - max_walking_distance) / grid_resolution) * grid_resolution
+    y0 = math.floor((y.min() - max_walking_distance) / grid_resolution) * grid_resolution
+    n_cols = math.ceil((x.max() + max_walking_distance - x0) / grid_resolution)
+    n_rows = math.ceil((y.max() + max_walking_distance - y0) / grid_resolution)
+
+    # a stop reaches the cells in a square window around its own cell, so a cell only sees stops nearby
+    reach = math.ceil(max_walking_distance / grid_resolution)
+    offset_cols, offset_rows = [offsets.ravel() for offsets in np.meshgrid(np.arange(-reach, reach + 1), np.arange(-reach, reach + 1))]
+    stop_cols = np.floor((x - x0) / grid_resolution).astype("int64")
+    stop_rows = np.floor((y - y0) / grid_resolution).astype("int64")
+    # fewer stops are taken at once as their windows grow, e.g. 101 x 101 cells for 500 meters on a grid of 10 meters
+    chunk_size = max(1, max_chunk_cells // len(offset_cols))
+
+    grid = np.full(n_rows * n_cols, np.inf)
+    for start in range(0, len(x), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        cols = stop_cols[chunk, None] + offset_cols[None, :]
+        rows = stop_rows[chunk, None] + offset_rows[None, :]
+        distances = np.hypot(x0 + (cols + 0.5) * grid_resolution - x[chunk, None], y0 + (rows + 0.5) * grid_resolution - y[chunk, None])
+        is_reached = (distances <= max_walking_distance) * (cols >= 0) * (cols < n_cols) * (rows >= 0) * (rows < n_rows)
+        secs = times_to_reach[chunk, None] + np.ceil(distances / walking_speed)
+        np.minimum.at(grid, rows[is_reached] * n_cols + cols[is_reached], secs[is_reached])
+
+    grid[np.isinf(grid)] = np.nan
+    lats = np.degrees((y0 + (np.arange(n_rows) + 0.5) * grid_resolution) / EARTH_RADIUS)
+    lons = np.degrees((x0 + (np.arange(n_cols) + 0.5) * grid_resolution) / EARTH_RADIUS / ref_cos)
+    return grid.reshape(n_rows, n_cols)[::-1], lats[::-1], lons
+
+def get_band_features(travel_time: np.ndarray, lats: np.ndarray, lons: np.ndarray, band_secs: List[int]) -> List[Dict]:
+    """Polygonize cells into GeoJSON features of bands between consecutive band_secs"""
+    # shapely>=2 comes with geopandas or the surface extra, and is needed only for bands
+    import shapely
+    from shapely.geometry import mapping
+
+    half_lat = abs(lats[0] - lats[1]) / 2 if len(lats) > 1 else 0
+    half_lon = abs(lons[1] - lons[0]) / 2 if len(lons) > 1 else 0
+    features = []
+    lower_secs = -np.inf
+    for upper_secs in sorted(band_secs):
+        is_in_band = (travel_time > lower_secs) * (travel_time <= upper_secs)
+        # one box per run of cells in a row
+        edges = np.diff(np.pad(is_in_band, ((0, 0), (1, 1))).astype("int8"), axis=1)
+        run_rows, run_starts = np.nonzero(edges == 1)
+        _, run_ends = np.nonzero(edges == -1)
+        boxes = shapely.box(lons[run_starts] - half_lon, lats[run_rows] - half_lat, lons[run_ends - 1] + half_lon, lats[run_rows] + half_lat)
+        if len(boxes) > 0:
+            features.append({
+                "type": "Feature",
+                "geometry": mapping(shapely.union_all(boxes)),
+                "properties": {
+                    "min_time_to_reach": None if np.isinf(lower_secs) else int(lower_secs),
+                    "max_time_to_reach": upper_secs,
+                }
+            })
+        lower_secs = upper_secs
+    return features
+
+def search_travel_time_surface(feed: Feed, req: Dict, cancel_event: Optional[threading.Event] = None) -> Dict:
+    """Travel time to every cell of a grid covering the reached stops, by an isochrone search and walking from the reached stops"""
+    request_paremeters = RequestParameterSurface.parse_obj(req)
+    # only times to reach are needed, so routing paths are not built
+    isochrones = search_isochrones(feed, request_paremeters.dict(exclude={"grid_resolution", "band_secs"}), cancel_event, track_paths=False)
+
+    coordinates = [feature["geometry"]["coordinates"] for feature in isochrones["features"]]
+    times_to_reach = [feature["properties"]["time_to_reach"] for feature in isochrones["features"]]
+    # cells around the origin coordinate are reached by walking from it as well
+    if request_paremeters.origin_coordinate is not None:
+        coordinates.append([request_paremeters.origin_coordinate.lon, request_paremeters.origin_coordinate.lat])
+        times_to_reach.append(0)
+    coordinates = np.array(coordinates, dtype="float64").reshape(-1, 2)
+    times_to_reach = np.array(times_to_reach, dtype="float64")
+    is_located = ~np.isnan(coordinates).any(axis=1)
+    if not is_located.any():
+        bands = {"type": "FeatureCollection", "features": []} if request_paremeters.band_secs is not None else None
+        return {"date": request_paremeters.specified_date, "lats": np.empty(0), "lons": np.empty(0), "travel_time": np.empty((0, 0)), "bands": bands}
+
+    travel_time, lats, lons = get_travel_time_grid(
+        coordinates[is_located, 1],
+        coordinates[is_located, 0],
+        times_to_reach[is_located],
+        request_paremeters.grid_resolution,
+        request_paremeters.max_walking_distance,
+        request_paremeters.walking_speed
+    )
+    if request_paremeters.max_travel_secs is not None:
+        travel_time[travel_time > request_paremeters.max_travel_secs] = np.nan
+
+    bands = None
+    if request_paremeters.band_secs is not None:
+        bands = {"type": "FeatureCollection", "features": get_band_features(travel_time, lats, lons, request_paremeters.band_secs)}
+    return {
+        "date": request_paremeters.specified_date,
+        "lats": lats,
+        "lons": lons,
+        "travel_time": travel_time,
+        "bands": bands,
+    }
@@ -0,0 +1,87 @@
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+UNREACHED = np.iinfo(np.int64).max
+
+class QueryWorkspace:
+    """Scratch buffers of a single search, indexed by stop index.
+
+    Only the stops touched by a search are recorded, so reset() costs in proportion to the
+    reached stops rather than the size of the feed. The arrays, the list of reached stops and the
+    trip arrivals of a round are reused across searches, while the routing paths stored as labels
+    are built per search, as they are handed over to results.
+    """
+    def __init__(self, stop_ids: np.ndarray, stop_indices: Dict[str, int]) -> None:
+        n_stops = len(stop_ids)
+        self.stop_ids: np.ndarray = stop_ids
+        self.stop_indices: Dict[str, int] = stop_indices
+        # arrival labels
+        self.time_to_reach: np.ndarray = np.full(n_stops, UNREACHED, dtype="int64")
+        # arrival labels by trips, from which footpaths are walked
+        self.trip_time_to_reach: np.ndarray = np.full(n_stops, UNREACHED, dtype="int64")
+        # stops improved since the last round
+        self.marked: np.ndarray = np.zeros(n_stops, dtype=bool)
+        # labels set by trips rather than by walks, after which platforms are changed on a contracted station
+        self.reached_by_trip: np.ndarray = np.zeros(n_stops, dtype=bool)
+        # label buffers
+        self.routing_paths: List[Optional[List[str]]] = [None] * n_stops
+        self.routing_path_optionals: List[Optional[np.ndarray]] = [None] * n_stops
+        self.precedings: List[Optional[List[str]]] = [None] * n_stops
+        # stop indices in order of their first reach
+        self.reached_stops: List[int] = []
+        # labels of stops reached by trips in the current round, cleared after walking from them
+        self.trip_arrivals: Dict[str, Tuple[int, List[str], np.ndarray, List[str]]] = {}
+
+    def reset(self) -> None:
+        reached_stops = self.reached_stops
+        self.time_to_reach[reached_stops] = UNREACHED
+        self.trip_time_to_reach[reached_stops] = UNREACHED
+        self.marked[reached_stops] = False
+        self.reached_by_trip[reached_stops] = False
+        for stop_index in reached_stops:
+            self.routing_paths[stop_index] = None
+            self.routing_path_optionals[stop_index] = None
+            self.precedings[stop_index] = None
+        reached_stops.clear()
+        self.trip_arrivals.clear()
+
+
+class WorkspacePool:
+    """Thread-safe pool of QueryWorkspace over one feed.
+
+    Workspaces are handed out to concurrent searches and reused after a cheap reset,
+    so a steady load does not allocate new label arrays. Routing paths and the rows of
+    stop_times scanned are still allocated per search.
+    """
+    def __init__(self, stop_ids: np.ndarray, max_idle_workspaces: Optional[int] = None) -> None:
+        self.stop_ids: np.ndarray = stop_ids
+        self.stop_indices: Dict[str, int] = {stop_id: i for i, stop_id in enumerate(stop_ids.tolist())}
+        self.max_idle_workspaces: Optional[int] = max_idle_workspaces
+        self.idle_workspaces: List[QueryWorkspace] = []
+        self.lock = threading.Lock()
+
+    def create_workspace(self) -> QueryWorkspace:
+        return QueryWorkspace(self.stop_ids, self.stop_indices)
+
+    def acquire(self) -> QueryWorkspace:
+        with self.lock:
+            if len(self.idle_workspaces) > 0:
+                return self.idle_workspaces.pop()
+        return self.create_workspace()
+
+    def release(self, workspace: QueryWorkspace) -> None:
+        workspace.reset()
+        with self.lock:
+            if self.max_idle_workspaces is None or len(self.idle_workspaces) < self.max_idle_workspaces:
+                self.idle_workspaces.append(workspace)
+
+    @contextmanager
+    def workspace(self) -> Iterator[QueryWorkspace]:
+        workspace = self.acquire()
+        try:
+            yield workspace
+        finally:
+            self.release(workspace)
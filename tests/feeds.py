@@ -0,0 +1,140 @@
+import heapq
+import random
+import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from sayori.models import Feed
+
+TEST_DATE = "2023-11-20"
+
+def make_feed(
+    trips: Dict[str, Sequence[Tuple[str, int, int]]],
+    transfers: Sequence[Tuple[str, str, int]] = (),
+    frequencies: Sequence[Tuple[str, int, int, int]] = (),
+    stops: Optional[Dict[str, Tuple[Optional[str], float, float]]] = None,
+    services: Optional[Dict[str, str]] = None,
+    calendar: Optional[pd.DataFrame] = None
+) -> Feed:
+    """Build a feed of trips given as (stop_id, arrival secs, departure secs) in order.
+    stops are (parent_station, lat, lon) by stop_id, and every trip runs on TEST_DATE unless services say otherwise"""
+    stop_ids = sorted({stop_id for stop_times in trips.values() for stop_id, _, _ in stop_times} | {v for t in transfers for v in t[:2]} | set(stops or {}))
+    stops = stops or {}
+    services = services or {}
+    if calendar is None:
+        calendar = pd.DataFrame({
+            "service_id": pd.Series(["weekday"], dtype="str"),
+            "start_date": [datetime.date.fromisoformat(TEST_DATE)],
+            "active_days": [np.packbits([True]).tobytes()],
+        })
+    return Feed.from_pandas(
+        pd.DataFrame({
+            "stop_id": pd.Series(stop_ids, dtype="str"),
+            "stop_name": pd.Series(stop_ids, dtype="str"),
+            "parent_station": pd.Series([stops.get(stop_id, (None, np.nan, np.nan))[0] for stop_id in stop_ids], dtype="str"),
+            "platform_code": pd.Series([None] * len(stop_ids), dtype="str"),
+            "stop_lat": pd.Series([stops.get(stop_id, (None, np.nan, np.nan))[1] for stop_id in stop_ids], dtype="float64"),
+            "stop_lon": pd.Series([stops.get(stop_id, (None, np.nan, np.nan))[2] for stop_id in stop_ids], dtype="float64"),
+        }),
+        pd.DataFrame({
+            "trip_id": pd.Series([trip_id for trip_id, stop_times in trips.items() for _ in stop_times], dtype="str"),
+            "stop_sequence": pd.Series([i + 1 for stop_times in trips.values() for i in range(len(stop_times))], dtype="int64"),
+            "stop_id": pd.Series([stop_id for stop_times in trips.values() for stop_id, _, _ in stop_times], dtype="str"),
+            "arrival_time": pd.Series([arrival for stop_times in trips.values() for _, arrival, _ in stop_times], dtype="int32"),
+            "departure_time": pd.Series([departure for stop_times in trips.values() for _, _, departure in stop_times], dtype="int32"),
+            "pickup_type": pd.Series([0] * sum(map(len, trips.values())), dtype="int32"),
+            "drop_off_type": pd.Series([0] * sum(map(len, trips.values())), dtype="int32"),
+        }),
+        pd.DataFrame({
+            "trip_id": pd.Series(list(trips), dtype="str"),
+            "route_id": pd.Series(list(trips), dtype="str"),
+            "service_id": pd.Series([services.get(trip_id, "weekday") for trip_id in trips], dtype="str"),
+            "trip_headsign": pd.Series([None] * len(trips), dtype="str"),
+            "trip_short_name": pd.Series([None] * len(trips), dtype="str"),
+            "block_id": pd.Series([None] * len(trips), dtype="str"),
+        }),
+        pd.DataFrame({
+            "from_stop_id": pd.Series([t[0] for t in transfers], dtype="str"),
+            "to_stop_id": pd.Series([t[1] for t in transfers], dtype="str"),
+            "transfer_type": pd.Series([2] * len(transfers), dtype="int32"),
+            "min_transfer_time": pd.Series([t[2] for t in transfers], dtype="int32"),
+        }),
+        calendar,
+        pd.DataFrame({
+            "trip_id": pd.Series([f[0] for f in frequencies], dtype="str"),
+            "start_time": pd.Series([f[1] for f in frequencies], dtype="int32"),
+            "end_time": pd.Series([f[2] for f in frequencies], dtype="int32"),
+            "headway_secs": pd.Series([f[3] for f in frequencies], dtype="int32"),
+            "exact_times": pd.Series([0] * len(frequencies), dtype="int32"),
+        }),
+    )
+
+def make_random_trips(seed: int, n_stops: int = 25, n_trips: int = 30) -> Tuple[Dict[str, List[Tuple[str, int, int]]], List[Tuple[str, str, int]]]:
+    """Random trips with dwells and random symmetric walking transfers"""
+    rng = random.Random(seed)
+    stop_ids = [f"s{i}" for i in range(n_stops)]
+    trips = {}
+    for i in range(n_trips):
+        secs = rng.randrange(7 * 3600, 8 * 3600, 30)
+        stop_times = []
+        for stop_id in rng.sample(stop_ids, rng.randint(3, 8)):
+            arrival = secs
+            secs += rng.choice([0, 0, 30, 120])
+            stop_times.append((stop_id, arrival, secs))
+            secs += rng.randint(60, 600)
+        trips[f"t{i}"] = stop_times
+    transfers = []
+    for _ in range(n_stops):
+        from_stop_id, to_stop_id = rng.sample(stop_ids, 2)
+        secs = rng.randint(30, 400)
+        transfers += [(from_stop_id, to_stop_id, secs), (to_stop_id, from_stop_id, secs)]
+    return trips, transfers
+
+def get_walking_secs(transfers: Sequence[Tuple[str, str, int]], from_stop_id: str, max_walking_secs: Optional[int] = None) -> Dict[str, int]:
+    """Shortest walks by chaining transfers within max_walking_secs, or without a limit when None.
+    A single transfer is a walk whatever its walking time, as in Feed.build_footpaths"""
+    best_secs = {from_stop_id: 0}
+    heap = [(0, from_stop_id)]
+    while len(heap) > 0:
+        secs, stop_id = heapq.heappop(heap)
+        if secs > best_secs[stop_id]:
+            continue
+        for transfer_from_stop_id, to_stop_id, transfer_secs in transfers:
+            if transfer_from_stop_id != stop_id or (max_walking_secs is not None and secs + transfer_secs > max_walking_secs and stop_id != from_stop_id):
+                continue
+            if secs + transfer_secs < best_secs.get(to_stop_id, secs + transfer_secs + 1):
+                best_secs[to_stop_id] = secs + transfer_secs
+                heapq.heappush(heap, (secs + transfer_secs, to_stop_id))
+    return best_secs
+
+def get_earliest_arrivals(
+    trips: Dict[str, Sequence[Tuple[str, int, int]]],
+    transfers: Sequence[Tuple[str, str, int]],
+    from_stop_id: str,
+    departure_secs: int,
+    max_walking_secs: Optional[int] = None
+) -> Dict[str, int]:
+    """Brute-force earliest arrival secs at every stop by scanning connections in order of departure,
+    walking once from the origin and from every arrival by a trip"""
+    arrivals, trip_arrivals = {}, {}
+    def reach(stop_id: str, secs: int) -> None:
+        for to_stop_id, walking_secs in get_walking_secs(transfers, stop_id, max_walking_secs).items():
+            if secs + walking_secs < arrivals.get(to_stop_id, np.inf):
+                arrivals[to_stop_id] = secs + walking_secs
+    reach(from_stop_id, departure_secs)
+
+    connections = sorted(
+        (departure, arrival, trip_id, from_stop, to_stop)
+        for trip_id, stop_times in trips.items()
+        for (from_stop, _, departure), (to_stop, arrival, _) in zip(stop_times[:-1], stop_times[1:])
+    )
+    boarded_trip_ids = set()
+    for departure, arrival, trip_id, from_stop, to_stop in connections:
+        if trip_id in boarded_trip_ids or arrivals.get(from_stop, np.inf) <= departure:
+            boarded_trip_ids.add(trip_id)
+            if arrival < trip_arrivals.get(to_stop, np.inf):
+                trip_arrivals[to_stop] = arrival
+                reach(to_stop, arrival)
+    return arrivals
@@ -0,0 +1,70 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+from sayori import accessibility
+from sayori.accessibility import compute_accessibility
+from tests.feeds import TEST_DATE, make_feed, make_random_trips
+
+REQUEST = {
+    "origins": {f"o{i}": [f"s{i}"] for i in range(10)},
+    "opportunities": {f"s{i}": float(i) for i in range(25)},
+    "thresholds": [600, 1800],
+    "specified_date": TEST_DATE,
+    "departure_start_secs": 7 * 3600,
+    "departure_end_secs": 7 * 3600 + 1800,
+    "departure_interval_secs": 600,
+    "transfers_limit": 3,
+}
+
+@pytest.fixture
+def computed_origins(monkeypatch):
+    # chunks are computed in threads of this process, so that they can be counted, and fail at origin o5 while failing_origins holds it
+    computed_origins, failing_origins = [], {"o5"}
+    compute_accessibility_chunk = accessibility.compute_accessibility_chunk
+    def counted_compute_accessibility_chunk(origins, request_parameters):
+        if any(origin in failing_origins for origin, _ in origins):
+            raise RuntimeError("interrupted")
+        computed_origins.extend(origin for origin, _ in origins)
+        return compute_accessibility_chunk(origins, request_parameters)
+    monkeypatch.setattr(accessibility, "ProcessPoolExecutor", ThreadPoolExecutor)
+    monkeypatch.setattr(accessibility, "compute_accessibility_chunk", counted_compute_accessibility_chunk)
+    return computed_origins, failing_origins
+
+def test_resumed_job_continues_from_its_checkpoints(tmp_path, computed_origins):
+    computed_origins, failing_origins = computed_origins
+    trips, transfers = make_random_trips(0)
+    feed = make_feed(trips, transfers)
+    output_path = str(tmp_path / "accessibility")
+
+    # a single worker computes the chunks in order until the one of o4 and o5 fails
+    with pytest.raises(RuntimeError, match="interrupted"):
+        compute_accessibility(feed, REQUEST, output_path, max_workers=1, chunk_size=2)
+    checkpointed_chunks = sorted(int(path.name[5:10]) for path in (tmp_path / "accessibility").glob("part-*.parquet"))
+    assert 2 not in checkpointed_chunks and len(checkpointed_chunks) > 0
+    assert list((tmp_path / "accessibility").glob("*.tmp")) == []
+
+    computed_origins.clear()
+    failing_origins.clear()
+    resumed = compute_accessibility(feed, REQUEST, output_path, max_workers=1, chunk_size=2)
+    # only the chunks without checkpoints are computed again
+    assert sorted(computed_origins) == [f"o{i}" for i in range(10) if i // 2 not in checkpointed_chunks]
+
+    # nothing is left to compute, and the results are those of a job run at once
+    computed_origins.clear()
+    pd.testing.assert_frame_equal(compute_accessibility(feed, REQUEST, output_path, chunk_size=2), resumed)
+    assert computed_origins == []
+    pd.testing.assert_frame_equal(compute_accessibility(feed, REQUEST, str(tmp_path / "at_once"), chunk_size=3), resumed)
+    assert resumed["origin"].tolist() == [f"o{i}" for i in range(10) for _ in range(2)]
+    assert (resumed["max_opportunities"] > 0).any()
+
+def test_checkpoints_of_another_job_are_not_resumed(tmp_path, computed_origins):
+    trips, transfers = make_random_trips(0)
+    feed = make_feed(trips, transfers)
+    output_path = str(tmp_path / "accessibility")
+    request = REQUEST | {"origins": {"o0": ["s0"]}}
+    compute_accessibility(feed, request, output_path)
+    for changes, chunk_size in [({"thresholds": [900]}, 16), ({}, 2)]:
+        with pytest.raises(ValueError):
+            compute_accessibility(feed, request | changes, output_path, chunk_size=chunk_size)
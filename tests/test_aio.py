@@ -0,0 +1,86 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from sayori.aio import AsyncSearcher
+from tests.feeds import TEST_DATE, make_feed
+from tests.test_raptor import EIGHT, get_times_to_reach
+
+FEED = make_feed({"t": [("A", EIGHT, EIGHT), ("B", EIGHT + 300, EIGHT + 300), ("C", EIGHT + 600, EIGHT + 600)]})
+REQUEST = {"origin_stop_ids": ["A"], "specified_date": TEST_DATE, "specified_secs": EIGHT, "transfers_limit": 1}
+
+def make_searcher(executor: ThreadPoolExecutor, gate: threading.Event) -> AsyncSearcher:
+    # searches wait for the gate, so that callers pile up while they are in flight
+    searcher = AsyncSearcher(FEED, executor)
+    run_search = searcher.run_search
+    searcher.cancel_events = []
+    def gated_run_search(search_name, req, cancel_event):
+        searcher.cancel_events.append(cancel_event)
+        gate.wait()
+        return run_search(search_name, req, cancel_event)
+    searcher.run_search = gated_run_search
+    return searcher
+
+async def wait_in_flight(searcher: AsyncSearcher, count: int) -> None:
+    while searcher.get_in_flight_count() < count:
+        await asyncio.sleep(0)
+
+def test_identical_searches_are_coalesced():
+    async def main():
+        gate = threading.Event()
+        with ThreadPoolExecutor(4) as executor:
+            searcher = make_searcher(executor, gate)
+            tasks = [
+                asyncio.create_task(searcher.search_isochrones(REQUEST)),
+                # identical once the default is filled
+                asyncio.create_task(searcher.search_isochrones(REQUEST | {"is_reverse_search": False})),
+                asyncio.create_task(searcher.search_isochrones(REQUEST)),
+                asyncio.create_task(searcher.search_isochrones(REQUEST | {"specified_secs": EIGHT + 60})),
+            ]
+            await wait_in_flight(searcher, 2)
+            gate.set()
+            results = await asyncio.gather(*tasks)
+        assert len(searcher.cancel_events) == 2
+        assert searcher.get_in_flight_count() == 0
+        times_to_reach = [get_times_to_reach(res) for res in results]
+        assert times_to_reach[:3] == [{"A": 0, "B": 300, "C": 600}] * 3
+        assert times_to_reach[3] == {"A": 0}
+        # each caller gets its own copy
+        assert results[0] is not results[1]
+    asyncio.run(main())
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    async def main():
+        gate = threading.Event()
+        with ThreadPoolExecutor(4) as executor:
+            searcher = make_searcher(executor, gate)
+            tasks = [asyncio.create_task(searcher.search_isochrones(REQUEST)) for _ in range(3)]
+            await wait_in_flight(searcher, 1)
+            tasks[0].cancel()
+            await asyncio.gather(tasks[0], return_exceptions=True)
+            assert tasks[0].cancelled()
+            assert not searcher.cancel_events[0].is_set()
+            gate.set()
+            results = await asyncio.gather(*tasks[1:])
+        assert len(searcher.cancel_events) == 1
+        assert [get_times_to_reach(res) for res in results] == [{"A": 0, "B": 300, "C": 600}] * 2
+    asyncio.run(main())
+
+def test_search_is_cancelled_once_nobody_awaits_it():
+    async def main():
+        gate = threading.Event()
+        with ThreadPoolExecutor(4) as executor:
+            searcher = make_searcher(executor, gate)
+            tasks = [asyncio.create_task(searcher.search_isochrones(REQUEST)) for _ in range(2)]
+            await wait_in_flight(searcher, 1)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            assert searcher.cancel_events[0].is_set()
+            assert searcher.get_in_flight_count() == 0
+            # a later caller starts a new search
+            gate.set()
+            res = await searcher.search_isochrones(REQUEST)
+        assert len(searcher.cancel_events) == 2
+        assert get_times_to_reach(res) == {"A": 0, "B": 300, "C": 600}
+    asyncio.run(main())
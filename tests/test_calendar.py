@@ -0,0 +1,52 @@
+import datetime
+
+import polars as pl
+
+from sayori.presayori import get_calendar
+from sayori.raptor import search_isochrones
+from tests.feeds import make_feed
+from tests.test_raptor import EIGHT, get_times_to_reach
+
+DAYS_OF_WEEK = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+# 2023-11-23 is a holiday on thursday, when the holiday service runs instead of the weekday service
+CALENDAR = pl.DataFrame({
+    "service_id": ["weekday", "holiday"],
+    **{day: ["1" if i < 5 else "0", "0"] for i, day in enumerate(DAYS_OF_WEEK)},
+    "start_date": [datetime.date(2023, 11, 1), datetime.date(2023, 11, 1)],
+    "end_date": [datetime.date(2023, 11, 30), datetime.date(2023, 11, 30)],
+})
+CALENDAR_DATES = pl.DataFrame({
+    "service_id": ["weekday", "holiday"],
+    "calendar_date": [datetime.date(2023, 11, 23), datetime.date(2023, 11, 23)],
+    "exception_type": ["2", "1"],
+})
+TRIPS = {"w": [("A", EIGHT, EIGHT), ("B", EIGHT + 300, EIGHT + 300)], "h": [("A", EIGHT, EIGHT), ("C", EIGHT + 300, EIGHT + 300)]}
+
+def get_feed():
+    timetables = pl.DataFrame({"service_id": ["weekday", "holiday"]})
+    # dates are kept as datetime.date, as Feed.from_feed_path reads them from parquet
+    calendar = get_calendar(timetables, CALENDAR, CALENDAR_DATES).to_arrow().to_pandas()
+    return make_feed(TRIPS, services={"w": "weekday", "h": "holiday"}, calendar=calendar)
+
+def get_available_trips(feed, date: str) -> list:
+    return feed.get_available_trips(datetime.date.fromisoformat(date))
+
+def test_calendar_dates_exceptions():
+    feed = get_feed()
+    assert get_available_trips(feed, "2023-11-22") == ["w"]
+    # the exceptions replace the weekday service by the holiday service
+    assert get_available_trips(feed, "2023-11-23") == ["h"]
+    assert get_available_trips(feed, "2023-11-24") == ["w"]
+    assert get_available_trips(feed, "2023-11-25") == []
+
+def test_calendar_outside_its_days():
+    feed = get_feed()
+    assert get_available_trips(feed, "2023-10-31") == []
+    assert get_available_trips(feed, "2023-12-01") == []
+
+def test_search_on_a_holiday():
+    feed = get_feed()
+    req = {"origin_stop_ids": ["A"], "specified_secs": EIGHT, "transfers_limit": 0}
+    assert get_times_to_reach(search_isochrones(feed, req | {"specified_date": "2023-11-22"})) == {"A": 0, "B": 300}
+    assert get_times_to_reach(search_isochrones(feed, req | {"specified_date": "2023-11-23"})) == {"A": 0, "C": 300}
@@ -0,0 +1,64 @@
+from sayori.raptor import search_isochrones, search_p2p_path
+from tests.feeds import TEST_DATE, make_feed
+from tests.test_raptor import EIGHT, get_times_to_reach
+
+# t1 arrives at platform P-1 of station P, and t2 departs from platform P-2 after a walk of 2 minutes
+STATION_TRIPS = {
+    "t1": [("Q", EIGHT, EIGHT), ("P-1", EIGHT + 300, EIGHT + 300)],
+    "t2": [("P-2", EIGHT + 480, EIGHT + 480), ("R", EIGHT + 900, EIGHT + 900)],
+}
+STATION_TRANSFERS = [("P-1", "P-2", 120), ("P-2", "P-1", 120)]
+STATION_STOPS = {"P-1": ("P", 35.0, 139.0), "P-2": ("P", 35.0, 139.0001), "Q": (None, 35.0, 139.01), "R": (None, 35.0, 139.02)}
+
+def get_feeds():
+    feed = make_feed(STATION_TRIPS, STATION_TRANSFERS, stops=STATION_STOPS)
+    return feed, make_feed(STATION_TRIPS, STATION_TRANSFERS, stops=STATION_STOPS).contract_stations()
+
+def test_contracted_path_visits_both_platforms():
+    feed, contracted_feed = get_feeds()
+    req = {"origin_stop_ids": ["Q"], "destination_stop_ids": ["R"], "specified_date": TEST_DATE, "specified_secs": EIGHT, "transfers_limit": 1}
+    res = search_p2p_path(feed, req)
+    contracted_res = search_p2p_path(contracted_feed, req)
+    assert contracted_res["time_to_reach"] == res["time_to_reach"] == 900
+    assert contracted_res["routing_path"] == res["routing_path"] == ["Q", "P-1", "P-2", "R"]
+    # platforms on the path are the platforms of routing_path_optional
+    assert list(dict.fromkeys(row["stop_id"] for row in contracted_res["routing_path_optional"])) == contracted_res["routing_path"]
+
+def test_contracted_reverse_path_visits_both_platforms():
+    feed, contracted_feed = get_feeds()
+    req = {"origin_stop_ids": ["Q"], "destination_stop_ids": ["R"], "specified_date": TEST_DATE, "specified_secs": EIGHT + 900, "transfers_limit": 1, "is_reverse_search": True}
+    assert search_p2p_path(contracted_feed, req)["routing_path"] == search_p2p_path(feed, req)["routing_path"] == ["Q", "P-1", "P-2", "R"]
+
+def test_contracted_isochrones_list_platforms():
+    _, contracted_feed = get_feeds()
+    req = {"origin_stop_ids": ["Q"], "specified_date": TEST_DATE, "specified_secs": EIGHT, "transfers_limit": 1}
+    assert get_times_to_reach(search_isochrones(contracted_feed, req)) == {"Q": 0, "P-1": 300, "P-2": 300, "R": 900}
+
+def test_walk_from_origin_does_not_keep_trips_taken_before():
+    # P is reached at 8:10 by t1 and at 8:01 by walking, so t2 is boarded without changing platforms after a trip
+    feed = make_feed(
+        {
+            "t1": [("O", EIGHT, EIGHT), ("P-1", EIGHT + 600, EIGHT + 600)],
+            "t2": [("P-2", EIGHT + 120, EIGHT + 120), ("R", EIGHT + 1200, EIGHT + 1200)],
+        },
+        STATION_TRANSFERS + [("O", "P-1", 60), ("P-1", "O", 60)],
+        stops=STATION_STOPS | {"O": (None, 35.0, 138.99)},
+    ).contract_stations()
+    req = {"origin_stop_ids": ["O"], "destination_stop_ids": ["R"], "specified_date": TEST_DATE, "specified_secs": EIGHT, "transfers_limit": 1}
+    res = search_p2p_path(feed, req)
+    assert res["time_to_reach"] == 1200
+    assert res["routing_path"] == ["O", "P-2", "R"]
+
+def test_walk_between_stations_is_not_charged_the_change_time():
+    # t1 arrives at X-1, a walk of a minute away from Y-1 of station Y, where changing platforms takes 2 minutes
+    trips = {
+        "t1": [("Q", EIGHT, EIGHT), ("X-1", EIGHT + 300, EIGHT + 300)],
+        "t2": [("Y-1", EIGHT + 420, EIGHT + 420), ("R", EIGHT + 900, EIGHT + 900)],
+    }
+    transfers = [("X-1", "Y-1", 60), ("Y-1", "X-1", 60), ("Y-1", "Y-2", 120), ("Y-2", "Y-1", 120)]
+    stops = {"X-1": ("X", 35.0, 139.0), "Y-1": ("Y", 35.0, 139.001), "Y-2": ("Y", 35.0, 139.0011), "Q": (None, 35.0, 138.99), "R": (None, 35.0, 139.02)}
+    req = {"origin_stop_ids": ["Q"], "destination_stop_ids": ["R"], "specified_date": TEST_DATE, "specified_secs": EIGHT, "transfers_limit": 1}
+    res = search_p2p_path(make_feed(trips, transfers, stops=stops), req)
+    contracted_res = search_p2p_path(make_feed(trips, transfers, stops=stops).contract_stations(), req)
+    assert contracted_res["time_to_reach"] == res["time_to_reach"] == 900
+    assert contracted_res["routing_path"] == res["routing_path"] == ["Q", "X-1", "Y-1", "R"]
@@ -0,0 +1,61 @@
+from sayori.raptor import StopAccessStates, add_footpath_transfers, run_raptor, search_isochrones, search_p2p_path
+from tests.feeds import TEST_DATE, make_feed
+from tests.test_raptor import EIGHT, get_times_to_reach
+
+# O walks to N in a minute, and the trip passes N, M and O in this order
+ORIGIN_TRIPS = {"t": [("N", EIGHT + 300, EIGHT + 300), ("M", EIGHT + 420, EIGHT + 420), ("O", EIGHT + 600, EIGHT + 600), ("X", EIGHT + 900, EIGHT + 900)]}
+ORIGIN_TRANSFERS = [("O", "N", 60), ("N", "O", 60)]
+
+# a chain of walks of 100 secs each
+CHAIN_TRANSFERS = [("A", "B", 100), ("B", "A", 100), ("B", "C", 100), ("C", "B", 100), ("C", "D", 100), ("D", "C", 100)]
+
+def test_origins_are_not_scanned_again():
+    feed = make_feed(ORIGIN_TRIPS, ORIGIN_TRANSFERS)
+    stop_state = run_raptor(feed, ["O"], TEST_DATE, EIGHT, 0, False, None)
+    assert "O" not in stop_state.just_updated_stops
+    assert sorted(stop_state.just_updated_stops) == ["N", "X"]
+
+    res = search_isochrones(feed, {"origin_stop_ids": ["O"], "specified_date": TEST_DATE, "specified_secs": EIGHT, "transfers_limit": 1})
+    assert get_times_to_reach(res) == {"O": 0, "N": 60, "M": 420, "X": 900}
+
+def test_footpaths_are_closed_within_the_bound():
+    feed = make_feed({}, CHAIN_TRANSFERS).build_footpaths(250)
+    assert feed.max_footpath_secs == 250
+    assert feed.get_footpath_secs("A", "C") == 200
+    assert feed.get_footpath_secs("A", "D") is None
+    # stop indices follow the order of stop ids
+    assert feed.get_footpath_stop_ids(0, feed.get_footpath_position(0, 2)) == ["A", "B", "C"]
+
+def test_footpaths_keep_long_transfers():
+    feed = make_feed({}, [("A", "B", 900), ("B", "C", 60)])
+    assert feed.get_footpath_secs("A", "B") == 900
+    assert feed.get_footpath_secs("B", "C") == 60
+    # the long transfer is not chained further
+    assert feed.get_footpath_secs("A", "C") is None
+
+def test_default_footpath_bound():
+    feed = make_feed({}, [("A", "B", 400), ("B", "C", 300)])
+    assert feed.max_footpath_secs == 600
+    assert feed.get_footpath_secs("A", "C") is None
+    assert feed.build_footpaths(700).get_footpath_secs("A", "C") == 700
+
+def test_footpath_transfers_do_not_depend_on_the_order_of_stops():
+    feed = make_feed({}, CHAIN_TRANSFERS).build_footpaths(150)
+    results = []
+    for stop_ids in (["A", "B"], ["B", "A"]):
+        stop_state = StopAccessStates(["A"], TEST_DATE, EIGHT, feed.get_workspace_pool().create_workspace())
+        # B is reached at 8:05 by a trip, but A is a walk of 100 secs away
+        stop_state.create_time_to_reach("B", 300)
+        add_footpath_transfers(stop_state, feed, False, stop_ids)
+        results.append({stop_id: stop_state.get_time_to_reach(stop_id) for stop_id in stop_state.get_all_stops()})
+    # C is not reached by chaining the walks from A through B beyond 150 secs
+    assert results[0] == results[1] == {"A": 0, "B": 100, "C": 400}
+
+def test_walk_from_a_trip_arrival_at_a_stop_walked_to_earlier():
+    # M is walked to at 8:03:20 and reached by t at 8:05, but only the walk after t reaches D within the bound
+    feed = make_feed({"t": [("O", EIGHT, EIGHT), ("M", EIGHT + 300, EIGHT + 300)]}, [("O", "M", 200), ("M", "O", 200), ("M", "D", 200), ("D", "M", 200)]).build_footpaths(250)
+    res = search_isochrones(feed, {"origin_stop_ids": ["O"], "specified_date": TEST_DATE, "specified_secs": EIGHT, "transfers_limit": 0})
+    assert get_times_to_reach(res) == {"O": 0, "M": 200, "D": 500}
+    res = search_p2p_path(feed, {"origin_stop_ids": ["O"], "destination_stop_ids": ["D"], "specified_date": TEST_DATE, "specified_secs": EIGHT, "transfers_limit": 0})
+    assert res["routing_path"] == ["O", "M", "D"]
+    assert [row["trip_id"] for row in res["routing_path_optional"]] == ["t", "t", "walk", "walk"]
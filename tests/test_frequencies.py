@@ -0,0 +1,66 @@
+import pytest
+
+from sayori.raptor import search_isochrones, search_p2p_path
+from tests.feeds import TEST_DATE, get_earliest_arrivals, make_feed, make_random_trips
+from tests.test_raptor import EIGHT, get_times_to_reach
+
+# a template relative to its first departure, departing every 10 minutes from 7:00 until before 9:00
+FREQUENCY_TRIPS = {"f": [("A", 0, 0), ("B", 300, 300), ("C", 600, 600)]}
+FREQUENCIES = [("f", 7 * 3600, 9 * 3600, 600)]
+
+def search(feed, origin_stop_id: str, specified_secs: int, is_reverse_search: bool = False) -> dict:
+    req = {"origin_stop_ids": [origin_stop_id], "specified_date": TEST_DATE, "specified_secs": specified_secs, "transfers_limit": 1, "is_reverse_search": is_reverse_search}
+    return get_times_to_reach(search_isochrones(feed, req))
+
+def test_frequency_departures():
+    feed = make_feed(FREQUENCY_TRIPS, frequencies=FREQUENCIES)
+    # the instance departing A at 8:10 is boarded at 8:03
+    assert search(feed, "A", EIGHT + 180) == {"A": 0, "B": 720, "C": 1020}
+    # the instance departing A at 8:00 passes B at 8:05
+    assert search(feed, "B", EIGHT + 180) == {"B": 0, "C": 420}
+    # the last instance departs at 8:50
+    assert search(feed, "A", EIGHT + 3300) == {"A": 0}
+
+def test_frequency_departures_in_reverse_search():
+    feed = make_feed(FREQUENCY_TRIPS, frequencies=FREQUENCIES)
+    # arriving at C by 8:30, the instance departing A at 8:20 is the latest
+    assert search(feed, "C", EIGHT + 1800, is_reverse_search=True) == {"C": 0, "B": 300, "A": 600}
+
+def test_transfer_to_a_frequency_trip():
+    feed = make_feed(FREQUENCY_TRIPS | {"t": [("X", EIGHT, EIGHT), ("A", EIGHT + 360, EIGHT + 360)]}, frequencies=FREQUENCIES)
+    res = search_p2p_path(feed, {"origin_stop_ids": ["X"], "destination_stop_ids": ["C"], "specified_date": TEST_DATE, "specified_secs": EIGHT, "transfers_limit": 1})
+    assert res["time_to_reach"] == 1200
+    assert res["routing_path"] == ["X", "A", "B", "C"]
+
+@pytest.mark.parametrize("seed", range(10))
+def test_frequency_trips_equal_their_instances(seed):
+    trips, transfers = make_random_trips(seed)
+    # every trip runs as a template every 15 minutes instead
+    templates = {trip_id: [(stop_id, arrival - stop_times[0][2], departure - stop_times[0][2]) for stop_id, arrival, departure in stop_times] for trip_id, stop_times in trips.items()}
+    frequencies = [(trip_id, stop_times[0][2], stop_times[0][2] + 3600, 900) for trip_id, stop_times in trips.items()]
+    instances = {
+        f"{trip_id}@{secs}": [(stop_id, arrival + secs, departure + secs) for stop_id, arrival, departure in templates[trip_id]]
+        for trip_id, start_secs, end_secs, headway_secs in frequencies
+        for secs in range(start_secs, end_secs, headway_secs)
+    }
+    feed = make_feed(templates, transfers, frequencies).build_footpaths(10**6)
+
+    req = {"origin_stop_ids": ["s0"], "specified_date": TEST_DATE, "specified_secs": 7 * 3600, "transfers_limit": 30}
+    earliest_arrivals = get_earliest_arrivals(instances, transfers, "s0", 7 * 3600)
+    assert get_times_to_reach(search_isochrones(feed, req)) == {stop_id: secs - 7 * 3600 for stop_id, secs in earliest_arrivals.items()}
+
+def test_frequency_departures_of_several_windows():
+    # headway windows are listed out of order and interleaved with another trip
+    feed = make_feed(
+        FREQUENCY_TRIPS | {"g": [("A", 0, 0), ("D", 60, 60)]},
+        frequencies=[("f", 9 * 3600, 10 * 3600, 1200), ("g", 0, 24 * 3600, 60), ("f", 7 * 3600, 9 * 3600, 600), ("x", 7 * 3600, 9 * 3600, 60)],
+    )
+    f, g = feed.trips["trip_id"].tolist().index("f"), feed.trips["trip_id"].tolist().index("g")
+    assert feed.get_frequency_trip_mask().tolist() == [True, True]
+    # the instance departing A at 8:50 passes B at 8:55, and the next one departs at 9:00
+    assert feed.get_frequency_departure(f, 300, EIGHT + 3300, False) == EIGHT + 3000
+    assert feed.get_frequency_departure(f, 300, EIGHT + 3301, False) == 9 * 3600
+    assert feed.get_frequency_departure(f, 300, 10 * 3600 + 300, False) is None
+    assert feed.get_frequency_departure(f, 300, 9 * 3600 + 1500, True) == 9 * 3600 + 1200
+    assert feed.get_frequency_departure(f, 300, 7 * 3600 + 299, True) is None
+    assert feed.get_frequency_departure(g, 60, EIGHT + 30, False) == EIGHT
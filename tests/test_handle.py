@@ -0,0 +1,77 @@
+import threading
+
+import pytest
+
+from sayori.handle import FeedHandle
+from sayori.models import Feed
+from sayori.raptor import search_isochrones
+from tests.feeds import TEST_DATE, make_feed
+from tests.test_raptor import EIGHT, get_times_to_reach
+
+# the timetable of A to B is changed from 5 minutes to 10 minutes
+FEEDS = [
+    make_feed({"t": [("A", EIGHT, EIGHT), ("B", EIGHT + 300, EIGHT + 300)]}),
+    make_feed({"t": [("A", EIGHT, EIGHT), ("B", EIGHT + 600, EIGHT + 600)]}),
+]
+REQUEST = {"origin_stop_ids": ["A"], "specified_date": TEST_DATE, "specified_secs": EIGHT, "transfers_limit": 1}
+
+@pytest.fixture
+def handle(monkeypatch, tmp_path):
+    # each reload builds the next feed, and fails once they run out
+    feeds = iter(FEEDS)
+    def from_feed_path(cls, feed_path):
+        try:
+            return next(feeds)
+        except StopIteration:
+            raise FileNotFoundError(feed_path.stops)
+    monkeypatch.setattr(Feed, "from_feed_path", classmethod(from_feed_path))
+    return FeedHandle(str(tmp_path))
+
+def test_running_query_keeps_the_version_it_started_with(handle):
+    started, reloaded = threading.Event(), threading.Event()
+    results = []
+
+    def query() -> None:
+        with handle.feed() as feed:
+            started.set()
+            reloaded.wait()
+            results.append(get_times_to_reach(search_isochrones(feed, REQUEST))["B"])
+
+    thread = threading.Thread(target=query)
+    thread.start()
+    started.wait()
+    assert handle.reload()
+    reloaded.set()
+    thread.join()
+    assert results == [300]
+    assert handle.get_version() == 2
+
+def test_previous_version_is_freed_after_its_last_query(handle):
+    first_version = handle.acquire()
+    second_version = handle.acquire()
+    assert handle.reload()
+    assert handle.get_live_versions() == [1, 2]
+
+    handle.release(first_version)
+    assert handle.get_live_versions() == [1, 2]
+    assert second_version.feed is FEEDS[0]
+    handle.release(second_version)
+    assert handle.get_live_versions() == [2]
+    assert second_version.feed is None
+
+def test_new_queries_see_the_new_feed(handle):
+    with handle.feed() as feed:
+        assert get_times_to_reach(search_isochrones(feed, REQUEST))["B"] == 300
+    # nothing runs on the first version, so it is freed on the swap
+    handle.request_reload().join()
+    assert handle.get_live_versions() == [2]
+    with handle.feed() as feed:
+        assert get_times_to_reach(search_isochrones(feed, REQUEST))["B"] == 600
+
+def test_failed_reload_keeps_the_current_version(handle):
+    assert handle.reload()
+    assert not handle.reload()
+    assert isinstance(handle.last_error, FileNotFoundError)
+    assert handle.get_live_versions() == [2]
+    with handle.feed() as feed:
+        assert feed is FEEDS[1]
@@ -0,0 +1,51 @@
+import pytest
+
+from sayori.models import Feed
+from sayori.raptor import search_isochrones, search_p2p_path
+from tests.feeds import TEST_DATE, make_feed, make_random_trips
+from tests.test_raptor import get_times_to_reach
+
+def make_contracted_feed(seed: int) -> Feed:
+    # platforms s0-s3 share station st0 and so on, with a headway trip among the timetabled ones
+    trips, transfers = make_random_trips(seed)
+    stops = {f"s{i}": (f"st{i // 4}" if i < 16 else None, 35.0 + i * 0.001, 139.0) for i in range(25)}
+    feed = make_feed(trips, transfers, frequencies=[("t0", 7 * 3600, 8 * 3600, 600)], stops=stops)
+    feed = feed.contract_stations().build_footpaths(300)
+    feed.compile_trip_filter("odd", trip_ids=[f"t{i}" for i in range(1, 30, 2)])
+    return feed
+
+def get_queries() -> list:
+    queries = []
+    for origin in ["s0", "s5", "s17"]:
+        for is_reverse_search, specified_secs in [(False, 7 * 3600), (True, 9 * 3600)]:
+            for changes in [{}, {"trip_filters": ["odd"]}]:
+                queries.append({
+                    "origin_stop_ids": [origin],
+                    "specified_date": TEST_DATE,
+                    "specified_secs": specified_secs,
+                    "transfers_limit": 5,
+                    "is_reverse_search": is_reverse_search,
+                } | changes)
+    return queries
+
+@pytest.mark.parametrize("seed", range(3))
+def test_npz_roundtrip_of_a_contracted_feed_with_footpaths(seed, tmp_path):
+    feed = make_contracted_feed(seed)
+    feed.to_npz(str(tmp_path / "feed.npz"))
+    loaded_feed = Feed.from_npz(str(tmp_path / "feed.npz"))
+    assert loaded_feed.max_footpath_secs == feed.max_footpath_secs == 300
+
+    for req in get_queries():
+        res = search_isochrones(feed, req)
+        loaded_res = search_isochrones(loaded_feed, req)
+        assert len(get_times_to_reach(res)) > 1
+        assert get_times_to_reach(loaded_res) == get_times_to_reach(res)
+
+        for destination in ["s3", "s12", "s24"]:
+            p2p_req = req | {"destination_stop_ids": [destination]}
+            res, loaded_res = search_p2p_path(feed, p2p_req), search_p2p_path(loaded_feed, p2p_req)
+            assert (loaded_res is None) == (res is None)
+            if res is not None:
+                assert loaded_res["time_to_reach"] == res["time_to_reach"]
+                assert loaded_res["routing_path"] == res["routing_path"]
+                assert loaded_res["routing_path_optional"] == res["routing_path_optional"]
@@ -0,0 +1,94 @@
+import random
+
+import pytest
+
+from sayori.models import RequestParameter
+from sayori.patterns import TransferPatternIndex, build_transfer_pattern_index, get_transfer_pattern
+from sayori.raptor import run_raptor, search_p2p_path
+from tests.feeds import TEST_DATE, make_feed, make_random_trips
+from tests.test_raptor import EIGHT
+
+def test_transfer_pattern_of_a_routing_path():
+    feed = make_feed(
+        {"t1": [("A", EIGHT, EIGHT), ("B", EIGHT + 300, EIGHT + 300)], "t2": [("C", EIGHT + 600, EIGHT + 600), ("D", EIGHT + 900, EIGHT + 900)]},
+        [("B", "C", 120), ("C", "B", 120)],
+    )
+    stop_state = run_raptor(feed, ["A"], TEST_DATE, EIGHT, 1, False, None)
+    assert get_transfer_pattern(stop_state.get_routing_path_optional("D")) == (("trip", "A", "B"), ("walk", "B", "C"), ("trip", "C", "D"))
+
+@pytest.mark.parametrize("seed", range(3))
+def test_transfer_patterns_answer_as_raptor(seed, tmp_path):
+    trips, transfers = make_random_trips(seed)
+    feed = make_feed(trips, transfers)
+    hubs = {f"s{i}": [f"s{i}"] for i in range(6)}
+    index = build_transfer_pattern_index(feed, hubs, TEST_DATE, 7 * 3600, 8 * 3600)
+    index.save(str(tmp_path / "transfer_patterns.json"))
+    index = TransferPatternIndex.load(str(tmp_path / "transfer_patterns.json"))
+
+    rng = random.Random(seed)
+    for _ in range(20):
+        origin, destination = rng.sample(list(hubs), 2)
+        req = {
+            "origin_stop_ids": hubs[origin],
+            "destination_stop_ids": hubs[destination],
+            "specified_date": TEST_DATE,
+            "specified_secs": rng.randrange(7 * 3600, 8 * 3600),
+            "transfers_limit": 3,
+        }
+        res = search_p2p_path(feed, req)
+        pattern_res = search_p2p_path(feed, req, transfer_patterns=index)
+        assert (pattern_res or {}).get("time_to_reach") == (res or {}).get("time_to_reach")
+
+def get_random_queries(seed: int, hubs: dict, start_secs: int, end_secs: int, n_queries: int = 20) -> list:
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(n_queries):
+        origin, destination = rng.sample(list(hubs), 2)
+        queries.append({
+            "origin_stop_ids": hubs[origin],
+            "destination_stop_ids": hubs[destination],
+            "specified_date": TEST_DATE,
+            "specified_secs": rng.randrange(start_secs, end_secs),
+            "transfers_limit": 3,
+        })
+    return queries
+
+@pytest.mark.parametrize("seed", range(5))
+def test_transfer_patterns_answer_as_raptor_at_the_end_of_their_window(seed):
+    # journeys departing late in the window ride trips caught after the window ends
+    trips, transfers = make_random_trips(seed)
+    feed = make_feed(trips, transfers)
+    hubs = {f"s{i}": [f"s{i}"] for i in range(6)}
+    index = build_transfer_pattern_index(feed, hubs, TEST_DATE, 7 * 3600, 7 * 3600 + 1800)
+    for req in get_random_queries(seed, hubs, 7 * 3600 + 1200, 7 * 3600 + 1800):
+        assert index.is_answerable(RequestParameter.parse_obj(req))
+        res = search_p2p_path(feed, req)
+        pattern_res = search_p2p_path(feed, req, transfer_patterns=index)
+        assert (pattern_res or {}).get("time_to_reach") == (res or {}).get("time_to_reach")
+
+def test_transfer_patterns_fall_back_to_raptor_outside_their_timetable(tmp_path):
+    trips, transfers = make_random_trips(0)
+    feed = make_feed(trips, transfers)
+    feed.compile_trip_filter("even", trip_ids=[f"t{i}" for i in range(0, 30, 2)])
+    hubs = {f"s{i}": [f"s{i}"] for i in range(6)}
+    index = build_transfer_pattern_index(feed, hubs, TEST_DATE, 7 * 3600, 7 * 3600 + 1800)
+    index.save(str(tmp_path / "transfer_patterns.json"))
+    index = TransferPatternIndex.load(str(tmp_path / "transfer_patterns.json"))
+
+    req = {"origin_stop_ids": ["s0"], "destination_stop_ids": ["s1"], "specified_date": TEST_DATE, "specified_secs": 7 * 3600, "transfers_limit": 3}
+    assert index.is_answerable(RequestParameter.parse_obj(req))
+    for changes in [
+        {"specified_secs": 7 * 3600 + 1800},
+        {"specified_date": "2023-11-21"},
+        {"transfers_limit": 4},
+        {"trip_filters": ["even"]},
+        {"available_trip_ids": ["t0", "t1"]},
+    ]:
+        assert not index.is_answerable(RequestParameter.parse_obj(req | changes))
+
+    # later departures may ride trips not in any pattern
+    for req in get_random_queries(0, hubs, 7 * 3600 + 1800, 9 * 3600, 50):
+        for changes in [{}, {"trip_filters": ["even"]}]:
+            res = search_p2p_path(feed, req | changes)
+            pattern_res = search_p2p_path(feed, req | changes, transfer_patterns=index)
+            assert (pattern_res or {}).get("time_to_reach") == (res or {}).get("time_to_reach")
@@ -0,0 +1,113 @@
+import functools
+import math
+import os
+import zipfile
+
+import polars as pl
+import pytest
+
+from sayori import presayori
+from sayori.presayori import get_footpaths, gtfs_if_changed
+from sayori.spatial import haversine_distance
+
+def make_stops(coordinates: dict) -> pl.DataFrame:
+    return pl.DataFrame(
+        {
+            "stop_id": list(coordinates),
+            "parent_station": [None] * len(coordinates),
+            "stop_lat": [lat for lat, _ in coordinates.values()],
+            "stop_lon": [lon for _, lon in coordinates.values()],
+        },
+        schema={"stop_id": pl.Utf8, "parent_station": pl.Utf8, "stop_lat": pl.Float64, "stop_lon": pl.Float64},
+    )
+
+def get_pairs(footpaths: pl.DataFrame) -> dict:
+    return {(from_stop_id, to_stop_id): secs for from_stop_id, to_stop_id, secs in footpaths.select("from_stop_id", "to_stop_id", "min_transfer_time").iter_rows()}
+
+def test_footpaths_within_the_walking_distance():
+    # 0.001 degrees of latitude are about 111 meters
+    stops = make_stops({"A": (35.0, 139.0), "B": (35.002, 139.0), "C": (35.003, 139.0)})
+    pairs = get_pairs(get_footpaths(stops, max_walking_distance=300, walking_speed=1.0))
+    distance = haversine_distance(35.0, 139.0, 35.002, 139.0)
+    assert pairs == {("A", "B"): math.ceil(distance), ("B", "A"): math.ceil(distance), ("B", "C"): 112, ("C", "B"): 112}
+
+def test_footpaths_exclude_self_loops():
+    # stops at the same place are still a second's walk apart
+    stops = make_stops({"A": (35.0, 139.0), "B": (35.0, 139.0)})
+    assert get_pairs(get_footpaths(stops)) == {("A", "B"): 1, ("B", "A"): 1}
+
+def test_footpaths_per_stop_are_capped_by_distance():
+    stops = make_stops({"A": (35.0, 139.0), "B": (35.0005, 139.0), "C": (35.001, 139.0), "D": (35.0015, 139.0), "E": (35.002, 139.0)})
+    pairs = get_pairs(get_footpaths(stops, max_walking_distance=300, max_footpaths_per_stop=2))
+    assert [to_stop_id for from_stop_id, to_stop_id in pairs if from_stop_id == "A"] == ["B", "C"]
+    assert [to_stop_id for from_stop_id, to_stop_id in pairs if from_stop_id == "C"] == ["B", "D"]
+
+@pytest.mark.parametrize("max_walking_distance", [100, 300])
+def test_footpaths_far_from_the_mean_latitude(max_walking_distance):
+    # stops spanning 25 to 45 degrees, with pairs just within the walking distance east-west at 45 degrees
+    coordinates = {f"S{i}": (25.0 + i * 0.5, 139.0) for i in range(40)}
+    for i in range(50):
+        lat, lon = 45.0, 139.0 + i * 0.01
+        coordinates[f"W{i}"] = (lat, lon)
+        coordinates[f"E{i}"] = (lat, lon + math.degrees(0.98 * max_walking_distance / (6371008.8 * math.cos(math.radians(lat)))))
+    pairs = get_pairs(get_footpaths(make_stops(coordinates), max_walking_distance=max_walking_distance, max_footpaths_per_stop=100))
+
+    expected_pairs = {
+        (from_stop_id, to_stop_id)
+        for from_stop_id, (from_lat, from_lon) in coordinates.items()
+        for to_stop_id, (to_lat, to_lon) in coordinates.items()
+        if from_stop_id != to_stop_id and haversine_distance(from_lat, from_lon, to_lat, to_lon) <= max_walking_distance
+    }
+    assert len(expected_pairs) == 100
+    assert set(pairs) == expected_pairs
+
+def write_zipfile(path, files: dict) -> str:
+    with zipfile.ZipFile(path, "w") as z:
+        for filename, text in files.items():
+            z.writestr(filename, text)
+    return str(path)
+
+@pytest.fixture
+def conversions(monkeypatch):
+    # conversions are recorded instead of run, keeping the signature that keys the options
+    conversions = []
+    @functools.wraps(presayori.gtfs)
+    def gtfs(filepath, output_path, **options):
+        os.makedirs(f"{output_path}sayori_models/", exist_ok=True)
+        conversions.append(options)
+    monkeypatch.setattr(presayori, "gtfs", gtfs)
+    return conversions
+
+def test_unchanged_zipfiles_are_skipped(tmp_path, conversions):
+    files = {"stops.txt": "stop_id\nA\n", "trips.txt": "trip_id\nt\n"}
+    output_path = f"{tmp_path}/out/"
+    options = {"stop_id_seperator": "-", "max_walking_distance": 300}
+    cache_entry, is_converted = gtfs_if_changed(write_zipfile(tmp_path / "a.zip", files), output_path, options)
+    assert is_converted
+
+    # the same files zipped again, and the same options with a default spelled out
+    for changes in [{}, {"walking_speed": 4.8 / 3.6}]:
+        cache_entry, is_converted = gtfs_if_changed(write_zipfile(tmp_path / "a.zip", files), output_path, options | changes, cache_entry)
+        assert not is_converted
+    assert len(conversions) == 1
+
+def test_changed_zipfiles_or_options_are_converted(tmp_path, conversions):
+    files = {"stops.txt": "stop_id\nA\n", "trips.txt": "trip_id\nt\n"}
+    output_path = f"{tmp_path}/out/"
+    options = {"stop_id_seperator": "-", "max_walking_distance": 300}
+    first_entry, _ = gtfs_if_changed(write_zipfile(tmp_path / "a.zip", files), output_path, options)
+
+    for changed_files, changes in [
+        (files | {"stops.txt": "stop_id\nA\nB\n"}, {}),
+        (files, {"max_walking_distance": 500}),
+        (files, {"max_transfers_per_stop": 5}),
+        (files, {"walking_speed": 1.0}),
+    ]:
+        _, is_converted = gtfs_if_changed(write_zipfile(tmp_path / "a.zip", changed_files), output_path, options | changes, first_entry)
+        assert is_converted
+    assert len(conversions) == 5
+
+    # entries written before the options were digested are converted again
+    legacy_entry = {key: value for key, value in first_entry.items() if key != "options_sha256"}
+    _, is_converted = gtfs_if_changed(write_zipfile(tmp_path / "a.zip", files), output_path, options, legacy_entry)
+    assert is_converted
@@ -0,0 +1,126 @@
+import math
+
+import pytest
+
+from sayori.raptor import search_isochrones, search_p2p_path
+from sayori.spatial import haversine_distance
+from tests.feeds import TEST_DATE, get_earliest_arrivals, make_feed, make_random_trips
+
+EIGHT = 8 * 3600
+
+# the trip dwells at A from 7:58 to 8:02
+DWELLING_TRIPS = {"t": [("A", EIGHT - 120, EIGHT + 120), ("B", EIGHT + 300, EIGHT + 300), ("C", EIGHT + 600, EIGHT + 600)]}
+
+def get_times_to_reach(res) -> dict:
+    return {feature["properties"]["stop_id"]: feature["properties"]["time_to_reach"] for feature in res["features"]}
+
+def test_dwelling_trip_does_not_reach_stops_before_boarding():
+    feed = make_feed(DWELLING_TRIPS)
+    res = search_isochrones(feed, {"origin_stop_ids": ["A"], "specified_date": TEST_DATE, "specified_secs": EIGHT, "transfers_limit": 1})
+    assert get_times_to_reach(res) == {"A": 0, "B": 300, "C": 600}
+
+def test_dwelling_trip_at_a_transfer_stop():
+    # the rider reaches B at 8:05 by t1, and t2 dwells at B from 8:03 to 8:08
+    feed = make_feed({
+        "t1": [("A", EIGHT, EIGHT), ("B", EIGHT + 300, EIGHT + 300)],
+        "t2": [("B", EIGHT + 180, EIGHT + 480), ("C", EIGHT + 900, EIGHT + 900)],
+    })
+    res = search_isochrones(feed, {"origin_stop_ids": ["A"], "specified_date": TEST_DATE, "specified_secs": EIGHT, "transfers_limit": 1})
+    assert get_times_to_reach(res) == {"A": 0, "B": 300, "C": 900}
+
+def test_dwelling_trip_p2p_forward_and_reverse():
+    feed = make_feed(DWELLING_TRIPS)
+    req = {"origin_stop_ids": ["A"], "destination_stop_ids": ["C"], "specified_date": TEST_DATE, "transfers_limit": 1}
+    res = search_p2p_path(feed, req | {"specified_secs": EIGHT})
+    assert res["time_to_reach"] == 600
+    assert res["routing_path"] == ["A", "B", "C"]
+    # arriving at C by 8:11:40, the latest departure from A is 8:02
+    res = search_p2p_path(feed, req | {"specified_secs": EIGHT + 700, "is_reverse_search": True})
+    assert res["time_to_reach"] == 580
+    assert res["routing_path"] == ["A", "B", "C"]
+
+def test_coordinate_access_and_egress():
+    stops = {"A": (None, 35.0, 139.0), "B": (None, 35.0, 139.01), "C": (None, 35.0, 139.02)}
+    feed = make_feed(DWELLING_TRIPS, stops=stops)
+    origin = {"lat": 35.001, "lon": 139.0}
+    destination = {"lat": 35.0, "lon": 139.021}
+    access_secs = math.ceil(haversine_distance(35.001, 139.0, 35.0, 139.0) / 1.0)
+    egress_secs = math.ceil(haversine_distance(35.0, 139.02, 35.0, 139.021) / 1.0)
+    req = {"specified_date": TEST_DATE, "specified_secs": EIGHT, "transfers_limit": 1, "walking_speed": 1.0, "max_walking_distance": 200}
+
+    times_to_reach = get_times_to_reach(search_isochrones(feed, req | {"origin_coordinate": origin}))
+    assert times_to_reach == {"A": access_secs, "B": 300, "C": 600}
+
+    res = search_p2p_path(feed, req | {"origin_coordinate": origin, "destination_coordinate": destination})
+    assert res["time_to_reach"] == 600 + egress_secs
+    assert res["routing_path"] == ["A", "B", "C"]
+
+def test_coordinate_access_misses_the_trip():
+    # walking to A takes longer than the 2 minutes until the departure
+    feed = make_feed(DWELLING_TRIPS, stops={"A": (None, 35.0, 139.0), "B": (None, 35.0, 139.01), "C": (None, 35.0, 139.02)})
+    req = {"origin_coordinate": {"lat": 35.002, "lon": 139.0}, "specified_date": TEST_DATE, "specified_secs": EIGHT, "transfers_limit": 1, "walking_speed": 1.0}
+    assert set(get_times_to_reach(search_isochrones(feed, req))) == {"A"}
+
+@pytest.mark.parametrize("max_walking_secs", [150, 10**6])
+@pytest.mark.parametrize("seed", range(20))
+def test_isochrones_equal_brute_force(seed, max_walking_secs):
+    trips, transfers = make_random_trips(seed)
+    feed = make_feed(trips, transfers).build_footpaths(max_walking_secs)
+    req = {"origin_stop_ids": ["s0"], "specified_date": TEST_DATE, "transfers_limit": 30}
+
+    earliest_arrivals = get_earliest_arrivals(trips, transfers, "s0", 7 * 3600, max_walking_secs)
+    res = search_isochrones(feed, req | {"specified_secs": 7 * 3600})
+    assert get_times_to_reach(res) == {stop_id: secs - 7 * 3600 for stop_id, secs in earliest_arrivals.items()}
+
+    # the latest departures are the earliest arrivals on trips run backwards in time
+    mirrored_trips = {trip_id: [(stop_id, -departure, -arrival) for stop_id, arrival, departure in stop_times[::-1]] for trip_id, stop_times in trips.items()}
+    mirrored_transfers = [(to_stop_id, from_stop_id, secs) for from_stop_id, to_stop_id, secs in transfers]
+    latest_departures = get_earliest_arrivals(mirrored_trips, mirrored_transfers, "s0", -9 * 3600, max_walking_secs)
+    res = search_isochrones(feed, req | {"specified_secs": 9 * 3600, "is_reverse_search": True})
+    assert get_times_to_reach(res) == {stop_id: secs + 9 * 3600 for stop_id, secs in latest_departures.items()}
+
+def test_pooled_workspaces_are_reused_between_searches():
+    trips, transfers = make_random_trips(0)
+    feed = make_feed(trips, transfers)
+    pool = feed.get_workspace_pool()
+    req = {"specified_date": TEST_DATE, "specified_secs": 7 * 3600, "transfers_limit": 3}
+    results, buffers = [], set()
+    for origin in ["s0", "s1", "s0"]:
+        results.append(get_times_to_reach(search_isochrones(feed, req | {"origin_stop_ids": [origin]})))
+        # the workspace of the search is returned to the pool with its buffers cleared in place
+        with pool.workspace() as workspace:
+            assert workspace.reached_stops == [] and workspace.trip_arrivals == {}
+            buffers.add((id(workspace), id(workspace.reached_stops), id(workspace.trip_arrivals)))
+    assert len(buffers) == 1
+    assert results[0] == results[2] != results[1]
+
+def test_trip_filters_exclude_trips():
+    # the express reaches C first, and the local stops at B on its way
+    trips = {
+        "express": [("A", EIGHT, EIGHT), ("C", EIGHT + 300, EIGHT + 300)],
+        "local": [("A", EIGHT + 60, EIGHT + 60), ("B", EIGHT + 300, EIGHT + 300), ("C", EIGHT + 600, EIGHT + 600)],
+    }
+    feed = make_feed(trips)
+    feed.compile_trip_filter("local", route_id=["local"])
+    feed.compile_trip_filter("express", trip_ids=["express"])
+    req = {"origin_stop_ids": ["A"], "specified_date": TEST_DATE, "specified_secs": EIGHT, "transfers_limit": 1}
+    assert get_times_to_reach(search_isochrones(feed, req)) == {"A": 0, "B": 300, "C": 300}
+    assert get_times_to_reach(search_isochrones(feed, req | {"trip_filters": ["local"]})) == {"A": 0, "B": 300, "C": 600}
+    # filters are intersected
+    assert get_times_to_reach(search_isochrones(feed, req | {"trip_filters": ["local", "express"]})) == {"A": 0}
+    res = search_p2p_path(feed, req | {"destination_stop_ids": ["C"], "trip_filters": ["local"]})
+    assert {row["trip_id"] for row in res["routing_path_optional"]} == {"local"}
+    with pytest.raises(KeyError):
+        search_isochrones(feed, req | {"trip_filters": ["unknown"]})
+
+@pytest.mark.parametrize("seed", range(5))
+def test_trip_filters_equal_brute_force_on_the_filtered_trips(seed):
+    trips, transfers = make_random_trips(seed)
+    feed = make_feed(trips, transfers).build_footpaths(10**6)
+    filtered_trip_ids = [trip_id for i, trip_id in enumerate(trips) if i % 3 != 0]
+    feed.compile_trip_filter("filtered", trip_ids=filtered_trip_ids)
+    req = {"origin_stop_ids": ["s0"], "specified_date": TEST_DATE, "specified_secs": 7 * 3600, "transfers_limit": 30, "trip_filters": ["filtered"]}
+
+    filtered_trips = {trip_id: trips[trip_id] for trip_id in filtered_trip_ids}
+    earliest_arrivals = get_earliest_arrivals(filtered_trips, transfers, "s0", 7 * 3600, 10**6)
+    assert get_times_to_reach(search_isochrones(feed, req)) == {stop_id: secs - 7 * 3600 for stop_id, secs in earliest_arrivals.items()}
@@ -0,0 +1,117 @@
+import datetime
+import threading
+
+from sayori.models import Feed
+from sayori.raptor import search_isochrones
+from sayori.registry import FeedRegistry
+from tests.feeds import TEST_DATE, make_feed
+from tests.test_raptor import EIGHT, get_times_to_reach
+
+FEEDS = {
+    "./bus/": make_feed({"b1": [("A", EIGHT, EIGHT), ("B", EIGHT + 300, EIGHT + 300)], "b2": [("A", EIGHT, EIGHT), ("C", EIGHT + 300, EIGHT + 300)]}),
+    "./rail/": make_feed({"r1": [("A", EIGHT, EIGHT), ("D", EIGHT + 300, EIGHT + 300)], "r2": [("A", EIGHT, EIGHT), ("E", EIGHT + 300, EIGHT + 300)]}),
+}
+
+def get_feed(feed_path) -> Feed:
+    return FEEDS[feed_path.stops.removesuffix("sayori_stops.parquet")]
+
+def get_registry(monkeypatch) -> FeedRegistry:
+    # feeds are made in memory instead of being read from presayori outputs
+    monkeypatch.setattr(Feed, "from_feed_path", classmethod(lambda cls, feed_path: get_feed(feed_path)))
+    registry = FeedRegistry()
+    # both operators compile a filter of the same name
+    registry.register("bus", "./bus/", compiler=lambda feed: feed.compile_trip_filter("accessible", trip_ids=["bus:b1"]))
+    registry.register("rail", "./rail/", compiler=lambda feed: feed.compile_trip_filter("accessible", trip_ids=["rail:r2"]))
+    return registry
+
+def test_merge_keeps_trip_filters_of_each_feed(monkeypatch):
+    feed = get_registry(monkeypatch).merge(["bus", "rail"])
+    trip_mask = feed.get_available_trip_mask(datetime.date.fromisoformat(TEST_DATE), None, ["accessible"])
+    assert feed.trips["trip_id"][trip_mask].tolist() == ["bus:b1", "rail:r2"]
+
+    req = {"origin_stop_ids": ["bus:A", "rail:A"], "specified_date": TEST_DATE, "specified_secs": EIGHT, "transfers_limit": 0, "trip_filters": ["accessible"]}
+    assert get_times_to_reach(search_isochrones(feed, req)) == {"bus:A": 0, "rail:A": 0, "bus:B": 300, "rail:E": 300}
+
+def test_merge_drops_trips_of_feeds_without_the_filter(monkeypatch):
+    registry = get_registry(monkeypatch)
+    registry.register("rail", "./rail/")
+    feed = registry.merge(["bus", "rail"])
+    trip_mask = feed.get_available_trip_mask(datetime.date.fromisoformat(TEST_DATE), None, ["accessible"])
+    assert feed.trips["trip_id"][trip_mask].tolist() == ["bus:b1"]
+
+def test_least_recently_used_feeds_are_evicted(monkeypatch):
+    registry = get_registry(monkeypatch)
+    for name in ["b1", "b2", "b3"]:
+        registry.register(name, "./bus/")
+    registry.get("b1")
+    # feeds of the same tables take the same memory
+    registry.memory_budget = registry.get_memory_usage() * 5 // 2
+    registry.get("b2")
+    registry.get("b1")
+    registry.get("b3")
+    assert registry.get_loaded_names() == ["b1", "b3"]
+    registry.get("b2")
+    assert registry.get_loaded_names() == ["b3", "b2"]
+
+def test_memory_usage_counts_compiled_structures(monkeypatch):
+    registry = get_registry(monkeypatch)
+    feed = registry.get("bus")
+    assert registry.get_memory_usage() == feed.get_memory_usage()
+    footpaths, feed.footpaths = feed.footpaths, None
+    assert registry.get_memory_usage() - feed.get_memory_usage() == sum(array.nbytes for array in footpaths)
+
+def test_loading_a_feed_does_not_block_loaded_feeds(monkeypatch):
+    registry = get_registry(monkeypatch)
+    bus_feed = registry.get("bus")
+    is_loading, can_load = threading.Event(), threading.Event()
+    def load_slowly(cls, feed_path):
+        is_loading.set()
+        assert can_load.wait(10)
+        return get_feed(feed_path)
+    monkeypatch.setattr(Feed, "from_feed_path", classmethod(load_slowly))
+
+    thread = threading.Thread(target=registry.get, args=("rail",))
+    thread.start()
+    assert is_loading.wait(10)
+    assert registry.get("bus") is bus_feed
+    assert registry.get_loaded_names() == ["bus"]
+    can_load.set()
+    thread.join()
+    assert registry.get_loaded_names() == ["bus", "rail"]
+
+def test_concurrent_queries_load_a_feed_once(monkeypatch):
+    registry = get_registry(monkeypatch)
+    feed_paths, can_load = [], threading.Event()
+    def load_slowly(cls, feed_path):
+        feed_paths.append(feed_path)
+        assert can_load.wait(10)
+        return get_feed(feed_path)
+    monkeypatch.setattr(Feed, "from_feed_path", classmethod(load_slowly))
+
+    feeds = []
+    threads = [threading.Thread(target=lambda: feeds.append(registry.get("rail"))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    can_load.set()
+    for thread in threads:
+        thread.join()
+    assert len(feed_paths) == 1
+    assert len(feeds) == 4 and all(feed is feeds[0] for feed in feeds)
+
+def test_feed_registered_again_while_loading_is_not_stored(monkeypatch):
+    registry = get_registry(monkeypatch)
+    is_loading, can_load = threading.Event(), threading.Event()
+    def load_slowly(cls, feed_path):
+        is_loading.set()
+        assert can_load.wait(10)
+        return get_feed(feed_path)
+    monkeypatch.setattr(Feed, "from_feed_path", classmethod(load_slowly))
+
+    thread = threading.Thread(target=registry.get, args=("rail",))
+    thread.start()
+    assert is_loading.wait(10)
+    registry.register("rail", "./bus/")
+    can_load.set()
+    thread.join()
+    assert registry.get_loaded_names() == []
+    assert registry.get("rail").trips["trip_id"].tolist() == ["rail:b1", "rail:b2"]
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from sayori.surface import get_band_features, get_travel_time_grid, search_travel_time_surface
+from tests.feeds import TEST_DATE, make_feed
+from tests.test_raptor import DWELLING_TRIPS, EIGHT
+
+STOPS = {"A": (None, 35.0, 139.0), "B": (None, 35.0, 139.01), "C": (None, 35.0, 139.02)}
+
+def test_grid_is_the_same_whatever_the_chunks():
+    rng = np.random.default_rng(0)
+    stop_lat, stop_lon = 35.0 + rng.random(50) * 0.05, 139.0 + rng.random(50) * 0.05
+    times_to_reach = rng.integers(0, 3600, 50).astype("float64")
+    travel_time, lats, lons = get_travel_time_grid(stop_lat, stop_lon, times_to_reach, 50, 500, 1.0)
+    chunked_travel_time, chunked_lats, chunked_lons = get_travel_time_grid(stop_lat, stop_lon, times_to_reach, 50, 500, 1.0, max_chunk_cells=1000)
+    np.testing.assert_array_equal(chunked_travel_time, travel_time)
+    np.testing.assert_array_equal(chunked_lats, lats)
+    np.testing.assert_array_equal(chunked_lons, lons)
+
+def test_grid_is_reached_within_the_walking_distance():
+    travel_time, lats, lons = get_travel_time_grid(np.array([35.0]), np.array([139.0]), np.array([60.0]), 100, 300, 1.0)
+    # rows run from north to south
+    assert lats[0] > lats[-1] and lons[0] < lons[-1]
+    assert np.nanmin(travel_time) >= 60
+    assert np.nanmax(travel_time) <= 60 + 300
+    # corners are farther than the walking distance
+    assert np.isnan(travel_time[[0, 0, -1, -1], [0, -1, 0, -1]]).all()
+
+def test_band_features():
+    shapely = pytest.importorskip("shapely")
+    lats, lons = np.array([35.002, 35.001, 35.0]), np.array([139.0, 139.001, 139.002])
+    travel_time = np.array([
+        [5.0, 5.0, np.nan],
+        [5.0, 15.0, 15.0],
+        [np.nan, np.nan, 35.0],
+    ])
+    features = get_band_features(travel_time, lats, lons, [30, 10, 20])
+    # the band from 20 to 30 seconds has no cell
+    assert [(feature["properties"]["min_time_to_reach"], feature["properties"]["max_time_to_reach"]) for feature in features] == [(None, 10), (10, 20)]
+    # the cells of a band are merged into one polygon
+    assert features[0]["geometry"]["type"] == "Polygon"
+    assert shapely.geometry.shape(features[0]["geometry"]).area == pytest.approx(3 * 0.001 ** 2)
+    assert shapely.geometry.shape(features[1]["geometry"]).bounds == pytest.approx((139.0005, 35.0005, 139.0025, 35.0015))
+
+def test_band_features_of_unreached_cells():
+    pytest.importorskip("shapely")
+    assert get_band_features(np.full((2, 2), np.nan), np.array([35.001, 35.0]), np.array([139.0, 139.001]), [900]) == []
+
+def test_surface_without_located_stops():
+    # stops without coordinates are not placed on the grid
+    feed = make_feed(DWELLING_TRIPS)
+    res = search_travel_time_surface(feed, {"origin_stop_ids": ["A"], "specified_date": TEST_DATE, "specified_secs": EIGHT, "transfers_limit": 1, "band_secs": [900]})
+    assert res["travel_time"].shape == (0, 0)
+    assert res["bands"] == {"type": "FeatureCollection", "features": []}
+
+def test_surface_of_a_search():
+    pytest.importorskip("shapely")
+    feed = make_feed(DWELLING_TRIPS, stops=STOPS)
+    req = {"origin_stop_ids": ["A"], "specified_date": TEST_DATE, "specified_secs": EIGHT, "transfers_limit": 1, "walking_speed": 1.0, "max_walking_distance": 200, "grid_resolution": 50}
+    res = search_travel_time_surface(feed, req | {"band_secs": [60, 400, 700]})
+    travel_time, lats, lons = res["travel_time"], res["lats"], res["lons"]
+    def get_cell_secs(lat: float, lon: float) -> float:
+        return travel_time[np.argmin(np.abs(lats - lat)), np.argmin(np.abs(lons - lon))]
+    assert get_cell_secs(35.0, 139.0) <= 60
+    assert 300 <= get_cell_secs(35.0, 139.01) <= 400
+    assert 600 <= get_cell_secs(35.0, 139.02) <= 700
+    # cells between stops farther than the walking distance are not reached
+    assert np.isnan(get_cell_secs(35.0, 139.005))
+    assert [feature["properties"]["max_time_to_reach"] for feature in res["bands"]["features"]] == [60, 400, 700]
+
+    res = search_travel_time_surface(feed, req | {"max_travel_secs": 400})
+    assert np.nanmax(res["travel_time"]) <= 400
+    assert res["bands"] is None